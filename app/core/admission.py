@@ -0,0 +1,233 @@
+import math
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Deque, Dict, Iterator, List, Optional
+
+DEFAULT_CLASS_WEIGHTS = {"escalated": 8.0, "standard": 4.0, "low": 1.0}
+
+
+class AdmissionRejected(Exception):
+    """Raised when a request cannot be admitted; maps to HTTP 429"""
+
+    def __init__(self, reason: str, retry_after: int):
+        super().__init__(f"Request rejected: {reason}")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class _Ticket:
+    __slots__ = ("priority_class", "enqueued_at", "start_tag", "finish_tag")
+
+    def __init__(self, priority_class: str, enqueued_at: float, start_tag: float, finish_tag: float):
+        self.priority_class = priority_class
+        self.enqueued_at = enqueued_at
+        self.start_tag = start_tag
+        self.finish_tag = finish_tag
+
+
+class WeightedFairQueue:
+    """
+    Waiting line that shares slots between priority classes by weight.
+
+    Each request gets a virtual finish tag of max(virtual time, previous
+    finish tag of its class) + 1/weight, and the head with the smallest tag
+    goes next, so a backlogged class gets slots in proportion to its weight
+    whatever the others are doing. A request that has waited longer than
+    aging_after jumps ahead of the tags, which bounds the wait of even the
+    lightest class.
+    """
+
+    def __init__(self, weights: Optional[Dict[str, float]] = None, aging_after: float = 2.0):
+        self.weights = {**DEFAULT_CLASS_WEIGHTS, **(weights or {})}
+        self.aging_after = aging_after
+        self.virtual_time = 0.0
+        self._last_finish: Dict[str, float] = {}
+        self._queues: Dict[str, Deque[_Ticket]] = {}
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def push(self, priority_class: str, now: float) -> _Ticket:
+        if priority_class not in self.weights:
+            raise ValueError(f"Unknown priority class: {priority_class}")
+        start_tag = max(self.virtual_time, self._last_finish.get(priority_class, 0.0))
+        ticket = _Ticket(priority_class, now, start_tag, start_tag + 1.0 / self.weights[priority_class])
+        self._last_finish[priority_class] = ticket.finish_tag
+        self._queues.setdefault(priority_class, deque()).append(ticket)
+        self._size += 1
+        return ticket
+
+    def peek(self, now: float) -> Optional[_Ticket]:
+        heads: List[_Ticket] = [q[0] for q in self._queues.values() if q]
+        if not heads:
+            return None
+        aged = [t for t in heads if now - t.enqueued_at >= self.aging_after]
+        if aged:
+            return min(aged, key=lambda t: t.enqueued_at)
+        return min(heads, key=lambda t: t.finish_tag)
+
+    def pop(self, ticket: _Ticket) -> None:
+        """Remove a ticket that is being admitted"""
+        self.remove(ticket)
+        self.virtual_time = max(self.virtual_time, ticket.start_tag)
+
+    def remove(self, ticket: _Ticket) -> None:
+        queue = self._queues[ticket.priority_class]
+        if queue[0] is ticket:
+            queue.popleft()
+        else:
+            queue.remove(ticket)
+        self._size -= 1
+        if not self._size:
+            # Idle: restart virtual time so old tags do not carry over
+            self.virtual_time = 0.0
+            self._last_finish.clear()
+
+
+class _ClassStats:
+    def __init__(self):
+        self.admitted = 0
+        self.rejected = 0
+        self.latencies: Deque[float] = deque(maxlen=1000)
+
+    def to_dict(self) -> Dict[str, Any]:
+        latencies = sorted(self.latencies)
+
+        def percentile(q: float) -> float:
+            return round(latencies[int(q * (len(latencies) - 1))] * 1000, 3) if latencies else 0.0
+
+        return {
+            "admitted": self.admitted,
+            "rejected": self.rejected,
+            "latency_ms": {"p50": percentile(0.5), "p95": percentile(0.95), "p99": percentile(0.99)}
+        }
+
+
+class AdmissionController:
+    """
+    Bounded concurrency in front of a slow dependency.
+
+    At most max_concurrency callers hold a slot. Up to max_queue_depth more
+    wait in line, each for at most max_wait seconds; anyone beyond that is
+    rejected immediately. Overload therefore turns into fast 429s instead of
+    a pile of threads waiting on the dependency, and the callers that are
+    admitted see bounded queueing delay.
+
+    Waiting callers are ordered by a WeightedFairQueue over priority
+    classes, and latency (queueing plus service) is tracked per class.
+    """
+
+    def __init__(self, max_concurrency: int = 8, max_queue_depth: int = 32,
+                 max_wait: float = 5.0, clock=time.monotonic,
+                 class_weights: Optional[Dict[str, float]] = None, aging_after: float = 2.0):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.max_wait = max_wait
+        self.clock = clock
+        self.active = 0
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {"queue_full": 0, "timeout": 0}
+        self._waiters = WeightedFairQueue(class_weights, aging_after)
+        self._class_stats = {name: _ClassStats() for name in self._waiters.weights}
+        self._cond = threading.Condition()
+        self._wait_samples: Deque[float] = deque(maxlen=1000)
+        self._service_time = 1.0
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _retry_after(self) -> int:
+        # Rough time for the current backlog to drain through the pool
+        backlog = len(self._waiters) + self.active
+        return max(1, math.ceil(self._service_time * backlog / self.max_concurrency))
+
+    def _reject(self, reason: str, priority_class: str) -> AdmissionRejected:
+        self.rejected[reason] += 1
+        self._class_stats[priority_class].rejected += 1
+        return AdmissionRejected(reason, self._retry_after())
+
+    def acquire(self, priority_class: str = "standard") -> float:
+        """
+        Wait for a slot.
+
+        Args:
+            priority_class: Scheduling class of the caller
+
+        Returns:
+            float: Seconds spent queueing
+
+        Raises:
+            AdmissionRejected: The queue is full or the wait timed out
+        """
+        started = self.clock()
+        with self._cond:
+            if priority_class not in self._class_stats:
+                raise ValueError(f"Unknown priority class: {priority_class}")
+            if self.active < self.max_concurrency and not self._waiters:
+                return self._admit(started, priority_class)
+            if len(self._waiters) >= self.max_queue_depth:
+                raise self._reject("queue_full", priority_class)
+
+            ticket = self._waiters.push(priority_class, started)
+            deadline = started + self.max_wait
+            while not (self.active < self.max_concurrency
+                       and self._waiters.peek(self.clock()) is ticket):
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    self._waiters.remove(ticket)
+                    self._cond.notify_all()
+                    raise self._reject("timeout", priority_class)
+                self._cond.wait(remaining)
+            self._waiters.pop(ticket)
+            self._cond.notify_all()
+            return self._admit(started, priority_class)
+
+    def _admit(self, started: float, priority_class: str) -> float:
+        self.active += 1
+        self.admitted += 1
+        self._class_stats[priority_class].admitted += 1
+        waited = self.clock() - started
+        self._wait_samples.append(waited)
+        return waited
+
+    def release(self, service_time: Optional[float] = None) -> None:
+        with self._cond:
+            self.active -= 1
+            if service_time is not None:
+                self._service_time = 0.8 * self._service_time + 0.2 * service_time
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self, priority_class: str = "standard") -> Iterator[float]:
+        """Hold a slot for the duration of the block"""
+        waited = self.acquire(priority_class)
+        started = self.clock()
+        try:
+            yield waited
+        finally:
+            service_time = self.clock() - started
+            self.release(service_time)
+            with self._cond:
+                self._class_stats[priority_class].latencies.append(waited + service_time)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._cond:
+            waits = sorted(self._wait_samples)
+            return {
+                "active": self.active,
+                "max_concurrency": self.max_concurrency,
+                "queue_depth": len(self._waiters),
+                "max_queue_depth": self.max_queue_depth,
+                "admitted": self.admitted,
+                "rejected": dict(self.rejected),
+                "wait_ms": {
+                    "avg": round(sum(waits) / len(waits) * 1000, 3) if waits else 0.0,
+                    "p95": round(waits[int(0.95 * (len(waits) - 1))] * 1000, 3) if waits else 0.0,
+                    "max": round(waits[-1] * 1000, 3) if waits else 0.0
+                },
+                "classes": {name: stats.to_dict() for name, stats in self._class_stats.items()}
+            }
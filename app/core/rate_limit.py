@@ -0,0 +1,41 @@
+import math
+import time
+from typing import Tuple
+from app.core.state import StateBackend
+
+
+class RateLimiter:
+    """
+    Fixed-window request limiter.
+
+    Counters live in the state backend, so the limit holds across every
+    worker sharing that backend rather than per process.
+    """
+
+    def __init__(self, backend: StateBackend, limit: int, window: float = 60,
+                 prefix: str = "ratelimit", clock=time.time):
+        self.backend = backend
+        self.limit = limit
+        self.window = window
+        self.prefix = prefix
+        self.clock = clock
+
+    def hit(self, key: str) -> Tuple[bool, int]:
+        """
+        Count one request against a key.
+
+        Args:
+            key: What is being limited, e.g. a simulation ID
+
+        Returns:
+            Tuple[bool, int]: Whether the request is allowed and, if not, the
+            number of seconds until the window resets
+        """
+        now = self.clock()
+        window_index = int(now // self.window)
+        counter_key = f"{self.prefix}:{key}:{window_index}"
+        count = self.backend.incr(counter_key, ttl=self.window)
+        if count <= self.limit:
+            return True, 0
+        retry_after = (window_index + 1) * self.window - now
+        return False, max(1, math.ceil(retry_after))
@@ -0,0 +1,420 @@
+import os
+import socket
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+from dotenv import load_dotenv
+from app.core.logger import logger
+
+# Load environment variables
+load_dotenv()
+
+
+class StateBackend:
+    """
+    Key/value and hash storage shared by everything that keeps call state.
+
+    Values are strings. Keys with a ttl disappear once it has elapsed.
+    """
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        """Store a value; with nx=True only when the key does not exist yet"""
+        raise NotImplementedError
+
+    def delete(self, key: str) -> int:
+        raise NotImplementedError
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        """Increment a counter; ttl is applied when the counter is created"""
+        raise NotImplementedError
+
+    def ttl(self, key: str) -> Optional[float]:
+        """Seconds until the key expires, None if it has no expiry or is missing"""
+        raise NotImplementedError
+
+    def hset(self, name: str, key: str, value: str) -> None:
+        raise NotImplementedError
+
+    def hget(self, name: str, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def hdel(self, name: str, key: str) -> int:
+        raise NotImplementedError
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        raise NotImplementedError
+
+    def publish(self, channel: str, message: str) -> int:
+        """Send a message to a channel's current subscribers; returns how many there were"""
+        raise NotImplementedError
+
+    def subscribe(self, channel: str, callback: Callable[[str], None],
+                  on_connect: Optional[Callable[[], None]] = None) -> "Subscription":
+        """
+        Call callback(message) for every message published on channel.
+
+        Delivery is at most once: messages published while a subscription
+        is disconnected are lost, so on_connect is called every time it is
+        (re)established, for the subscriber to catch up from stored state.
+        """
+        raise NotImplementedError
+
+    def close(self) -> None:
+        pass
+
+
+class Subscription:
+    def __init__(self, close: Callable[[], None]):
+        self._close = close
+
+    def close(self) -> None:
+        self._close()
+
+
+class InProcessStateBackend(StateBackend):
+    """State kept in this process only; the default for single-worker setups"""
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        self._data: Dict[str, object] = {}
+        self._expiry: Dict[str, float] = {}
+        self._lock = threading.RLock()
+        self._subscribers: Dict[str, List[Callable[[str], None]]] = {}
+
+    def _live(self, key: str) -> bool:
+        expires_at = self._expiry.get(key)
+        if expires_at is not None and expires_at <= self.clock():
+            self._data.pop(key, None)
+            del self._expiry[key]
+        return key in self._data
+
+    def _string(self, key: str) -> Optional[str]:
+        if not self._live(key):
+            return None
+        value = self._data[key]
+        if not isinstance(value, str):
+            raise TypeError(f"Key {key} does not hold a string value")
+        return value
+
+    def _hash(self, name: str, create: bool = False) -> Optional[Dict[str, str]]:
+        if not self._live(name):
+            if not create:
+                return None
+            self._data[name] = {}
+        value = self._data[name]
+        if not isinstance(value, dict):
+            raise TypeError(f"Key {name} does not hold a hash value")
+        return value
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            return self._string(key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        with self._lock:
+            if nx and self._live(key):
+                return False
+            self._data[key] = str(value)
+            if ttl is not None:
+                self._expiry[key] = self.clock() + ttl
+            else:
+                self._expiry.pop(key, None)
+            return True
+
+    def delete(self, key: str) -> int:
+        with self._lock:
+            if not self._live(key):
+                return 0
+            del self._data[key]
+            self._expiry.pop(key, None)
+            return 1
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        with self._lock:
+            current = self._string(key)
+            value = int(current or 0) + amount
+            self._data[key] = str(value)
+            if current is None and ttl is not None:
+                self._expiry[key] = self.clock() + ttl
+            return value
+
+    def ttl(self, key: str) -> Optional[float]:
+        with self._lock:
+            if not self._live(key) or key not in self._expiry:
+                return None
+            return max(0.0, self._expiry[key] - self.clock())
+
+    def hset(self, name: str, key: str, value: str) -> None:
+        with self._lock:
+            self._hash(name, create=True)[key] = str(value)
+
+    def hget(self, name: str, key: str) -> Optional[str]:
+        with self._lock:
+            values = self._hash(name)
+            return values.get(key) if values is not None else None
+
+    def hdel(self, name: str, key: str) -> int:
+        with self._lock:
+            values = self._hash(name)
+            if values is None or key not in values:
+                return 0
+            del values[key]
+            if not values:
+                self.delete(name)
+            return 1
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        with self._lock:
+            return dict(self._hash(name) or {})
+
+    def publish(self, channel: str, message: str) -> int:
+        with self._lock:
+            callbacks = list(self._subscribers.get(channel, ()))
+        # Delivered on the publisher's thread, outside the lock
+        for callback in callbacks:
+            try:
+                callback(message)
+            except Exception as e:
+                logger.error(f"Error in subscriber to {channel}: {str(e)}")
+        return len(callbacks)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None],
+                  on_connect: Optional[Callable[[], None]] = None) -> Subscription:
+        with self._lock:
+            self._subscribers.setdefault(channel, []).append(callback)
+        if on_connect:
+            on_connect()
+
+        def close():
+            with self._lock:
+                callbacks = self._subscribers.get(channel, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+
+        return Subscription(close)
+
+
+class RedisProtocolError(Exception):
+    pass
+
+
+def encode_command(*args) -> bytes:
+    """Encode a command as a RESP array of bulk strings"""
+    parts = [f"*{len(args)}\r\n".encode()]
+    for arg in args:
+        data = arg if isinstance(arg, bytes) else str(arg).encode()
+        parts.append(f"${len(data)}\r\n".encode())
+        parts.append(data)
+        parts.append(b"\r\n")
+    return b"".join(parts)
+
+
+def read_reply(reader):
+    """Read one RESP reply from a binary file object"""
+    line = reader.readline()
+    if not line:
+        raise ConnectionError("Connection closed by state server")
+    kind, body = line[:1], line[1:-2]
+    if kind == b"+":
+        return body.decode()
+    if kind == b"-":
+        raise RedisProtocolError(body.decode())
+    if kind == b":":
+        return int(body)
+    if kind == b"$":
+        length = int(body)
+        if length < 0:
+            return None
+        data = reader.read(length + 2)
+        return data[:-2].decode()
+    if kind == b"*":
+        length = int(body)
+        if length < 0:
+            return None
+        return [read_reply(reader) for _ in range(length)]
+    raise RedisProtocolError(f"Unexpected reply type: {line!r}")
+
+
+class RedisStateBackend(StateBackend):
+    """
+    State shared between workers and nodes through a Redis-protocol server.
+
+    Speaks plain RESP over one socket per thread, so it works against Redis
+    itself or the bundled stand-in in app.core.state_server.
+    """
+
+    def __init__(self, host: str = "localhost", port: int = 6379, db: int = 0,
+                 timeout: float = 5.0):
+        self.host = host
+        self.port = port
+        self.db = db
+        self.timeout = timeout
+        self._local = threading.local()
+        self._connections: List[socket.socket] = []
+        self._lock = threading.Lock()
+
+    def _connection(self) -> Tuple[socket.socket, object]:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            sock = socket.create_connection((self.host, self.port), timeout=self.timeout)
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            conn = (sock, sock.makefile("rb"))
+            self._local.conn = conn
+            with self._lock:
+                self._connections.append(sock)
+            if self.db:
+                self._send(conn, "SELECT", self.db)
+        return conn
+
+    def _send(self, conn, *args):
+        sock, reader = conn
+        sock.sendall(encode_command(*args))
+        return read_reply(reader)
+
+    def execute(self, *args):
+        conn = self._connection()
+        try:
+            return self._send(conn, *args)
+        except (ConnectionError, OSError):
+            # Drop the broken socket; the next call reconnects
+            self._local.conn = None
+            raise
+
+    def get(self, key: str) -> Optional[str]:
+        return self.execute("GET", key)
+
+    def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        args = ["SET", key, value]
+        if ttl is not None:
+            args += ["PX", max(1, int(ttl * 1000))]
+        if nx:
+            args.append("NX")
+        return self.execute(*args) == "OK"
+
+    def delete(self, key: str) -> int:
+        return self.execute("DEL", key)
+
+    def incr(self, key: str, amount: int = 1, ttl: Optional[float] = None) -> int:
+        if ttl is not None:
+            # Create the counter with its expiry first so INCRBY never leaves
+            # an immortal key behind
+            self.execute("SET", key, 0, "PX", max(1, int(ttl * 1000)), "NX")
+        return self.execute("INCRBY", key, amount)
+
+    def ttl(self, key: str) -> Optional[float]:
+        remaining = self.execute("PTTL", key)
+        return remaining / 1000 if remaining >= 0 else None
+
+    def hset(self, name: str, key: str, value: str) -> None:
+        self.execute("HSET", name, key, value)
+
+    def hget(self, name: str, key: str) -> Optional[str]:
+        return self.execute("HGET", name, key)
+
+    def hdel(self, name: str, key: str) -> int:
+        return self.execute("HDEL", name, key)
+
+    def hgetall(self, name: str) -> Dict[str, str]:
+        flat = self.execute("HGETALL", name) or []
+        return dict(zip(flat[::2], flat[1::2]))
+
+    def publish(self, channel: str, message: str) -> int:
+        return self.execute("PUBLISH", channel, message)
+
+    def subscribe(self, channel: str, callback: Callable[[str], None],
+                  on_connect: Optional[Callable[[], None]] = None) -> Subscription:
+        subscription = _RedisSubscription(self.host, self.port, channel, callback, on_connect)
+        subscription.start()
+        return Subscription(subscription.stop)
+
+    def close(self) -> None:
+        with self._lock:
+            for sock in self._connections:
+                try:
+                    sock.close()
+                except OSError:
+                    pass
+            self._connections = []
+        self._local = threading.local()
+
+
+class _RedisSubscription(threading.Thread):
+    """A connection in subscriber mode, reconnecting until stopped"""
+
+    def __init__(self, host: str, port: int, channel: str, callback: Callable[[str], None],
+                 on_connect: Optional[Callable[[], None]], retry_max: float = 5.0):
+        super().__init__(name=f"state-subscriber-{channel}", daemon=True)
+        self.host = host
+        self.port = port
+        self.channel = channel
+        self.callback = callback
+        self.on_connect = on_connect
+        self.retry_max = retry_max
+        self._stopped = threading.Event()
+        self._sock: Optional[socket.socket] = None
+
+    def run(self) -> None:
+        retry = 0.1
+        while not self._stopped.is_set():
+            try:
+                self._listen()
+                retry = 0.1
+            except (ConnectionError, OSError, RedisProtocolError) as e:
+                if self._stopped.is_set():
+                    return
+                logger.warning(f"Subscription to {self.channel} lost, reconnecting: {str(e)}")
+            self._stopped.wait(retry)
+            retry = min(self.retry_max, retry * 2)
+
+    def _listen(self) -> None:
+        sock = socket.create_connection((self.host, self.port), timeout=5.0)
+        self._sock = sock
+        try:
+            sock.settimeout(None)
+            reader = sock.makefile("rb")
+            sock.sendall(encode_command("SUBSCRIBE", self.channel))
+            read_reply(reader)
+            if self.on_connect:
+                self.on_connect()
+            while not self._stopped.is_set():
+                reply = read_reply(reader)
+                if isinstance(reply, list) and reply[0] == "message":
+                    try:
+                        self.callback(reply[2])
+                    except Exception as e:
+                        logger.error(f"Error in subscriber to {self.channel}: {str(e)}")
+        finally:
+            sock.close()
+
+    def stop(self) -> None:
+        self._stopped.set()
+        if self._sock is not None:
+            try:
+                self._sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+
+def create_state_backend(url: Optional[str] = None) -> StateBackend:
+    """
+    Build the backend described by a URL.
+
+    Args:
+        url: ``memory://`` or ``redis://host:port/db``; defaults to the
+            STATE_BACKEND_URL environment variable
+
+    Returns:
+        StateBackend: The configured backend
+    """
+    url = url or os.getenv("STATE_BACKEND_URL", "memory://")
+    parsed = urlparse(url)
+    if parsed.scheme == "memory":
+        return InProcessStateBackend()
+    if parsed.scheme == "redis":
+        db = int(parsed.path.lstrip("/") or 0)
+        return RedisStateBackend(parsed.hostname or "localhost", parsed.port or 6379, db)
+    raise ValueError(f"Unsupported state backend URL: {url}")
@@ -0,0 +1,224 @@
+"""
+Minimal Redis-protocol server for local multi-worker deployments and tests.
+
+Implements the subset of commands used by RedisStateBackend on top of
+InProcessStateBackend, plus PUBLISH/SUBSCRIBE, so several uvicorn workers
+on one box can share state without installing Redis:
+
+    python -m app.core.state_server --port 6380
+    STATE_BACKEND_URL=redis://localhost:6380/0 uvicorn app.main:app --workers 8
+"""
+import argparse
+import socketserver
+import threading
+from typing import Dict, List, Optional, Set
+from app.core.state import InProcessStateBackend, RedisProtocolError
+
+
+def _bulk(value: Optional[str]) -> bytes:
+    if value is None:
+        return b"$-1\r\n"
+    data = value.encode()
+    return b"$" + str(len(data)).encode() + b"\r\n" + data + b"\r\n"
+
+
+def _integer(value: int) -> bytes:
+    return b":" + str(value).encode() + b"\r\n"
+
+
+def _array(values: List[str]) -> bytes:
+    return b"*" + str(len(values)).encode() + b"\r\n" + b"".join(_bulk(v) for v in values)
+
+
+def _subscription_reply(kind: str, channel: str, count: int) -> bytes:
+    return b"*3\r\n" + _bulk(kind) + _bulk(channel) + _integer(count)
+
+
+OK = b"+OK\r\n"
+
+
+class StateServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, address=("127.0.0.1", 6380)):
+        self.databases: Dict[int, InProcessStateBackend] = {}
+        self.databases_lock = threading.Lock()
+        # Pub/sub channels are server-wide, as in Redis
+        self.channels: Dict[str, Set["StateRequestHandler"]] = {}
+        self.channels_lock = threading.Lock()
+        super().__init__(address, StateRequestHandler)
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def database(self, index: int) -> InProcessStateBackend:
+        with self.databases_lock:
+            if index not in self.databases:
+                self.databases[index] = InProcessStateBackend()
+            return self.databases[index]
+
+    def start_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="state-server", daemon=True)
+        thread.start()
+        return thread
+
+
+class StateRequestHandler(socketserver.StreamRequestHandler):
+    def setup(self):
+        super().setup()
+        self.db = self.server.database(0)
+        self.channels: Set[str] = set()
+        # Published messages are written from the publisher's thread
+        self.write_lock = threading.Lock()
+
+    def finish(self):
+        with self.server.channels_lock:
+            for channel in self.channels:
+                self.server.channels.get(channel, set()).discard(self)
+        super().finish()
+
+    def write(self, data: bytes) -> None:
+        with self.write_lock:
+            self.wfile.write(data)
+            self.wfile.flush()
+
+    def handle(self):
+        while True:
+            try:
+                args = self._read_command()
+            except (ConnectionError, OSError):
+                return
+            if args is None:
+                return
+            try:
+                reply = self.dispatch(args)
+            except (RedisProtocolError, TypeError, ValueError) as e:
+                reply = b"-ERR " + str(e).encode() + b"\r\n"
+            self.write(reply)
+
+    def _read_command(self) -> Optional[List[str]]:
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if not line.startswith(b"*"):
+            return line.decode().split()
+        args = []
+        for _ in range(int(line[1:-2])):
+            header = self.rfile.readline()
+            length = int(header[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2].decode())
+        return args
+
+    def dispatch(self, args: List[str]) -> bytes:
+        command, args = args[0].upper(), args[1:]
+        handler = getattr(self, f"cmd_{command.lower()}", None)
+        if handler is None:
+            raise RedisProtocolError(f"unknown command '{command}'")
+        return handler(*args)
+
+    def cmd_ping(self, *args) -> bytes:
+        return b"+PONG\r\n"
+
+    def cmd_select(self, index) -> bytes:
+        self.db = self.server.database(int(index))
+        return OK
+
+    def cmd_flushall(self) -> bytes:
+        with self.server.databases_lock:
+            self.server.databases.clear()
+        self.db = self.server.database(0)
+        return OK
+
+    def cmd_get(self, key) -> bytes:
+        return _bulk(self.db.get(key))
+
+    def cmd_set(self, key, value, *options) -> bytes:
+        ttl, nx = None, False
+        options = [o.upper() for o in options]
+        i = 0
+        while i < len(options):
+            if options[i] == "NX":
+                nx = True
+            elif options[i] in ("PX", "EX"):
+                ttl = float(options[i + 1]) / (1000 if options[i] == "PX" else 1)
+                i += 1
+            i += 1
+        return OK if self.db.set(key, value, ttl=ttl, nx=nx) else _bulk(None)
+
+    def cmd_del(self, *keys) -> bytes:
+        return _integer(sum(self.db.delete(key) for key in keys))
+
+    def cmd_incrby(self, key, amount) -> bytes:
+        return _integer(self.db.incr(key, int(amount)))
+
+    def cmd_incr(self, key) -> bytes:
+        return _integer(self.db.incr(key))
+
+    def cmd_pttl(self, key) -> bytes:
+        if self.db.get(key) is None and not self.db.hgetall(key):
+            return _integer(-2)
+        remaining = self.db.ttl(key)
+        return _integer(-1 if remaining is None else int(remaining * 1000))
+
+    def cmd_hset(self, name, key, value) -> bytes:
+        is_new = self.db.hget(name, key) is None
+        self.db.hset(name, key, value)
+        return _integer(int(is_new))
+
+    def cmd_hget(self, name, key) -> bytes:
+        return _bulk(self.db.hget(name, key))
+
+    def cmd_hdel(self, name, *keys) -> bytes:
+        return _integer(sum(self.db.hdel(name, key) for key in keys))
+
+    def cmd_hgetall(self, name) -> bytes:
+        flat = []
+        for key, value in self.db.hgetall(name).items():
+            flat += [key, value]
+        return _array(flat)
+
+    def cmd_publish(self, channel, message) -> bytes:
+        with self.server.channels_lock:
+            subscribers = list(self.server.channels.get(channel, ()))
+        delivered = 0
+        for subscriber in subscribers:
+            try:
+                subscriber.write(_array(["message", channel, message]))
+                delivered += 1
+            except OSError:
+                pass
+        return _integer(delivered)
+
+    def cmd_subscribe(self, *channels) -> bytes:
+        replies = []
+        # Hold the write lock so no message can overtake the confirmation
+        with self.write_lock:
+            with self.server.channels_lock:
+                for channel in channels:
+                    self.channels.add(channel)
+                    self.server.channels.setdefault(channel, set()).add(self)
+                    replies.append(_subscription_reply("subscribe", channel, len(self.channels)))
+            self.wfile.write(b"".join(replies))
+            self.wfile.flush()
+        return b""
+
+    def cmd_unsubscribe(self, *channels) -> bytes:
+        replies = []
+        with self.server.channels_lock:
+            for channel in channels or list(self.channels):
+                self.channels.discard(channel)
+                self.server.channels.get(channel, set()).discard(self)
+                replies.append(_subscription_reply("unsubscribe", channel, len(self.channels)))
+        return b"".join(replies)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the local Redis-protocol state server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6380)
+    options = parser.parse_args()
+    server = StateServer((options.host, options.port))
+    print(f"State server listening on {options.host}:{server.port}")
+    server.serve_forever()
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, inspect, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from dotenv import load_dotenv
@@ -32,6 +32,24 @@ Base = declarative_base()
 def init_db():
     from app.models import models  # Import models here to avoid circular imports
     Base.metadata.create_all(bind=engine)
+    add_missing_columns()
+
+def add_missing_columns(bind=None):
+    """Add nullable columns introduced since a table was created; create_all never alters tables"""
+    bind = bind or engine
+    inspector = inspect(bind)
+    with bind.begin() as connection:
+        for table in Base.metadata.sorted_tables:
+            if not inspector.has_table(table.name):
+                continue
+            existing = {column["name"] for column in inspector.get_columns(table.name)}
+            for column in table.columns:
+                if column.name not in existing and column.nullable:
+                    column_type = column.type.compile(dialect=bind.dialect)
+                    connection.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                    for index in table.indexes:
+                        if column.name in index.columns:
+                            index.create(connection, checkfirst=True)
 
 # Dependency to get database session
 def get_db():
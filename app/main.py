@@ -1,19 +1,35 @@
-from fastapi import FastAPI, Request, HTTPException, Depends, status
-from fastapi.responses import Response, JSONResponse, HTMLResponse
+from fastapi import FastAPI, Request, HTTPException, Depends, WebSocket, WebSocketDisconnect, status
+from fastapi.responses import Response, JSONResponse, HTMLResponse, StreamingResponse
 from fastapi.security import OAuth2PasswordRequestForm
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
+import asyncio
 import os
 import uuid
 from dotenv import load_dotenv
 import json
+import numpy as np
+from typing import Optional
 
 from app.services.llm_service import LLMService
 from app.services.simulation_service import SimulationService
 from app.services.analytics_service import AnalyticsService
+from app.services.audio_processing import WHISPER_SAMPLE_RATE, StreamResampler
+from app.services.campaign_dialer import CampaignDialer
+from app.services.speech_service import SpeechService, validate_tts_request
+from app.services.tts_cache import verify_tts_signature
+from app.services.streaming_tts import StreamingSynthesizer
+from app.services.twilio_media import MediaStreamSession
+from app.services.twilio_service import RETRY_PROMPT, TwilioService
+from app.services.voice_service import VoiceCallService
+from app.services.voice_turn_service import VoiceTurnOrchestrator
+from app.core.admission import AdmissionRejected
 from app.core.auth import get_current_user, create_access_token, User, Token
 from app.core.logger import logger
+from app.core.rate_limit import RateLimiter
+from app.core.state import create_state_backend
 from app.database import get_db, init_db
 from app.models.models import CallSimulation, Message
 
@@ -30,9 +46,69 @@ init_db()
 app.mount("/static", StaticFiles(directory="app/static"), name="static")
 templates = Jinja2Templates(directory="app/templates")
 
+# Shared state: in-process by default, or a Redis-protocol server via
+# STATE_BACKEND_URL when running several workers or nodes
+state_backend = create_state_backend()
+
 # Initialize services
-llm_service = LLMService()
-simulation_service = SimulationService(llm_service)
+llm_service = LLMService(state_backend=state_backend)
+simulation_service = SimulationService(llm_service, state_backend=state_backend)
+speech_service = SpeechService()
+# Per-call speech stats are kept until the call ends
+simulation_service.add_end_listener(speech_service.forget_call)
+speech_streamer = StreamingSynthesizer(speech_service)
+voice_turns = VoiceTurnOrchestrator(simulation_service, speech_service, speech_streamer)
+twilio_service = TwilioService(
+    os.getenv("TWILIO_ACCOUNT_SID"),
+    os.getenv("TWILIO_AUTH_TOKEN"),
+    os.getenv("TWILIO_PHONE_NUMBER")
+)
+voice_calls = VoiceCallService(simulation_service, twilio_service, state_backend)
+campaign_dialer = CampaignDialer(
+    os.getenv("TWILIO_ACCOUNT_SID"),
+    os.getenv("TWILIO_AUTH_TOKEN"),
+    os.getenv("TWILIO_PHONE_NUMBER")
+)
+# Running campaigns; referenced here so the tasks are not garbage collected
+campaign_tasks = set()
+message_rate_limiter = RateLimiter(
+    state_backend,
+    limit=int(os.getenv("MESSAGE_RATE_LIMIT_PER_MINUTE", "30")),
+    window=60,
+    prefix="ratelimit:message"
+)
+
+@app.on_event("startup")
+async def start_background_services():
+    """Resume idle tracking for open calls and start the background workers"""
+    resumed = simulation_service.resume_lifecycle()
+    simulation_service.presence.start()
+    requeued = simulation_service.resume_transfers()
+    simulation_service.lifecycle.start()
+    simulation_service.pipeline.start()
+    logger.info(f"Call lifecycle scheduler started, tracking {resumed} open simulations")
+    logger.info(f"{requeued} transferred calls waiting for an agent")
+
+@app.on_event("shutdown")
+async def stop_background_services():
+    simulation_service.lifecycle.stop()
+    simulation_service.pipeline.stop()
+    simulation_service.presence.stop()
+    speech_streamer.shutdown()
+    voice_turns.shutdown()
+    voice_calls.shutdown()
+    # Numbers not called yet stay pending in campaign_calls
+    for task in campaign_tasks:
+        task.cancel()
+
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request: Request, exc: AdmissionRejected):
+    """Shed load quickly when the LLM is saturated"""
+    return JSONResponse(
+        status_code=429,
+        content={"detail": "The assistant is busy, please retry shortly", "reason": exc.reason},
+        headers={"Retry-After": str(exc.retry_after)}
+    )
 
 # Web interface routes
 @app.get("/", response_class=HTMLResponse)
@@ -56,9 +132,12 @@ async def call_history(request: Request, db: Session = Depends(get_db)):
 
 # Simulation API endpoints
 @app.post("/api/simulate/start")
-async def start_simulation():
-    """Start a new call simulation"""
-    simulation_id = simulation_service.start_simulation()
+async def start_simulation(network_profile: Optional[str] = None):
+    """Start a new call simulation, optionally over a given network profile"""
+    try:
+        simulation_id = simulation_service.start_simulation(network_profile=network_profile)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     if not simulation_id:
         raise HTTPException(status_code=500, detail="Failed to start simulation")
     logger.info(f"Started simulation {simulation_id}")
@@ -89,34 +168,371 @@ async def process_message(request: Request):
     if not simulation_id or not message:
         raise HTTPException(status_code=400, detail="Simulation ID and message are required")
     
-    response = simulation_service.process_message(simulation_id, message)
+    allowed, retry_after = message_rate_limiter.hit(simulation_id)
+    if not allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many messages for this simulation",
+            headers={"Retry-After": str(retry_after)}
+        )
+    
+    # Runs in the threadpool so callers queued for an LLM slot do not block
+    # the event loop
+    response = await run_in_threadpool(simulation_service.process_message, simulation_id, message)
     if response is None:
         raise HTTPException(status_code=404, detail="Simulation not found or inactive")
     
     return {"response": response}
 
+@app.websocket("/ws/simulate/{simulation_id}/audio")
+async def stream_audio(websocket: WebSocket, simulation_id: str, sample_rate: int = WHISPER_SAMPLE_RATE):
+    """
+    Streaming speech-to-text for a simulation.
+
+    The client sends binary frames of 16-bit little-endian mono PCM as it
+    records and a {"event": "stop"} text frame when done. The server sends
+    partial and final transcripts as JSON; each final transcript is
+    processed as a caller message and followed by a "reply" event.
+    """
+    await websocket.accept()
+    if not 0 < sample_rate <= 192000:
+        await websocket.close(code=1003, reason="Unsupported sample rate")
+        return
+    transcriber = speech_service.streaming_transcriber(lambda: simulation_id)
+    # Chunks are resampled as one continuous stream, so their edges leave no seams
+    resampler = StreamResampler(sample_rate) if sample_rate != WHISPER_SAMPLE_RATE else None
+
+    async def handle(events):
+        for event in events:
+            await websocket.send_json(event)
+            if event["type"] == "final" and event["text"]:
+                try:
+                    reply = await run_in_threadpool(
+                        simulation_service.process_message, simulation_id, event["text"]
+                    )
+                except AdmissionRejected as e:
+                    await websocket.send_json({"type": "busy", "retry_after": e.retry_after})
+                    continue
+                if reply is None:
+                    await websocket.close(code=1008, reason="Simulation not found or inactive")
+                    return False
+                await websocket.send_json({"type": "reply", "text": reply})
+        return True
+
+    try:
+        while True:
+            message = await websocket.receive()
+            if message["type"] == "websocket.disconnect":
+                break
+            if message.get("bytes"):
+                samples = np.frombuffer(message["bytes"], dtype="<i2").astype(np.float32) / 32768
+                if resampler:
+                    samples = resampler.process(samples)
+                events = await run_in_threadpool(transcriber.feed, samples)
+            elif message.get("text") and json.loads(message["text"]).get("event") == "stop":
+                # flush() may transcribe the last utterance, so keep it off the event loop
+                if await handle(await run_in_threadpool(transcriber.flush)):
+                    await websocket.close()
+                break
+            else:
+                continue
+            if not await handle(events):
+                break
+    except WebSocketDisconnect:
+        pass
+
+# Twilio voice webhooks
+async def verify_twilio_signature(request: Request) -> None:
+    """Only Twilio may drive calls: webhooks must carry a valid X-Twilio-Signature for PUBLIC_BASE_URL"""
+    form = await request.form()
+    path = request.url.path + (f"?{request.url.query}" if request.url.query else "")
+    if not twilio_service.validate_request(path, dict(form), request.headers.get("X-Twilio-Signature")):
+        raise HTTPException(status_code=403, detail="Invalid Twilio signature")
+
+@app.post("/api/voice/handle-call", dependencies=[Depends(verify_twilio_signature)])
+async def handle_call(request: Request):
+    """Answer an incoming call and attach it to a simulation"""
+    form = await request.form()
+    call_sid = form.get("CallSid")
+    if not call_sid:
+        raise HTTPException(status_code=400, detail="CallSid is required")
+    twiml = await run_in_threadpool(voice_calls.handle_call, call_sid)
+    if twiml is None:
+        raise HTTPException(status_code=500, detail="Failed to start simulation")
+    return Response(content=twiml, media_type="application/xml")
+
+@app.post("/api/voice/process-speech", dependencies=[Depends(verify_twilio_signature)])
+async def process_speech(request: Request):
+    """
+    Handle what the caller said.
+
+    The reply is generated in the background; if it is not ready within
+    a couple of seconds, Twilio is told to hold and poll /api/voice/reply.
+    """
+    form = await request.form()
+    call_sid = form.get("CallSid")
+    speech = (form.get("SpeechResult") or "").strip()
+    if not call_sid:
+        raise HTTPException(status_code=400, detail="CallSid is required")
+    if not speech:
+        return Response(content=twilio_service.create_twiml_response(RETRY_PROMPT), media_type="application/xml")
+
+    turn = await run_in_threadpool(voice_calls.start_reply, call_sid, speech)
+    if turn is None:
+        raise HTTPException(status_code=404, detail="Call not found")
+    result = await voice_calls.wait_for_reply(call_sid, turn, voice_calls.fast_reply_seconds)
+    return Response(content=voice_calls.reply_twiml(turn, result), media_type="application/xml")
+
+@app.post("/api/voice/reply", dependencies=[Depends(verify_twilio_signature)])
+async def voice_reply(request: Request, turn: int, attempt: int = 1):
+    """Twilio polls here while a reply is being generated"""
+    form = await request.form()
+    call_sid = form.get("CallSid")
+    if not call_sid:
+        raise HTTPException(status_code=400, detail="CallSid is required")
+    result = await voice_calls.wait_for_reply(call_sid, turn, voice_calls.poll_seconds)
+    return Response(content=voice_calls.reply_twiml(turn, result, attempt), media_type="application/xml")
+
+@app.post("/api/voice/status", dependencies=[Depends(verify_twilio_signature)])
+async def call_status(request: Request, campaign_call: str = None):
+    """Status callback for outbound campaign calls"""
+    form = await request.form()
+    call_sid = form.get("CallSid")
+    call_status = form.get("CallStatus")
+    if not call_sid or not call_status:
+        raise HTTPException(status_code=400, detail="CallSid and CallStatus are required")
+    found = await run_in_threadpool(
+        campaign_dialer.record_status, call_sid, call_status, form.get("CallDuration"), campaign_call
+    )
+    if not found:
+        raise HTTPException(status_code=404, detail="Call not found")
+    return Response(status_code=204)
+
+# Outbound campaigns
+@app.post("/api/campaigns", status_code=202)
+async def start_campaign(request: Request, current_user: User = Depends(get_current_user)):
+    """Call a list of numbers; progress is at GET /api/campaigns/{id}"""
+    data = await request.json()
+    numbers = data.get("numbers")
+    if not numbers or not isinstance(numbers, list) or not all(isinstance(n, str) and n for n in numbers):
+        raise HTTPException(status_code=400, detail="A list of numbers is required")
+    campaign_id = await run_in_threadpool(campaign_dialer.create_campaign, numbers)
+    task = asyncio.create_task(campaign_dialer.run(campaign_id))
+    campaign_tasks.add(task)
+    task.add_done_callback(campaign_tasks.discard)
+    return {"campaign_id": campaign_id, "numbers": len(numbers)}
+
+@app.get("/api/campaigns/{campaign_id}")
+async def get_campaign(campaign_id: str, current_user: User = Depends(get_current_user)):
+    """Numbers per call status for a campaign"""
+    summary = await run_in_threadpool(campaign_dialer.summary, campaign_id)
+    if summary is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    return summary
+
+@app.websocket("/ws/twilio/media")
+async def twilio_media_stream(websocket: WebSocket):
+    """
+    Twilio Media Streams endpoint.
+
+    Caller audio is transcribed as it streams in, each final transcript is
+    processed as a caller message and the reply is spoken back on the
+    stream. Only Twilio may open the stream (X-Twilio-Signature), and it is
+    attached to the simulation of the call it carries; a simulation_id
+    parameter naming any other simulation is refused.
+    """
+    if not twilio_service.validate_stream_request(websocket.headers.get("X-Twilio-Signature")):
+        await websocket.close(code=1008)
+        return
+    await websocket.accept()
+    simulation_id = None
+    session = MediaStreamSession(speech_service.streaming_transcriber(lambda: simulation_id))
+    # Transcripts are processed in order on their own task, so frames keep
+    # being read (and Twilio's buffer drained) while the LLM replies
+    finals: asyncio.Queue = asyncio.Queue()
+
+    async def process_finals():
+        while (text := await finals.get()) is not None:
+            try:
+                reply = await run_in_threadpool(simulation_service.process_message, simulation_id, text)
+                if reply is None:
+                    logger.info(f"Simulation {simulation_id} ended, ignoring media stream {session.stream_sid}")
+                    continue
+                audio, _ = await run_in_threadpool(speech_service.text_to_speech, reply)
+                for message in await run_in_threadpool(session.reply_messages, audio):
+                    await websocket.send_text(json.dumps(message))
+            except AdmissionRejected:
+                logger.warning(f"LLM saturated, dropped utterance on media stream {session.stream_sid}")
+            except Exception as e:
+                logger.error(f"Error processing utterance on media stream {session.stream_sid}: {str(e)}")
+
+    processor = asyncio.create_task(process_finals())
+    try:
+        while not session.stopped:
+            message = json.loads(await websocket.receive_text())
+            events = await run_in_threadpool(session.handle, message)
+            if message.get("event") == "start":
+                simulation_id = session.call_sid and await run_in_threadpool(
+                    voice_calls.simulation_for_call, session.call_sid, True
+                )
+                requested = session.parameters.get("simulation_id")
+                if not simulation_id or (requested and requested != simulation_id):
+                    logger.warning(f"Media stream {session.stream_sid} for call {session.call_sid} "
+                                   f"asked for simulation {requested}, refusing it")
+                    simulation_id = None
+                    await websocket.close(code=1008)
+                    break
+                logger.info(f"Media stream {session.stream_sid} for call {session.call_sid} "
+                            f"attached to simulation {simulation_id}")
+            for event in events:
+                if event["type"] == "final" and event["text"] and simulation_id:
+                    finals.put_nowait(event["text"])
+    except WebSocketDisconnect:
+        pass
+    finally:
+        finals.put_nowait(None)
+        await processor
+    logger.info(f"Media stream {session.stream_sid} closed after {session.frames} frames")
+
+@app.post("/api/simulate/{simulation_id}/voice-turn")
+async def voice_turn(simulation_id: str, request: Request):
+    """
+    One spoken turn: the request body is the caller's recorded utterance,
+    the response is the agent's reply as audio, streamed sentence by
+    sentence while the LLM is still generating it.
+    """
+    audio_data = await request.body()
+    if not audio_data:
+        raise HTTPException(status_code=400, detail="Audio is required")
+
+    turn = await run_in_threadpool(voice_turns.start_turn, simulation_id, audio_data)
+    if turn is None:
+        raise HTTPException(status_code=404, detail="Simulation not found or inactive")
+    return StreamingResponse(
+        turn.audio(),
+        media_type="audio/mpeg",
+        headers={"X-Transcript": json.dumps(turn.transcript)}
+    )
+
+@app.get("/api/simulate/{simulation_id}/voice-turns")
+async def get_voice_turns(simulation_id: str):
+    """Latency breakdown of a call's voice turns"""
+    return await run_in_threadpool(voice_turns.get_turn_metrics, simulation_id)
+
+def _check_tts_request(text: str, lang: str, voice: str, slow: bool, sig: str) -> None:
+    """TTS URLs are signed by whoever hands them out (see twiml.tts_url), so they cannot be forged"""
+    if not verify_tts_signature(sig, text, lang, voice, slow):
+        raise HTTPException(status_code=403, detail="Invalid or missing signature")
+    try:
+        validate_tts_request(text, lang, voice)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/speech/tts")
+async def synthesize_speech(text: str, lang: str = "en", voice: str = "com", slow: bool = False, sig: str = ""):
+    """Synthesized speech for a phrase, served from the TTS cache when possible"""
+    _check_tts_request(text, lang, voice, slow, sig)
+    audio, content_type = await run_in_threadpool(speech_service.text_to_speech, text, lang, voice, slow)
+    if not audio:
+        raise HTTPException(status_code=502, detail="Speech synthesis failed")
+    return Response(content=audio, media_type=content_type, headers={"Cache-Control": "public, max-age=86400"})
+
+@app.get("/api/speech/tts/stream")
+async def stream_speech(text: str, lang: str = "en", voice: str = "com", slow: bool = False, sig: str = ""):
+    """Synthesized speech sent sentence by sentence as a chunked response"""
+    _check_tts_request(text, lang, voice, slow, sig)
+    return StreamingResponse(
+        speech_streamer.stream(text, lang=lang, voice=voice, slow=slow),
+        media_type="audio/mpeg"
+    )
+
 @app.get("/api/simulate/{simulation_id}")
 async def get_simulation(simulation_id: str):
     """Get details about a specific simulation"""
     details = simulation_service.get_simulation_details(simulation_id)
     if not details:
         raise HTTPException(status_code=404, detail="Simulation not found")
+    details["vad"] = speech_service.get_vad_stats(simulation_id)
     return details
 
+@app.get("/api/simulate/{simulation_id}/network")
+async def get_simulation_network(simulation_id: str):
+    """Per-turn simulated latency, jitter and packet loss of a call"""
+    series = await run_in_threadpool(simulation_service.get_network_series, simulation_id)
+    if series is None:
+        raise HTTPException(status_code=404, detail="Simulation not found")
+    return series
+
+@app.get("/api/analytics/quality")
+async def get_quality_trends(days: int = 7, db: Session = Depends(get_db)):
+    """Daily network quality and sentiment over the last days"""
+    return await run_in_threadpool(AnalyticsService(db).get_quality_trends, days)
+
 @app.post("/api/simulate/{simulation_id}/transfer")
 async def transfer_call(simulation_id: str, request: Request):
-    """Transfer a call to another agent"""
+    """Queue a call for an agent with a skill, or for a specific agent"""
     data = await request.json()
-    agent = data.get("agent")
+    target = data.get("skill") or data.get("agent")
     reason = data.get("reason")
     
-    if not agent or not reason:
-        raise HTTPException(status_code=400, detail="Agent and reason are required")
+    if not target or not reason:
+        raise HTTPException(status_code=400, detail="Skill or agent, and reason are required")
     
-    success = simulation_service.transfer_call(simulation_id, agent, reason)
+    success = await run_in_threadpool(simulation_service.transfer_call, simulation_id, target, reason)
     if not success:
-        raise HTTPException(status_code=404, detail="Simulation not found or inactive")
+        raise HTTPException(status_code=404, detail="Simulation not found or inactive, or no agent for the transfer")
     
+    return {"status": "success", "agent": simulation_service.acd.assigned_agent(simulation_id)}
+
+# Agent presence, shared by all workers; the ACD routes transfers from it
+@app.get("/api/agents")
+async def list_agents(skill: str = None, available: bool = False):
+    """Agents, or with available=true those who can take a call (for skill), longest free first"""
+    if available:
+        if not skill:
+            raise HTTPException(status_code=400, detail="skill is required with available=true")
+        return [agent.to_dict() for agent in simulation_service.presence.available(skill)]
+    agents = simulation_service.presence.agents()
+    return [agent for agent in agents if skill in agent["skills"]] if skill else agents
+
+@app.put("/api/agents/{agent_id}")
+async def update_agent(agent_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    """Add or change an agent: any of {"name", "skills": {skill: level} or [skill], "capacity", "state"}"""
+    data = await request.json()
+    try:
+        agent = await run_in_threadpool(
+            simulation_service.presence.update, agent_id,
+            data.get("name"), data.get("skills"), data.get("capacity"), data.get("state")
+        )
+    except (TypeError, ValueError) as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return agent.to_dict()
+
+@app.post("/api/agents/{agent_id}/state")
+async def set_agent_state(agent_id: str, request: Request, current_user: User = Depends(get_current_user)):
+    """Set an agent's state: available, busy, wrap-up or offline"""
+    data = await request.json()
+    if simulation_service.presence.get(agent_id) is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    try:
+        agent = await run_in_threadpool(simulation_service.presence.update, agent_id, state=data.get("state") or "")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if agent is None:
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return agent.to_dict()
+
+@app.delete("/api/agents/{agent_id}")
+async def remove_agent(agent_id: str, current_user: User = Depends(get_current_user)):
+    if not await run_in_threadpool(simulation_service.presence.remove, agent_id):
+        raise HTTPException(status_code=404, detail="Agent not found")
+    return {"status": "success"}
+
+@app.post("/api/agents/{agent_id}/calls/{simulation_id}/complete")
+async def complete_agent_call(agent_id: str, simulation_id: str, current_user: User = Depends(get_current_user)):
+    """An agent finished a transferred call; they get the next waiting one"""
+    if not await run_in_threadpool(simulation_service.complete_agent_call, agent_id, simulation_id):
+        raise HTTPException(status_code=404, detail="Call is not with this agent")
     return {"status": "success"}
 
 @app.post("/api/simulate/{simulation_id}/note")
@@ -149,6 +565,17 @@ async def add_tag(simulation_id: str, request: Request):
     
     return {"status": "success"}
 
+# Metrics endpoints
+@app.get("/api/metrics")
+async def get_metrics():
+    """Runtime metrics for the background workers"""
+    return {
+        "post_turn_pipeline": simulation_service.pipeline.metrics(),
+        "llm_admission": simulation_service.admission.metrics(),
+        "acd": simulation_service.acd.metrics(),
+        "vad": speech_service.get_vad_stats()
+    }
+
 # Authentication endpoints
 @app.post("/token", response_model=Token)
 async def login_for_access_token(form_data: OAuth2PasswordRequestForm = Depends()):
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, DateTime, JSON, Float, ForeignKey
+from sqlalchemy import Column, Integer, String, DateTime, JSON, Float, ForeignKey, Boolean, LargeBinary
 from sqlalchemy.orm import relationship
 from datetime import datetime
 from ..database import Base
@@ -7,11 +7,13 @@ class CallSimulation(Base):
     __tablename__ = "call_simulations"
 
     id = Column(String(36), primary_key=True)
+    call_sid = Column(String(64), nullable=True, unique=True, index=True)  # Twilio call, for phone calls
     status = Column(String(20), default="in-progress")
     start_time = Column(DateTime, default=datetime.utcnow)
     end_time = Column(DateTime, nullable=True)
     transferred_to = Column(String(100), nullable=True)
     transfer_reason = Column(String(500), nullable=True)
+    transfer_skill = Column(String(100), nullable=True)  # queue a transferred call waits in, skill or agent:<id>
     notes = Column(JSON, default=list)
     tags = Column(JSON, default=list)
     quality_metrics = Column(JSON, default=dict)
@@ -28,5 +30,85 @@ class Message(Base):
     content = Column(String(1000))
     sender = Column(String(20))  # "user" or "agent"
     timestamp = Column(DateTime, default=datetime.utcnow)
+    sentiment_score = Column(Float, nullable=True)
 
-    simulation = relationship("CallSimulation", back_populates="messages") 
\ No newline at end of file
+    simulation = relationship("CallSimulation", back_populates="messages")
+
+
+class PipelineTask(Base):
+    """A post-turn stage that failed and is waiting to be retried"""
+    __tablename__ = "pipeline_tasks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    stage = Column(String(50))
+    payload = Column(JSON)
+    status = Column(String(20), default="pending", index=True)  # pending, retrying, done, failed
+    attempts = Column(Integer, default=0)
+    last_error = Column(String(1000), nullable=True)
+    next_attempt_at = Column(DateTime, default=datetime.utcnow, index=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class VoiceTurnMetric(Base):
+    """Latency breakdown of one voice turn, in milliseconds from end of speech"""
+    __tablename__ = "voice_turn_metrics"
+
+    id = Column(Integer, primary_key=True, index=True)
+    simulation_id = Column(String(36), ForeignKey("call_simulations.id"), index=True)
+    stt_ms = Column(Float, nullable=True)
+    first_token_ms = Column(Float, nullable=True)
+    first_audio_ms = Column(Float, nullable=True)
+    total_ms = Column(Float)
+    budget_ms = Column(Float)
+    within_budget = Column(Boolean, default=True)
+    missed_deadlines = Column(JSON, default=list)  # stages that ran past their deadline
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class CampaignCall(Base):
+    """One number in an outbound campaign and what happened when it was called"""
+    __tablename__ = "campaign_calls"
+
+    id = Column(Integer, primary_key=True, index=True)
+    campaign_id = Column(String(36), index=True)
+    to_number = Column(String(32))
+    status = Column(String(20), default="pending", index=True)  # pending, then Twilio's call status, or error
+    call_sid = Column(String(64), nullable=True, index=True)
+    attempts = Column(Integer, default=0)
+    last_error = Column(String(500), nullable=True)
+    duration = Column(Integer, nullable=True)  # seconds, once the call has ended
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class NetworkSeries(Base):
+    """
+    Simulated network quality of a call, one sample per turn.
+
+    The samples themselves live in NetworkChunk rows; this row keeps
+    running averages and a latency sketch (see
+    app.services.network_simulator) up to date so each turn costs the
+    same and dashboards can aggregate without reading the samples.
+    """
+    __tablename__ = "network_series"
+
+    simulation_id = Column(String(36), ForeignKey("call_simulations.id"), primary_key=True)
+    profile = Column(String(32))
+    samples = Column(Integer, default=0)
+    latency_sketch = Column(LargeBinary, nullable=True)
+    avg_latency_ms = Column(Float, nullable=True)
+    p95_latency_ms = Column(Float, nullable=True)
+    avg_jitter_ms = Column(Float, nullable=True)
+    avg_packet_loss = Column(Float, nullable=True)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+
+class NetworkChunk(Base):
+    """Up to CHUNK_SAMPLES consecutive samples of a call's series, as packed float32 arrays"""
+    __tablename__ = "network_chunks"
+
+    simulation_id = Column(String(36), ForeignKey("call_simulations.id"), primary_key=True)
+    chunk = Column(Integer, primary_key=True)
+    latency_ms = Column(LargeBinary, default=b"")
+    jitter_ms = Column(LargeBinary, default=b"")
+    packet_loss = Column(LargeBinary, default=b"")
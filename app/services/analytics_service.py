@@ -4,7 +4,8 @@ from sqlalchemy import func
 from app.models.database import Call, Message
 from app.core.logger import logger
 from datetime import datetime, timedelta
-from ..models.models import CallSimulation
+from app.services.network_simulator import sketch_add, sketch_percentile, stored_summary, unpack_sketch
+from ..models.models import CallSimulation, NetworkSeries
 
 class AnalyticsService:
     def __init__(self, db: Session):
@@ -85,10 +86,17 @@ class AnalyticsService:
         if not simulation:
             return {}
 
+        series = self.db.query(NetworkSeries).filter(NetworkSeries.simulation_id == simulation_id).first()
+        network = None
+        if series:
+            network = stored_summary(series)
+            network["profile"] = series.profile
+
         return {
             "duration": simulation.resolution_time,
             "sentiment_score": simulation.sentiment_score,
-            "quality_metrics": simulation.quality_metrics
+            "quality_metrics": simulation.quality_metrics,
+            "network": network
         }
 
     def get_daily_stats(self) -> Dict:
@@ -136,43 +144,67 @@ class AnalyticsService:
         ]
 
     def get_quality_trends(self, days: int = 7) -> List[Dict]:
-        """Get quality metrics trends"""
+        """
+        Get quality metrics trends.
+
+        Network quality is averaged over every turn's sample, so long calls
+        weigh more than short ones; calls recorded before per-turn series
+        existed contribute their single quality_metrics value. p95 latency
+        comes from the calls' merged latency sketches.
+        """
         end_date = datetime.utcnow()
         start_date = end_date - timedelta(days=days)
 
-        calls = self.db.query(CallSimulation).filter(
+        rows = self.db.query(
+            CallSimulation, NetworkSeries.samples, NetworkSeries.avg_latency_ms, NetworkSeries.avg_jitter_ms,
+            NetworkSeries.avg_packet_loss, NetworkSeries.latency_sketch
+        ).outerjoin(NetworkSeries, NetworkSeries.simulation_id == CallSimulation.id).filter(
             CallSimulation.start_time >= start_date,
             CallSimulation.start_time <= end_date
         ).all()
 
         daily_metrics = {}
-        for call in calls:
+        for call, samples, latency, jitter, packet_loss, sketch in rows:
             day = call.start_time.date()
             if day not in daily_metrics:
+                # Running [sum, count] per metric, and the day's latency sketch
                 daily_metrics[day] = {
-                    "latency": [],
-                    "packet_loss": [],
-                    "jitter": [],
+                    "latency": [0.0, 0],
+                    "packet_loss": [0.0, 0],
+                    "jitter": [0.0, 0],
+                    "sketch": unpack_sketch(None),
                     "sentiment": []
                 }
+            totals = daily_metrics[day]
 
             metrics = call.quality_metrics or {}
-            if metrics.get("network_latency"):
-                daily_metrics[day]["latency"].append(metrics["network_latency"])
-            if metrics.get("packet_loss"):
-                daily_metrics[day]["packet_loss"].append(metrics["packet_loss"])
-            if metrics.get("jitter"):
-                daily_metrics[day]["jitter"].append(metrics["jitter"])
             if call.sentiment_score is not None:
-                daily_metrics[day]["sentiment"].append(call.sentiment_score)
-
-        return [
-            {
+                totals["sentiment"].append(call.sentiment_score)
+            if samples:
+                for key, average in (("latency", latency), ("jitter", jitter), ("packet_loss", packet_loss)):
+                    totals[key][0] += (average or 0.0) * samples
+                    totals[key][1] += samples
+                totals["sketch"] += unpack_sketch(sketch)
+                continue
+            for key, name in (("latency", "network_latency"), ("packet_loss", "packet_loss"), ("jitter", "jitter")):
+                if metrics.get(name):
+                    totals[key][0] += metrics[name]
+                    totals[key][1] += 1
+            if metrics.get("network_latency"):
+                sketch_add(totals["sketch"], metrics["network_latency"])
+
+        trends = []
+        for day, metrics in sorted(daily_metrics.items()):
+            latency, packet_loss, jitter = (
+                metrics[key][0] / metrics[key][1] if metrics[key][1] else 0
+                for key in ("latency", "packet_loss", "jitter")
+            )
+            trends.append({
                 "date": day.isoformat(),
-                "avg_latency": sum(metrics["latency"]) / len(metrics["latency"]) if metrics["latency"] else 0,
-                "avg_packet_loss": sum(metrics["packet_loss"]) / len(metrics["packet_loss"]) if metrics["packet_loss"] else 0,
-                "avg_jitter": sum(metrics["jitter"]) / len(metrics["jitter"]) if metrics["jitter"] else 0,
+                "avg_latency": latency,
+                "p95_latency": sketch_percentile(metrics["sketch"], 95),
+                "avg_packet_loss": packet_loss,
+                "avg_jitter": jitter,
                 "avg_sentiment": sum(metrics["sentiment"]) / len(metrics["sentiment"]) if metrics["sentiment"] else 0
-            }
-            for day, metrics in sorted(daily_metrics.items())
-        ] 
\ No newline at end of file
+            })
+        return trends 
\ No newline at end of file
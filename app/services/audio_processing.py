@@ -0,0 +1,253 @@
+import io
+import math
+from typing import List, Tuple
+import numpy as np
+import soundfile as sf
+
+# Whisper models expect 16 kHz mono float32 PCM
+WHISPER_SAMPLE_RATE = 16000
+# Telephony audio (Twilio Media Streams) is 8 kHz G.711 mu-law
+TELEPHONY_SAMPLE_RATE = 8000
+
+
+def _mulaw_table() -> np.ndarray:
+    # G.711: each byte is the complement of sign, 3-bit exponent and 4-bit
+    # mantissa; magnitude = ((mantissa << 3) + 0x84 << exponent) - 0x84
+    codes = ~np.arange(256, dtype=np.int32) & 0xFF
+    exponent = (codes >> 4) & 0x07
+    mantissa = codes & 0x0F
+    magnitude = (((mantissa << 3) + 0x84) << exponent) - 0x84
+    return (np.where(codes & 0x80, -magnitude, magnitude) / 32768).astype(np.float32)
+
+
+MULAW_TABLE = _mulaw_table()
+
+
+def mulaw_decode(payload: bytes) -> np.ndarray:
+    """Decode mu-law bytes to float32 samples with one table lookup"""
+    return MULAW_TABLE[np.frombuffer(payload, dtype=np.uint8)]
+
+
+def mulaw_encode(samples: np.ndarray) -> bytes:
+    """G.711 mu-law encode float samples in [-1, 1]"""
+    pcm = np.clip(np.round(samples * 32768), -32768, 32767).astype(np.int32)
+    sign = np.where(pcm < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(pcm), 32635) + 0x84
+    exponent = np.floor(np.log2(magnitude)).astype(np.int32) - 7
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8).tobytes()
+
+
+def decode_audio(audio_data: bytes) -> Tuple[np.ndarray, int]:
+    """
+    Decode an encoded audio file (wav, flac, ogg...) held in memory.
+
+    Args:
+        audio_data: The file contents
+
+    Returns:
+        Tuple[np.ndarray, int]: Mono float32 samples and their sample rate
+    """
+    samples, sample_rate = sf.read(io.BytesIO(audio_data), dtype="float32", always_2d=True)
+    if samples.shape[1] == 1:
+        return samples[:, 0], sample_rate
+    return samples.mean(axis=1, dtype=np.float32), sample_rate
+
+
+def _next_smooth(n: int) -> int:
+    """Smallest number >= n with no prime factor above 5"""
+    best = 2 * max(n, 1)
+    power_5 = 1
+    while power_5 < best:
+        power_35 = power_5
+        while power_35 < best:
+            candidate = power_35
+            while candidate < n:
+                candidate *= 2
+            best = min(best, candidate)
+            power_35 *= 3
+        power_5 *= 5
+    return best
+
+
+def resample(samples: np.ndarray, sample_rate: int, target_rate: int = WHISPER_SAMPLE_RATE) -> np.ndarray:
+    """
+    Resample by truncating or zero-padding the spectrum.
+
+    Dropping the bins above the new Nyquist frequency is an ideal low-pass
+    filter, so downsampling does not alias. The input is zero-padded to a
+    length that maps to a whole number of output samples and factors into
+    small primes, since FFTs of arbitrary lengths can be many times slower.
+    """
+    if sample_rate == target_rate or len(samples) == 0:
+        return samples.astype(np.float32, copy=False)
+    g = math.gcd(sample_rate, target_rate)
+    up, down = target_rate // g, sample_rate // g
+    n_out = int(round(len(samples) * up / down))
+    n_fft = down * _next_smooth(-(-len(samples) // down))
+    n_fft_out = n_fft // down * up
+
+    spectrum = np.fft.rfft(samples, n_fft)
+    bins = n_fft_out // 2 + 1
+    if bins <= len(spectrum):
+        spectrum = spectrum[:bins]
+    else:
+        spectrum = np.concatenate((spectrum, np.zeros(bins - len(spectrum), dtype=spectrum.dtype)))
+    resampled = np.fft.irfft(spectrum, n_fft_out)[:n_out] * (up / down)
+    return resampled.astype(np.float32)
+
+
+def load_audio(audio_data: bytes) -> np.ndarray:
+    """Decode audio bytes straight into the 16 kHz mono float32 array Whisper takes"""
+    samples, sample_rate = decode_audio(audio_data)
+    return np.ascontiguousarray(resample(samples, sample_rate))
+
+
+class Upsampler2x:
+    """
+    Streaming 2x upsampler (8 kHz telephony audio to 16 kHz).
+
+    A windowed-sinc half-band FIR split into its two polyphase branches:
+    even outputs are the input delayed, odd outputs are the input filtered
+    by the other branch, so each frame costs two short np.convolve calls.
+    The last taps - 1 input samples are carried between frames, so frame
+    boundaries leave no seams. Output lags input by taps / 2 input samples.
+    """
+
+    def __init__(self, taps: int = 16):
+        n = np.arange(2 * taps) - taps
+        prototype = np.sinc(n / 2) * np.kaiser(2 * taps, 8.0)
+        self.taps = taps
+        self.even = prototype[0::2] / prototype[0::2].sum()
+        self.odd = prototype[1::2] / prototype[1::2].sum()
+        self._history = np.zeros(taps - 1, dtype=np.float32)
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        extended = np.concatenate((self._history, samples))
+        self._history = extended[len(extended) - (self.taps - 1):]
+        out = np.empty(2 * len(samples), dtype=np.float32)
+        out[0::2] = np.convolve(extended, self.even, "valid")
+        out[1::2] = np.convolve(extended, self.odd, "valid")
+        return out
+
+
+class StreamResampler:
+    """
+    Streaming resampler between any two integer rates, e.g. 48 kHz browser
+    audio to 16 kHz.
+
+    resample() transforms each call's input on its own, so a stream cut
+    into chunks gets a discontinuity at every chunk edge. This is a
+    polyphase windowed-sinc FIR instead: the last input samples are carried
+    between chunks, so the output does not depend on how the input was
+    split. Output lags input by half the filter length.
+    """
+
+    def __init__(self, sample_rate: int, target_rate: int = WHISPER_SAMPLE_RATE, zero_crossings: int = 16):
+        g = math.gcd(sample_rate, target_rate)
+        self.up, self.down = target_rate // g, sample_rate // g
+        # Low-pass at the lower of the two Nyquist frequencies, designed at
+        # the upsampled rate and split into one filter bank row per phase
+        cutoff = 0.5 / max(self.up, self.down)
+        length = 2 * zero_crossings * max(self.up, self.down) + 1
+        n = np.arange(length) - (length - 1) / 2
+        prototype = 2 * cutoff * np.sinc(2 * cutoff * n) * np.kaiser(length, 8.0) * self.up
+        self.taps = -(-length // self.up)
+        prototype = np.concatenate((prototype, np.zeros(self.taps * self.up - length)))
+        self.bank = prototype.reshape(self.taps, self.up).T.astype(np.float32)
+        self._history = np.zeros(self.taps - 1, dtype=np.float32)
+        self._consumed = 0
+        self._produced = 0
+
+    def process(self, samples: np.ndarray) -> np.ndarray:
+        samples = np.asarray(samples, dtype=np.float32)
+        extended = np.concatenate((self._history, samples))
+        start = self._consumed - len(self._history)
+        self._consumed += len(samples)
+        # Every output whose newest input sample has now arrived
+        end = -(-self._consumed * self.up // self.down)
+        positions = np.arange(self._produced, end, dtype=np.int64) * self.down
+        self._produced = end
+        self._history = extended[len(extended) - (self.taps - 1):] if self.taps > 1 else extended[:0]
+        if not len(positions):
+            return np.zeros(0, dtype=np.float32)
+        newest = positions // self.up - start
+        window = extended[newest[:, None] - np.arange(self.taps)[None, :]]
+        return np.einsum("ij,ij->i", window, self.bank[positions % self.up]).astype(np.float32)
+
+
+class VoiceActivityDetector:
+    """
+    Energy-based voice activity detection over fixed-size frames.
+
+    A frame is voiced when its energy clears a threshold that adapts to the
+    clip: a margin above the noise floor (a low percentile of frame
+    energies), but never above the margin below the loudest frame nor under
+    the absolute floor. Voiced runs are padded, pauses shorter than
+    min_silence_ms are bridged and blips shorter than min_speech_ms dropped.
+    """
+
+    def __init__(self, frame_ms: float = 30, threshold_db: float = -50, margin_db: float = 10,
+                 noise_percentile: float = 10, min_speech_ms: float = 120,
+                 min_silence_ms: float = 300, padding_ms: float = 90,
+                 sample_rate: int = WHISPER_SAMPLE_RATE):
+        self.frame = max(1, int(sample_rate * frame_ms / 1000))
+        self.threshold_db = threshold_db
+        self.margin_db = margin_db
+        self.noise_percentile = noise_percentile
+        self.min_speech_frames = int(np.ceil(min_speech_ms / frame_ms))
+        self.min_silence_frames = int(np.ceil(min_silence_ms / frame_ms))
+        self.padding_frames = int(np.ceil(padding_ms / frame_ms))
+        self.sample_rate = sample_rate
+
+    def frame_energy(self, samples: np.ndarray) -> np.ndarray:
+        """Energy of each whole frame in dBFS"""
+        n_frames = len(samples) // self.frame
+        frames = samples[:n_frames * self.frame].reshape(n_frames, self.frame)
+        return 10 * np.log10(np.mean(np.square(frames, dtype=np.float64), axis=1) + 1e-10)
+
+    def segments(self, samples: np.ndarray) -> List[Tuple[int, int]]:
+        """
+        Find the voiced parts of a clip.
+
+        Args:
+            samples: Mono samples at the detector's sample rate
+
+        Returns:
+            List[Tuple[int, int]]: (start, end) sample offsets of each utterance
+        """
+        energy = self.frame_energy(samples)
+        if len(energy) == 0:
+            return []
+        noise_floor = np.percentile(energy, self.noise_percentile)
+        threshold = max(self.threshold_db,
+                        min(noise_floor + self.margin_db, energy.max() - self.margin_db))
+        voiced = energy > threshold
+        if self.padding_frames:
+            window = np.ones(2 * self.padding_frames + 1)
+            voiced = np.convolve(voiced, window, mode="same") > 0
+
+        edges = np.diff(np.concatenate(([0], voiced.astype(np.int8), [0])))
+        starts, ends = np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)
+        if len(starts) > 1:
+            keep_gap = starts[1:] - ends[:-1] >= self.min_silence_frames
+            starts = starts[np.concatenate(([True], keep_gap))]
+            ends = ends[np.concatenate((keep_gap, [True]))]
+        long_enough = ends - starts >= self.min_speech_frames
+        starts, ends = starts[long_enough] * self.frame, ends[long_enough] * self.frame
+        if len(ends) and ends[-1] == len(energy) * self.frame:
+            ends[-1] = len(samples)
+        return list(zip(starts.tolist(), ends.tolist()))
+
+    def trim(self, samples: np.ndarray, gap_ms: float = 100) -> Tuple[np.ndarray, List[Tuple[int, int]]]:
+        """Keep only the voiced segments, joined by short gaps of silence"""
+        segments = self.segments(samples)
+        if not segments:
+            return samples[:0], segments
+        gap = np.zeros(int(self.sample_rate * gap_ms / 1000), dtype=samples.dtype)
+        pieces = []
+        for start, end in segments:
+            if pieces:
+                pieces.append(gap)
+            pieces.append(samples[start:end])
+        return np.concatenate(pieces), segments
@@ -0,0 +1,171 @@
+from itertools import chain
+from types import SimpleNamespace
+from typing import Dict, List, Optional, Sequence
+import numpy as np
+from nltk.sentiment.vader import SentimentIntensityAnalyzer
+from app.services.sentiment_lexicon import get_analyzer
+
+
+class BatchSentimentScorer:
+    """
+    Score many texts at once with results identical to VADER.
+
+    Every text is tokenized once, with the same rules as NLTK's SentiText.
+    Lexicon lookups go through a vocabulary built for the whole batch, so
+    each distinct token is looked up once. The per-token context rules
+    (negation, boosters, idioms, caps) run only for lexicon hits, reusing
+    the analyzer's own implementation, since every other token scores 0.
+    The "but" rule, punctuation emphasis, normalization and the pos/neg/neu
+    split run as NumPy array operations over the whole batch.
+    """
+
+    def __init__(self, analyzer: Optional[SentimentIntensityAnalyzer] = None):
+        self.analyzer = analyzer or get_analyzer()
+        self.lexicon = self.analyzer.lexicon
+        self.constants = self.analyzer.constants
+        self.punc_set = set(self.constants.PUNC_LIST)
+        self.punc_chars = "".join(sorted(set("".join(self.punc_set))))
+
+    def tokenize(self, text: str) -> List[str]:
+        """Split text the way SentiText does: drop one-character tokens and
+        strip a single leading or trailing punctuation run from words"""
+        if not isinstance(text, str):
+            text = str(text.encode("utf-8"))
+        tokens = [we for we in text.split() if len(we) > 1]
+        if not any(we[0] in self.punc_chars or we[-1] in self.punc_chars for we in tokens):
+            return tokens
+        no_punc_text = self.constants.REGEX_REMOVE_PUNCTUATION.sub("", text)
+        words_only = {w for w in no_punc_text.split() if len(w) > 1}
+        for i, we in enumerate(tokens):
+            if we[0] in self.punc_chars or we[-1] in self.punc_chars:
+                tokens[i] = self._strip_punctuation(we, words_only)
+        return tokens
+
+    def _strip_punctuation(self, token: str, words_only: set) -> str:
+        # Words in words_only carry no punctuation, so the only candidate is
+        # the token with its whole punctuation run removed, and that run has
+        # to be a single PUNC_LIST entry. Trailing punctuation wins, as in
+        # SentiText's lookup table.
+        core = token.rstrip(self.punc_chars)
+        if token[len(core):] in self.punc_set and core in words_only:
+            return core
+        core = token.lstrip(self.punc_chars)
+        if token[:len(token) - len(core)] in self.punc_set and core in words_only:
+            return core
+        return token
+
+    def score(self, texts: Sequence[str]) -> List[Dict[str, float]]:
+        """
+        Score a batch of texts.
+
+        Args:
+            texts: Texts to score
+
+        Returns:
+            List[Dict[str, float]]: neg/neu/pos/compound per text, in order
+        """
+        n = len(texts)
+        if n == 0:
+            return []
+        texts = [t if isinstance(t, str) else str(t.encode("utf-8")) for t in texts]
+        token_lists = [self.tokenize(text) for text in texts]
+        lengths = np.fromiter(map(len, token_lists), dtype=np.int64, count=n)
+        starts = np.concatenate(([0], np.cumsum(lengths)[:-1]))
+        flat = list(chain.from_iterable(token_lists))
+        total_tokens = len(flat)
+
+        # Look every distinct lowercased token up once
+        vocabulary: Dict[str, int] = {}
+        codes = np.fromiter(
+            (vocabulary.setdefault(token.lower(), len(vocabulary)) for token in flat),
+            dtype=np.int64, count=total_tokens
+        )
+        words = list(vocabulary)
+        scored_word = np.fromiter(
+            (w in self.lexicon and w not in self.constants.BOOSTER_DICT for w in words),
+            dtype=bool, count=len(words)
+        )
+        but_word = np.fromiter((w == "but" for w in words), dtype=bool, count=len(words))
+
+        text_index = np.repeat(np.arange(n), lengths)
+        position = np.arange(total_tokens) - np.repeat(starts, lengths)
+        valence = np.zeros(total_tokens)
+        sentitexts: Dict[int, SimpleNamespace] = {}
+        memo: Dict[tuple, float] = {}
+        for k in np.flatnonzero(scored_word[codes]):
+            j = int(text_index[k])
+            if j not in sentitexts:
+                sentitexts[j] = SimpleNamespace(
+                    words_and_emoticons=token_lists[j],
+                    is_cap_diff=self._cap_differential(token_lists[j])
+                )
+            valence[k] = self._token_valence(sentitexts[j], flat[k], memo)
+
+        # "but" halves what comes before it and boosts what follows
+        but_tokens = np.flatnonzero(but_word[codes])
+        if but_tokens.size:
+            but_texts, first = np.unique(text_index[but_tokens], return_index=True)
+            but_position = np.full(n, -1)
+            but_position[but_texts] = position[but_tokens[first]]
+            token_but = but_position[text_index]
+            has_but = token_but >= 0
+            valence = np.where(has_but & (position < token_but), valence * 0.5, valence)
+            valence = np.where(has_but & (position > token_but), valence * 1.5, valence)
+
+        positive = valence > 0
+        negative = valence < 0
+        sum_s = np.bincount(text_index, weights=valence, minlength=n)
+        pos_sum = np.bincount(text_index[positive], weights=valence[positive] + 1, minlength=n)
+        neg_sum = np.bincount(text_index[negative], weights=valence[negative] - 1, minlength=n)
+        neu_count = np.bincount(text_index[valence == 0], minlength=n)
+
+        ep_count = np.minimum(np.fromiter((t.count("!") for t in texts), dtype=np.int64, count=n), 4)
+        qm_count = np.fromiter((t.count("?") for t in texts), dtype=np.int64, count=n)
+        qm_amplifier = np.where(qm_count > 1, np.where(qm_count <= 3, qm_count * 0.18, 0.96), 0.0)
+        amplifier = ep_count * 0.292 + qm_amplifier
+
+        sum_s = np.where(sum_s > 0, sum_s + amplifier, np.where(sum_s < 0, sum_s - amplifier, sum_s))
+        compound = sum_s / np.sqrt(sum_s * sum_s + 15)
+
+        abs_neg = np.fabs(neg_sum)
+        pos_dominant = pos_sum > abs_neg
+        neg_dominant = pos_sum < abs_neg
+        pos_sum = np.where(pos_dominant, pos_sum + amplifier, pos_sum)
+        neg_sum = np.where(neg_dominant, neg_sum - amplifier, neg_sum)
+        total = pos_sum + np.fabs(neg_sum) + neu_count
+        has_tokens = lengths > 0
+        safe_total = np.where(has_tokens, total, 1.0)
+        pos = np.where(has_tokens, np.fabs(pos_sum / safe_total), 0.0)
+        neg = np.where(has_tokens, np.fabs(neg_sum / safe_total), 0.0)
+        neu = np.where(has_tokens, np.fabs(neu_count / safe_total), 0.0)
+        compound = np.where(has_tokens, compound, 0.0)
+
+        return [
+            {
+                "neg": round(float(neg[j]), 3),
+                "neu": round(float(neu[j]), 3),
+                "pos": round(float(pos[j]), 3),
+                "compound": round(float(compound[j]), 4)
+            }
+            for j in range(n)
+        ]
+
+    def _token_valence(self, sentitext: SimpleNamespace, item: str, memo: Dict[tuple, float]) -> float:
+        tokens = sentitext.words_and_emoticons
+        # VADER evaluates every occurrence of a token at its first position
+        i = tokens.index(item)
+        if (i < len(tokens) - 1 and item.lower() == "kind"
+                and tokens[i + 1].lower() == "of"):
+            return 0.0
+        # The rules only look three tokens back and two ahead, so the same
+        # window always yields the same valence
+        key = (tuple(tokens[max(0, i - 3):i + 3]), min(i, 3), sentitext.is_cap_diff)
+        if key not in memo:
+            memo[key] = self.analyzer.sentiment_valence(0, sentitext, item, i, [])[-1]
+        return memo[key]
+
+    @staticmethod
+    def _cap_differential(tokens: List[str]) -> bool:
+        """True when some but not all tokens are ALL CAPS"""
+        allcaps = sum(1 for token in tokens if token.isupper())
+        return 0 < len(tokens) - allcaps < len(tokens)
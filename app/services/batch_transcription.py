@@ -0,0 +1,284 @@
+"""
+Transcribe and score a directory of recorded calls.
+
+Recordings are decoded, resampled and cut into utterances by a pool of
+worker processes while the model transcribes the previous group, so
+decoding scales with cores and never leaves the model idle. Utterances
+from a group of recordings are sorted by length and transcribed in
+batches of similar length: a batch runs until its longest transcript is
+decoded, so mixing a one-word answer with a 30-second explanation would
+keep the short one's slot busy for nothing. Every recording becomes a
+completed CallSimulation with one Message per utterance, scored for
+sentiment.
+
+Finished files are appended to a JSONL manifest, so an interrupted run
+skips them when started again. A recording's call id is derived from its
+path, so one that was written but not yet in the manifest is replaced
+rather than duplicated.
+
+    python -m app.services.batch_transcription /recordings/2024-05-01 --workers 8
+    SPEECH_SERVER_AUTHKEY=... SPEECH_SERVER_ADDRESS=127.0.0.1:6390 python -m app.services.batch_transcription /recordings/2024-05-01
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Set
+import numpy as np
+from app.core.logger import logger
+from app.database import SessionLocal, init_db
+from app.models.models import CallSimulation, Message
+from app.services.audio_processing import WHISPER_SAMPLE_RATE, VoiceActivityDetector, load_audio
+from app.services.sentiment_service import SentimentService
+from app.services.speech_server import Clip, SpeechClient, create_transcriber
+
+DEFAULT_MANIFEST = Path("data") / "batch_transcription.jsonl"
+AUDIO_SUFFIXES = {".wav", ".flac", ".ogg", ".mp3"}
+RECORDING_TAG = "recording"
+# Whisper decodes 30 s windows; longer utterances are split to fit one
+MAX_UTTERANCE_SECONDS = 30
+
+_worker_vad: Optional[VoiceActivityDetector] = None
+
+
+def _init_worker() -> None:
+    global _worker_vad
+    _worker_vad = VoiceActivityDetector()
+
+
+def prepare_recording(path: str) -> Dict[str, Any]:
+    """
+    Decode a recording to 16 kHz and cut it into utterances, in a worker process.
+
+    Returns:
+        Dict with the file, its duration and utterances, or an error
+    """
+    try:
+        with open(path, "rb") as f:
+            samples = load_audio(f.read())
+    except Exception as e:
+        return {"file": path, "error": str(e)}
+
+    vad = _worker_vad or VoiceActivityDetector()
+    limit = MAX_UTTERANCE_SECONDS * WHISPER_SAMPLE_RATE
+    utterances = []
+    for start, end in vad.segments(samples):
+        for piece_start in range(start, end, limit):
+            piece_end = min(piece_start + limit, end)
+            utterances.append((
+                piece_start / WHISPER_SAMPLE_RATE,
+                piece_end / WHISPER_SAMPLE_RATE,
+                samples[piece_start:piece_end].copy()
+            ))
+    return {"file": path, "duration": len(samples) / WHISPER_SAMPLE_RATE, "utterances": utterances}
+
+
+def call_id_for(path: Path) -> str:
+    """Stable call id for a recording, so reruns replace rather than duplicate"""
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, Path(path).resolve().as_uri()))
+
+
+def length_batches(lengths: List[int], batch_size: int) -> List[List[int]]:
+    """Indices grouped into batches of similar length, longest first"""
+    order = sorted(range(len(lengths)), key=lambda i: lengths[i], reverse=True)
+    return [order[i:i + batch_size] for i in range(0, len(order), batch_size)]
+
+
+class BatchTranscriber:
+    def __init__(self, session_factory=SessionLocal,
+                 transcribe_batch: Optional[Callable[[List[Clip]], List[str]]] = None,
+                 workers: Optional[int] = None, batch_size: int = 8, group_size: int = 16,
+                 manifest_path: Path = DEFAULT_MANIFEST,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.session_factory = session_factory
+        self.transcribe_batch = transcribe_batch or create_transcriber().transcribe_batch
+        self.workers = workers or os.cpu_count() or 1
+        self.batch_size = batch_size
+        self.group_size = group_size
+        self.manifest_path = Path(manifest_path)
+        self.progress = progress or self._log_progress
+        self.sentiment_service = SentimentService()
+        self.batches: List[int] = []
+
+    def completed_files(self) -> Set[str]:
+        try:
+            with open(self.manifest_path) as f:
+                return {json.loads(line)["file"] for line in f if line.strip()}
+        except FileNotFoundError:
+            return set()
+
+    def _record_done(self, entry: Dict[str, Any]) -> None:
+        self.manifest_path.parent.mkdir(parents=True, exist_ok=True)
+        with open(self.manifest_path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
+
+    def scan(self, directory: Path) -> List[Path]:
+        """Recordings under directory that are not in the manifest yet"""
+        done = self.completed_files()
+        return [
+            path for path in sorted(Path(directory).rglob("*"))
+            if path.suffix.lower() in AUDIO_SUFFIXES and str(path.resolve()) not in done
+        ]
+
+    def run(self, directory: Path) -> Dict[str, Any]:
+        """
+        Transcribe and score every recording under directory not yet in the manifest.
+
+        Returns:
+            Dict with the number of recordings, utterances and failures,
+            the audio duration and how many times faster than real time
+            the run was
+        """
+        paths = self.scan(directory)
+        started = time.monotonic()
+        totals = {"recordings": 0, "utterances": 0, "failed": 0, "audio_seconds": 0.0}
+        group: List[Dict[str, Any]] = []
+        for prepared in self._prepare([str(path.resolve()) for path in paths]):
+            if "error" in prepared:
+                logger.error(f"Could not decode recording {prepared['file']}: {prepared['error']}")
+                totals["failed"] += 1
+                continue
+            group.append(prepared)
+            if len(group) >= self.group_size:
+                self._finish_group(group, totals, started, len(paths))
+                group = []
+        if group:
+            self._finish_group(group, totals, started, len(paths))
+
+        elapsed = time.monotonic() - started
+        return dict(
+            totals,
+            audio_seconds=round(totals["audio_seconds"], 1),
+            seconds=round(elapsed, 3),
+            realtime_factor=round(totals["audio_seconds"] / elapsed, 1) if elapsed else 0.0
+        )
+
+    def _prepare(self, paths: List[str]) -> Iterator[Dict[str, Any]]:
+        """Decode recordings in order, keeping a bounded number in flight"""
+        if self.workers == 1:
+            _init_worker()
+            for path in paths:
+                yield prepare_recording(path)
+            return
+
+        with multiprocessing.Pool(self.workers, initializer=_init_worker) as pool:
+            pending: Deque = deque()
+            for path in paths:
+                pending.append(pool.apply_async(prepare_recording, (path,)))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+    def _finish_group(self, group: List[Dict[str, Any]], totals: Dict[str, Any], started: float,
+                      total_files: int) -> None:
+        utterances = [u for recording in group for u in recording["utterances"]]
+        texts = self._transcribe([samples for _, _, samples in utterances])
+        offset = 0
+        for recording in group:
+            count = len(recording["utterances"])
+            self._save(recording, texts[offset:offset + count])
+            offset += count
+            totals["recordings"] += 1
+            totals["utterances"] += count
+            totals["audio_seconds"] += recording["duration"]
+        elapsed = time.monotonic() - started
+        self.progress({
+            "recordings": totals["recordings"],
+            "total": total_files,
+            "realtime_factor": totals["audio_seconds"] / elapsed if elapsed else 0.0
+        })
+
+    def _transcribe(self, clips: List[np.ndarray]) -> List[str]:
+        texts: List[str] = [""] * len(clips)
+        for batch in length_batches([len(clip) for clip in clips], self.batch_size):
+            self.batches.append(len(batch))
+            for i, text in zip(batch, self.transcribe_batch([clips[i] for i in batch])):
+                texts[i] = text.strip()
+        return texts
+
+    def _save(self, recording: Dict[str, Any], texts: List[str]) -> None:
+        path = Path(recording["file"])
+        simulation_id = call_id_for(path)
+        start_time = datetime.utcfromtimestamp(path.stat().st_mtime) - timedelta(seconds=recording["duration"])
+        spoken = [(utterance, text) for utterance, text in zip(recording["utterances"], texts) if text]
+        scores = [s["compound"] for s in self.sentiment_service.analyze_many([text for _, text in spoken])]
+
+        db = self.session_factory()
+        try:
+            # A rerun after a crash replaces what the earlier attempt wrote
+            db.query(Message).filter(Message.simulation_id == simulation_id).delete()
+            db.query(CallSimulation).filter(CallSimulation.id == simulation_id).delete()
+            db.add(CallSimulation(
+                id=simulation_id,
+                status="completed",
+                start_time=start_time,
+                end_time=start_time + timedelta(seconds=recording["duration"]),
+                notes=[],
+                tags=[RECORDING_TAG],
+                quality_metrics={"source_file": str(path), "duration_seconds": round(recording["duration"], 2)},
+                sentiment_score=round(float(np.mean(scores)), 4) if scores else 0.0,
+                resolution_time=int(recording["duration"])
+            ))
+            db.add_all([
+                Message(
+                    simulation_id=simulation_id,
+                    content=text[:1000],
+                    sender="user",
+                    timestamp=start_time + timedelta(seconds=start),
+                    sentiment_score=score
+                )
+                for ((start, _, _), text), score in zip(spoken, scores)
+            ])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        self._record_done({"file": str(path), "simulation_id": simulation_id, "utterances": len(spoken)})
+
+    @staticmethod
+    def _log_progress(progress: Dict[str, Any]) -> None:
+        logger.info(
+            f"Batch transcription: {progress['recordings']}/{progress['total']} recordings, "
+            f"{progress['realtime_factor']:.1f}x real time"
+        )
+
+
+def _server_transcribe_batch(address: str) -> Callable[[List[Clip]], List[str]]:
+    # Send a batch's clips concurrently so the server batches them again
+    client = SpeechClient(address)
+    executor = ThreadPoolExecutor(max_workers=16, thread_name_prefix="batch-stt")
+    return lambda clips: list(executor.map(client.transcribe, clips))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Transcribe and score a directory of call recordings")
+    parser.add_argument("directory", type=Path)
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="decoding processes")
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--manifest", type=Path, default=DEFAULT_MANIFEST)
+    options = parser.parse_args()
+    init_db()
+    server_address = os.getenv("SPEECH_SERVER_ADDRESS")
+    transcriber = BatchTranscriber(
+        transcribe_batch=_server_transcribe_batch(server_address) if server_address else None,
+        workers=options.workers,
+        batch_size=options.batch_size,
+        manifest_path=options.manifest,
+        progress=lambda p: print(
+            f"\r{p['recordings']}/{p['total']} recordings, {p['realtime_factor']:.1f}x real time",
+            end="", flush=True
+        )
+    )
+    summary = transcriber.run(options.directory)
+    print(f"\nTranscribed {summary['recordings']} recordings ({summary['utterances']} utterances, "
+          f"{summary['audio_seconds']}s of audio) in {summary['seconds']}s, "
+          f"{summary['realtime_factor']}x real time; {summary['failed']} failed")
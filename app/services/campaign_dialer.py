@@ -0,0 +1,296 @@
+"""
+Outbound call campaigns.
+
+Calls are placed through Twilio's REST API on one pooled async HTTP
+client. A token bucket spaces call creation to calls_per_second, and a
+semaphore caps the calls that are live at once: a slot is taken before a
+call is placed and given back when Twilio reports the call has ended
+(through the status callback, which any worker may receive, so the
+dialer reads outcomes from the database). Rate limiting, server errors
+and network failures are retried with full-jitter exponential backoff;
+other API errors fail the number. Every number's outcome is stored in
+campaign_calls.
+"""
+import asyncio
+import os
+import random
+import time
+import uuid
+from typing import Dict, List, Optional, Tuple
+import httpx
+from sqlalchemy import func, update
+from app.core.logger import logger
+from app.database import SessionLocal
+from app.models.models import CampaignCall
+
+TWILIO_API_BASE = "https://api.twilio.com"
+# Twilio call statuses after which the line is free again
+FINAL_STATUSES = {"completed", "busy", "no-answer", "failed", "canceled"}
+# Worth another attempt: rate limited, or Twilio had a problem
+TRANSIENT_STATUS_CODES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """Allows rate events per second on average, in bursts of at most burst"""
+
+    def __init__(self, rate: float, burst: float = 1, clock=time.monotonic):
+        self.rate = rate
+        self.burst = burst
+        self.clock = clock
+        self._tokens = burst
+        self._updated = clock()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        async with self._lock:
+            while True:
+                now = self.clock()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class TransientCallError(Exception):
+    pass
+
+
+class CampaignDialer:
+    def __init__(self, account_sid: Optional[str], auth_token: Optional[str], from_number: Optional[str],
+                 public_base_url: Optional[str] = None, session_factory=SessionLocal,
+                 calls_per_second: Optional[float] = None, max_live_calls: Optional[int] = None,
+                 max_attempts: int = 4, backoff_base: float = 1.0, backoff_max: float = 30.0,
+                 poll_interval: float = 1.0, max_call_seconds: float = 3600,
+                 api_base: str = TWILIO_API_BASE, transport: Optional[httpx.AsyncBaseTransport] = None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
+        self.from_number = from_number
+        self.public_base_url = (public_base_url or os.getenv("PUBLIC_BASE_URL", "")).rstrip("/")
+        self.session_factory = session_factory
+        self.calls_per_second = calls_per_second or float(os.getenv("CAMPAIGN_CALLS_PER_SECOND", "1"))
+        self.max_live_calls = max_live_calls or int(os.getenv("CAMPAIGN_MAX_LIVE_CALLS", "10"))
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.poll_interval = poll_interval
+        self.max_call_seconds = max_call_seconds
+        self.api_base = api_base
+        self.transport = transport
+        # Shared by every campaign: the caps are the account's, not a campaign's
+        self._bucket = TokenBucket(self.calls_per_second)
+        self._slots = asyncio.Semaphore(self.max_live_calls)
+        self._live: Dict[str, Tuple[str, float]] = {}  # call sid -> (campaign id, placed at)
+        self._watcher: Optional[asyncio.Task] = None
+        self._runs = 0
+
+    def create_campaign(self, numbers: List[str]) -> str:
+        """Store a campaign's numbers; returns the campaign id to run"""
+        campaign_id = str(uuid.uuid4())
+        db = self.session_factory()
+        try:
+            db.add_all([CampaignCall(campaign_id=campaign_id, to_number=number) for number in numbers])
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+        return campaign_id
+
+    def record_status(self, call_sid: str, status: str, duration: Optional[str] = None,
+                      campaign_call: Optional[str] = None) -> bool:
+        """
+        Apply a status callback from Twilio.
+
+        Args:
+            call_sid: Twilio's CallSid
+            status: Twilio's CallStatus
+            duration: CallDuration, sent with the final status
+            campaign_call: The campaign_call row id from the callback URL; a
+                short call can end before the call's sid is stored
+
+        Returns:
+            False for calls that are not ours
+        """
+        if campaign_call is not None and not campaign_call.isdigit():
+            return False
+        db = self.session_factory()
+        try:
+            values = {"status": status}
+            if duration:
+                values["duration"] = int(duration)
+            row = CampaignCall.id == int(campaign_call) if campaign_call else CampaignCall.call_sid == call_sid
+            # Callbacks can arrive out of order; a late "ringing" must not undo "completed"
+            updated = db.execute(
+                update(CampaignCall).where(row, CampaignCall.status.notin_(FINAL_STATUSES)).values(**values)
+            ).rowcount
+            db.commit()
+            return updated > 0 or db.query(CampaignCall.id).filter(row).first() is not None
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def summary(self, campaign_id: str) -> Optional[Dict]:
+        """Numbers per status, or None for an unknown campaign"""
+        db = self.session_factory()
+        try:
+            counts = dict(
+                db.query(CampaignCall.status, func.count(CampaignCall.id))
+                .filter(CampaignCall.campaign_id == campaign_id)
+                .group_by(CampaignCall.status)
+                .all()
+            )
+            attempts = db.query(func.sum(CampaignCall.attempts)).filter(
+                CampaignCall.campaign_id == campaign_id
+            ).scalar()
+        finally:
+            db.close()
+        if not counts:
+            return None
+        return {"campaign_id": campaign_id, "numbers": sum(counts.values()), "statuses": counts,
+                "attempts": attempts or 0}
+
+    async def run(self, campaign_id: str) -> Dict:
+        """
+        Call every pending number in a campaign and wait for the calls to end.
+
+        Returns:
+            Dict: The campaign summary, with the run's duration
+        """
+        started = time.monotonic()
+        pending = await asyncio.to_thread(self._pending, campaign_id)
+        self._runs += 1
+        try:
+            if self._watcher is None or self._watcher.done():
+                self._watcher = asyncio.create_task(self._watch_live_calls())
+            limits = httpx.Limits(max_connections=self.max_live_calls,
+                                  max_keepalive_connections=self.max_live_calls)
+            async with httpx.AsyncClient(base_url=self.api_base,
+                                         auth=(self.account_sid or "", self.auth_token or ""),
+                                         transport=self.transport, limits=limits, timeout=10.0) as client:
+                tasks = set()
+                for row_id, number in pending:
+                    await self._slots.acquire()
+                    task = asyncio.create_task(self._place(client, campaign_id, row_id, number))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+                if tasks:
+                    await asyncio.gather(*tasks)
+            while any(campaign == campaign_id for campaign, _ in self._live.values()):
+                await asyncio.sleep(self.poll_interval)
+        finally:
+            self._runs -= 1
+
+        summary = await asyncio.to_thread(self.summary, campaign_id)
+        summary["seconds"] = round(time.monotonic() - started, 2)
+        logger.info(f"Campaign {campaign_id} finished: {summary['statuses']}")
+        return summary
+
+    def _pending(self, campaign_id: str) -> List[Tuple[int, str]]:
+        db = self.session_factory()
+        try:
+            return [
+                (row.id, row.to_number) for row in db.query(CampaignCall.id, CampaignCall.to_number)
+                .filter(CampaignCall.campaign_id == campaign_id, CampaignCall.status == "pending")
+                .order_by(CampaignCall.id)
+            ]
+        finally:
+            db.close()
+
+    async def _place(self, client: httpx.AsyncClient, campaign_id: str, row_id: int, number: str) -> None:
+        """Place one call; holds a live slot on entry, keeps it if the call is placed"""
+        for attempt in range(1, self.max_attempts + 1):
+            await self._bucket.acquire()
+            try:
+                call_sid, status = await self._create_call(client, row_id, number)
+            except TransientCallError as e:
+                if attempt == self.max_attempts:
+                    await asyncio.to_thread(self._update, row_id, status="error", attempts=attempt,
+                                            last_error=str(e)[:500])
+                    break
+                # Not a live call while backing off, so give the slot back
+                self._slots.release()
+                await asyncio.sleep(random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** (attempt - 1))))
+                await self._slots.acquire()
+                continue
+            except Exception as e:
+                logger.warning(f"Could not call {number}: {str(e)}")
+                await asyncio.to_thread(self._update, row_id, status="error", attempts=attempt,
+                                        last_error=str(e)[:500])
+                break
+            self._live[call_sid] = (campaign_id, time.monotonic())
+            await asyncio.to_thread(self._update, row_id, attempts=attempt, call_sid=call_sid, last_error=None)
+            # Unless the status callback has already moved it on
+            await asyncio.to_thread(self._update, row_id, only_if_pending=True, status=status)
+            return
+        self._slots.release()
+
+    async def _create_call(self, client: httpx.AsyncClient, row_id: int, number: str) -> Tuple[str, str]:
+        try:
+            response = await client.post(
+                f"/2010-04-01/Accounts/{self.account_sid}/Calls.json",
+                data={
+                    "To": number,
+                    "From": self.from_number,
+                    "Url": f"{self.public_base_url}/api/voice/handle-call",
+                    "StatusCallback": f"{self.public_base_url}/api/voice/status?campaign_call={row_id}",
+                    "StatusCallbackEvent": ["initiated", "ringing", "answered", "completed"],
+                    "StatusCallbackMethod": "POST"
+                }
+            )
+        except httpx.TransportError as e:
+            raise TransientCallError(f"{type(e).__name__}: {str(e)}")
+        if response.status_code in TRANSIENT_STATUS_CODES:
+            raise TransientCallError(f"HTTP {response.status_code}: {response.text[:200]}")
+        if response.status_code >= 400:
+            raise ValueError(f"HTTP {response.status_code}: {response.text[:200]}")
+        body = response.json()
+        return body["sid"], body.get("status", "queued")
+
+    def _update(self, row_id: int, only_if_pending: bool = False, **values) -> None:
+        db = self.session_factory()
+        try:
+            statement = update(CampaignCall).where(CampaignCall.id == row_id)
+            if only_if_pending:
+                statement = statement.where(CampaignCall.status == "pending")
+            db.execute(statement.values(**values))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    async def _watch_live_calls(self) -> None:
+        """Free the slots of calls that have ended; stops once no campaign is running"""
+        while self._runs or self._live:
+            await asyncio.sleep(self.poll_interval)
+            if not self._live:
+                continue
+            try:
+                statuses = await asyncio.to_thread(self._statuses, list(self._live))
+            except Exception as e:
+                logger.error(f"Error reading campaign call statuses: {str(e)}")
+                continue
+            now = time.monotonic()
+            for call_sid, (_, placed_at) in list(self._live.items()):
+                if statuses.get(call_sid) in FINAL_STATUSES or now - placed_at > self.max_call_seconds:
+                    if statuses.get(call_sid) not in FINAL_STATUSES:
+                        logger.warning(f"No final status for call {call_sid}, freeing its slot")
+                    del self._live[call_sid]
+                    self._slots.release()
+
+    def _statuses(self, call_sids: List[str]) -> Dict[str, str]:
+        db = self.session_factory()
+        try:
+            return dict(
+                db.query(CampaignCall.call_sid, CampaignCall.status)
+                .filter(CampaignCall.call_sid.in_(call_sids))
+                .all()
+            )
+        finally:
+            db.close()
@@ -0,0 +1,144 @@
+import heapq
+import threading
+import time
+from datetime import datetime
+from typing import Callable, List, Optional, Set, Tuple
+from app.core.logger import logger
+from app.core.state import StateBackend, InProcessStateBackend
+
+ExpireCallback = Callable[[str, datetime, bool], None]
+
+ACTIVITY_KEY = "calls:activity"
+
+
+class CallLifecycleScheduler:
+    """
+    Expire in-progress simulations that stop receiving activity.
+
+    Every tracked call owns exactly one entry in a min-heap keyed by its idle
+    deadline. Touching a call only records the new activity time; when a stale
+    entry reaches the top of the heap it is pushed back at the real deadline.
+    A tick therefore only looks at calls whose deadline has passed, never at
+    the whole set of active calls.
+
+    Activity times live in the state backend, so with several workers each
+    one re-arms against the latest activity seen anywhere and exactly one
+    of them reaps an idle call.
+    """
+
+    def __init__(self, on_expire: ExpireCallback, idle_timeout: float = 300,
+                 clock: Callable[[], float] = time.time,
+                 state_backend: Optional[StateBackend] = None):
+        self.on_expire = on_expire
+        self.idle_timeout = idle_timeout
+        self.clock = clock
+        # Activity is shared through the state backend so any worker can see
+        # that a call it scheduled was touched by another one
+        self.state_backend = state_backend or InProcessStateBackend()
+        self._heap: List[Tuple[float, str]] = []
+        self._scheduled: Set[str] = set()
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._stopping = False
+
+    def _read_activity(self, simulation_id: str) -> Optional[Tuple[float, bool]]:
+        value = self.state_backend.hget(ACTIVITY_KEY, simulation_id)
+        if value is None:
+            return None
+        timestamp, engaged = value.split(":")
+        return float(timestamp), engaged == "1"
+
+    def touch(self, simulation_id: str, engaged: bool = False,
+              timestamp: Optional[float] = None) -> None:
+        """Record activity for a call and (re)arm its idle deadline"""
+        now = self.clock() if timestamp is None else timestamp
+        with self._cond:
+            previous = self._read_activity(simulation_id)
+            if previous is not None:
+                now, engaged = max(now, previous[0]), engaged or previous[1]
+            self.state_backend.hset(ACTIVITY_KEY, simulation_id, f"{now}:{int(engaged)}")
+            if simulation_id in self._scheduled:
+                return
+            self._scheduled.add(simulation_id)
+            heapq.heappush(self._heap, (now + self.idle_timeout, simulation_id))
+            if self._heap[0][1] == simulation_id:
+                self._cond.notify()
+
+    def forget(self, simulation_id: str) -> None:
+        """Stop tracking a call; its heap entry is dropped when it surfaces"""
+        self.state_backend.hdel(ACTIVITY_KEY, simulation_id)
+
+    def is_tracked(self, simulation_id: str) -> bool:
+        return self._read_activity(simulation_id) is not None
+
+    @property
+    def active_count(self) -> int:
+        return len(self.state_backend.hgetall(ACTIVITY_KEY))
+
+    def run_pending(self, now: Optional[float] = None) -> List[str]:
+        """
+        Expire every call whose idle deadline has passed.
+
+        Args:
+            now: Current timestamp, defaults to the scheduler clock
+
+        Returns:
+            List[str]: IDs of the calls that were expired
+        """
+        now = self.clock() if now is None else now
+        expired: List[Tuple[str, float, bool]] = []
+        with self._cond:
+            while self._heap and self._heap[0][0] <= now:
+                _, simulation_id = heapq.heappop(self._heap)
+                activity = self._read_activity(simulation_id)
+                if activity is None:
+                    self._scheduled.discard(simulation_id)
+                    continue
+                last_activity, engaged = activity
+                deadline = last_activity + self.idle_timeout
+                if deadline > now:
+                    heapq.heappush(self._heap, (deadline, simulation_id))
+                    continue
+                self._scheduled.discard(simulation_id)
+                # Only the worker whose delete succeeds reaps the call
+                if self.state_backend.hdel(ACTIVITY_KEY, simulation_id):
+                    expired.append((simulation_id, last_activity, engaged))
+
+        for simulation_id, last_activity, engaged in expired:
+            try:
+                self.on_expire(simulation_id, datetime.utcfromtimestamp(last_activity), engaged)
+            except Exception as e:
+                logger.error(f"Error expiring simulation {simulation_id}: {str(e)}")
+        return [simulation_id for simulation_id, _, _ in expired]
+
+    def start(self) -> None:
+        """Run the scheduler in a background thread"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            self._stopping = False
+            self._thread = threading.Thread(target=self._run, name="call-lifecycle", daemon=True)
+            self._thread.start()
+
+    def stop(self) -> None:
+        with self._cond:
+            thread = self._thread
+            self._stopping = True
+            self._cond.notify()
+        if thread is not None:
+            thread.join()
+        self._thread = None
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if self._stopping:
+                    return
+                timeout = None
+                if self._heap:
+                    timeout = max(0.0, self._heap[0][0] - self.clock())
+                if timeout is None or timeout > 0:
+                    self._cond.wait(timeout)
+                if self._stopping:
+                    return
+            self.run_pending()
@@ -1,13 +1,20 @@
-from typing import List, Dict
+from typing import Iterator, List, Dict, Optional
+import hashlib
 import os
 from dotenv import load_dotenv
 import groq
+from app.core.state import StateBackend, InProcessStateBackend
 
 # Load environment variables
 load_dotenv()
 
 class LLMService:
-    def __init__(self):
+    model = "mixtral-8x7b-32768"
+    temperature = 0.7
+    max_tokens = 1000
+    top_p = 1
+
+    def __init__(self, state_backend: Optional[StateBackend] = None, cache_ttl: Optional[float] = None):
         self.api_key = os.getenv("GROQ_API_KEY")
         if not self.api_key:
             raise ValueError("GROQ_API_KEY not found in environment variables")
@@ -21,28 +28,92 @@ class LLMService:
 4. Keep responses concise but informative
 5. Use a natural, conversational tone"""
 
+        # Opt-in: identical prompts get the cached answer for cache_ttl
+        # seconds. The key is only the message, not the conversation, so two
+        # callers saying "yes" get the same reply; only enable it for load
+        # tests and similar. The cache lives in the shared state backend so
+        # every worker benefits
+        self.state_backend = state_backend or InProcessStateBackend()
+        if cache_ttl is None:
+            cache_ttl = float(os.getenv("LLM_CACHE_TTL_SECONDS", "0"))
+        self.cache_ttl = cache_ttl
+
+    def _cache_key(self, message: str) -> str:
+        digest = hashlib.sha256(
+            "\0".join([self.model, str(self.temperature), str(self.max_tokens), str(self.top_p),
+                       self.system_prompt, message]).encode()
+        ).hexdigest()
+        return f"llm:response:{digest}"
+
     def get_response(self, message: str) -> str:
         """Get a response from the LLM"""
+        cache_key = self._cache_key(message) if self.cache_ttl > 0 else None
+        if cache_key:
+            cached = self.state_backend.get(cache_key)
+            if cached is not None:
+                return cached
+
         try:
             chat_completion = self.client.chat.completions.create(
                 messages=[
                     {"role": "system", "content": self.system_prompt},
                     {"role": "user", "content": message}
                 ],
-                model="mixtral-8x7b-32768",
-                temperature=0.7,
-                max_tokens=1000,
-                top_p=1,
+                model=self.model,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                top_p=self.top_p,
                 stream=False
             )
             
-            return chat_completion.choices[0].message.content
+            response = chat_completion.choices[0].message.content
+            if cache_key and response:
+                self.state_backend.set(cache_key, response, ttl=self.cache_ttl)
+            return response
             
         except Exception as e:
             error_msg = str(e)
             print(f"Error in LLM response: {error_msg}")  # Add logging
             raise Exception(f"Error getting LLM response: {error_msg}")
 
+    def stream_response(self, message: str) -> Iterator[str]:
+        """Get a response from the LLM as text deltas, as they are generated"""
+        cache_key = self._cache_key(message) if self.cache_ttl > 0 else None
+        if cache_key:
+            cached = self.state_backend.get(cache_key)
+            if cached is not None:
+                yield cached
+                return
+
+        try:
+            stream = self.client.chat.completions.create(
+                messages=[
+                    {"role": "system", "content": self.system_prompt},
+                    {"role": "user", "content": message}
+                ],
+                model=self.model,
+                temperature=self.temperature,
+                max_tokens=self.max_tokens,
+                top_p=self.top_p,
+                stream=True
+            )
+        except Exception as e:
+            raise Exception(f"Error getting LLM response: {str(e)}")
+
+        parts = []
+        try:
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    parts.append(delta)
+                    yield delta
+        except Exception as e:
+            raise Exception(f"Error getting LLM response: {str(e)}")
+        finally:
+            stream.close()
+        if cache_key and parts:
+            self.state_backend.set(cache_key, "".join(parts), ttl=self.cache_ttl)
+
     def format_conversation_history(self, messages: List[Dict[str, str]]) -> List[Dict[str, str]]:
         """
         Format the conversation history for the LLM.
@@ -0,0 +1,214 @@
+"""
+Simulated network quality for calls.
+
+Each turn of a call sends packets_per_turn voice packets through a model
+of the caller's connection and reports the turn's mean one-way latency,
+jitter and packet loss:
+
+- latency is a base delay plus AR(1) noise, so consecutive packets (and
+  turns) drift together instead of being independent draws, plus rare
+  exponential spikes such as a Wi-Fi retransmission or a cell handover;
+- jitter is the RFC 3550 interarrival jitter estimate over those delays;
+- loss follows a Gilbert-Elliott chain: a good state with little loss and
+  a bad state with bursts of it, so losses cluster as they do on real
+  links rather than being spread evenly.
+
+Profiles describe typical connections; NETWORK_PROFILE picks the default.
+Series are stored as packed little-endian float32 arrays, 4 bytes a
+sample, which numpy reads back without parsing, in chunks of
+CHUNK_SAMPLES so a turn only rewrites the last chunk. Tail latency comes
+from a sketch: counts of samples in SKETCH_BINS log-spaced bins between
+SKETCH_MIN_MS and SKETCH_MAX_MS, which sum across calls and estimate a
+percentile to within one bin (under 4%).
+"""
+import math
+from typing import Dict, Iterable, Optional, Tuple
+import numpy as np
+
+SERIES_DTYPE = np.dtype("<f4")
+CHUNK_SAMPLES = 64
+SKETCH_DTYPE = np.dtype("<u4")
+SKETCH_BINS = 256
+SKETCH_MIN_MS = 1.0
+SKETCH_MAX_MS = 10000.0
+_SKETCH_STEP = math.log(SKETCH_MAX_MS / SKETCH_MIN_MS) / SKETCH_BINS
+
+
+class NetworkProfile:
+    def __init__(self, name: str, latency_ms: float, latency_sd_ms: float, correlation: float,
+                 spike_probability: float, spike_ms: float, p_bad: float, p_recover: float,
+                 loss_good: float, loss_bad: float, min_latency_ms: float = 1.0):
+        """
+        Args:
+            latency_ms: Mean one-way delay
+            latency_sd_ms: Standard deviation of the delay around the mean
+            correlation: AR(1) coefficient between consecutive packets' delays
+            spike_probability: Chance per packet of an extra delay spike
+            spike_ms: Mean size of a spike (exponentially distributed)
+            p_bad: Chance per packet of moving from the good to the bad loss state
+            p_recover: Chance per packet of moving from the bad to the good state
+            loss_good: Loss probability in the good state
+            loss_bad: Loss probability in the bad state
+        """
+        self.name = name
+        self.latency_ms = latency_ms
+        self.latency_sd_ms = latency_sd_ms
+        self.correlation = correlation
+        self.spike_probability = spike_probability
+        self.spike_ms = spike_ms
+        self.p_bad = p_bad
+        self.p_recover = p_recover
+        self.loss_good = loss_good
+        self.loss_bad = loss_bad
+        self.min_latency_ms = min_latency_ms
+
+    @property
+    def expected_loss(self) -> float:
+        """Long-run loss rate of the Gilbert-Elliott chain"""
+        bad_share = self.p_bad / (self.p_bad + self.p_recover)
+        return bad_share * self.loss_bad + (1 - bad_share) * self.loss_good
+
+    @property
+    def expected_jitter_ms(self) -> float:
+        """Mean delay difference between consecutive packets, ignoring spikes"""
+        return math.sqrt(2 / math.pi) * self.latency_sd_ms * math.sqrt(2 * (1 - self.correlation))
+
+
+PROFILES: Dict[str, NetworkProfile] = {
+    profile.name: profile for profile in (
+        NetworkProfile("fiber", 15, 2, 0.9, 0.001, 20, 0.0005, 0.5, 0.0, 0.2),
+        NetworkProfile("broadband", 40, 6, 0.9, 0.002, 40, 0.002, 0.3, 0.001, 0.3),
+        NetworkProfile("wifi-congested", 60, 25, 0.8, 0.02, 80, 0.01, 0.2, 0.005, 0.4),
+        NetworkProfile("4g", 70, 15, 0.95, 0.005, 120, 0.005, 0.25, 0.002, 0.35),
+        NetworkProfile("3g", 150, 40, 0.95, 0.01, 250, 0.02, 0.15, 0.01, 0.5),
+        NetworkProfile("satellite", 600, 30, 0.98, 0.002, 200, 0.003, 0.3, 0.002, 0.3),
+    )
+}
+DEFAULT_PROFILE = "broadband"
+
+
+class NetworkSimulator:
+    """One call's connection; keeps its state from turn to turn"""
+
+    def __init__(self, profile: NetworkProfile, packets_per_turn: int = 50, seed: Optional[int] = None,
+                 deviation_ms: float = 0.0, jitter_ms: Optional[float] = None, bad: bool = False):
+        self.profile = profile
+        self.packets_per_turn = packets_per_turn
+        self.rng = np.random.default_rng(seed)
+        # Delay deviation from the mean (the AR(1) state), jitter estimate, loss state
+        self.deviation_ms = deviation_ms
+        self.jitter_ms = profile.expected_jitter_ms if jitter_ms is None else jitter_ms
+        self.bad = bad
+        self._last_delay: Optional[float] = None
+
+    @classmethod
+    def resume(cls, profile: NetworkProfile, latency_ms: float, jitter_ms: float, packet_loss: float,
+               **kwargs) -> "NetworkSimulator":
+        """Continue a call from its last stored turn, e.g. after a restart"""
+        return cls(profile, deviation_ms=latency_ms - profile.latency_ms, jitter_ms=jitter_ms,
+                   bad=packet_loss > (profile.loss_good + profile.loss_bad) / 2, **kwargs)
+
+    def next_turn(self) -> Tuple[float, float, float]:
+        """(mean latency ms, jitter ms, loss fraction) for the next turn"""
+        profile = self.profile
+        count = self.packets_per_turn
+        noise = self.rng.standard_normal(count) * profile.latency_sd_ms * math.sqrt(1 - profile.correlation ** 2)
+        spikes = np.where(self.rng.random(count) < profile.spike_probability,
+                          self.rng.exponential(profile.spike_ms, count), 0.0)
+        transitions = self.rng.random(count)
+        losses = self.rng.random(count)
+
+        delays = []
+        lost = 0
+        deviation, jitter, bad, last = self.deviation_ms, self.jitter_ms, self.bad, self._last_delay
+        for i in range(count):
+            bad = transitions[i] >= profile.p_recover if bad else transitions[i] < profile.p_bad
+            deviation = profile.correlation * deviation + noise[i]
+            if losses[i] < (profile.loss_bad if bad else profile.loss_good):
+                lost += 1
+                continue
+            delay = max(profile.min_latency_ms, profile.latency_ms + deviation + spikes[i])
+            if last is not None:
+                jitter += (abs(delay - last) - jitter) / 16
+            last = delay
+            delays.append(delay)
+        self.deviation_ms, self.jitter_ms, self.bad, self._last_delay = deviation, jitter, bad, last
+
+        latency = float(np.mean(delays)) if delays else float(last or profile.latency_ms)
+        return latency, float(jitter), lost / count
+
+
+def get_profile(name: Optional[str]) -> NetworkProfile:
+    """
+    Raises:
+        ValueError: Unknown profile name
+    """
+    profile = PROFILES.get(name or DEFAULT_PROFILE)
+    if profile is None:
+        raise ValueError(f"Unknown network profile {name!r}; expected one of {', '.join(PROFILES)}")
+    return profile
+
+
+def pack_series(values: Iterable[float]) -> bytes:
+    return np.fromiter(values, dtype=SERIES_DTYPE).tobytes()
+
+
+def unpack_series(blob: Optional[bytes]) -> np.ndarray:
+    return np.frombuffer(blob or b"", dtype=SERIES_DTYPE)
+
+
+def summarize(latency: np.ndarray, jitter: np.ndarray, loss: np.ndarray) -> Dict[str, float]:
+    """Averages and tail latency over any number of samples"""
+    if not len(latency):
+        return {"samples": 0, "avg_latency_ms": 0.0, "p95_latency_ms": 0.0, "avg_jitter_ms": 0.0,
+                "avg_packet_loss": 0.0}
+    return {
+        "samples": int(len(latency)),
+        "avg_latency_ms": round(float(latency.mean(dtype=np.float64)), 2),
+        "p95_latency_ms": round(float(np.percentile(latency, 95)), 2),
+        "avg_jitter_ms": round(float(jitter.mean(dtype=np.float64)), 2),
+        "avg_packet_loss": round(float(loss.mean(dtype=np.float64)), 5)
+    }
+
+
+def stored_summary(series) -> Dict[str, float]:
+    """summarize() for a NetworkSeries row, from its running columns"""
+    if not series.samples:
+        return summarize(unpack_series(None), unpack_series(None), unpack_series(None))
+    return {
+        "samples": int(series.samples),
+        "avg_latency_ms": round(float(series.avg_latency_ms or 0), 2),
+        "p95_latency_ms": round(float(series.p95_latency_ms or 0), 2),
+        "avg_jitter_ms": round(float(series.avg_jitter_ms or 0), 2),
+        "avg_packet_loss": round(float(series.avg_packet_loss or 0), 5)
+    }
+
+
+def unpack_sketch(blob: Optional[bytes]) -> np.ndarray:
+    """A latency sketch's bin counts; an empty sketch if there is none"""
+    if not blob:
+        return np.zeros(SKETCH_BINS, dtype=np.int64)
+    return np.frombuffer(blob, dtype=SKETCH_DTYPE).astype(np.int64)
+
+
+def pack_sketch(counts: np.ndarray) -> bytes:
+    return counts.astype(SKETCH_DTYPE).tobytes()
+
+
+def sketch_add(counts: np.ndarray, latency_ms: float) -> None:
+    """Count one latency sample, clamping it into the sketch's range"""
+    ratio = max(latency_ms, SKETCH_MIN_MS) / SKETCH_MIN_MS
+    counts[min(int(math.log(ratio) / _SKETCH_STEP), SKETCH_BINS - 1)] += 1
+
+
+def sketch_percentile(counts: np.ndarray, q: float) -> float:
+    """Estimate the q-th percentile, interpolating geometrically within its bin"""
+    total = int(counts.sum())
+    if not total:
+        return 0.0
+    rank = q / 100 * total
+    cumulative = np.cumsum(counts)
+    index = min(int(np.searchsorted(cumulative, rank)), SKETCH_BINS - 1)
+    before = int(cumulative[index] - counts[index])
+    fraction = (rank - before) / counts[index] if counts[index] else 0.5
+    return SKETCH_MIN_MS * math.exp((index + min(max(fraction, 0.0), 1.0)) * _SKETCH_STEP)
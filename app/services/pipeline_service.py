@@ -0,0 +1,308 @@
+import queue
+import threading
+import time
+import traceback
+import zlib
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from sqlalchemy.orm import Session
+from app.core.logger import logger
+from ..database import SessionLocal
+from ..models.models import PipelineTask
+
+Stage = Callable[[Dict[str, Any], Session], None]
+
+
+class StageMetrics:
+    def __init__(self):
+        self.count = 0
+        self.failures = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+
+    def record(self, elapsed_ms: float, failed: bool) -> None:
+        self.count += 1
+        self.failures += int(failed)
+        self.total_ms += elapsed_ms
+        self.max_ms = max(self.max_ms, elapsed_ms)
+
+    def to_dict(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "failures": self.failures,
+            "avg_ms": round(self.total_ms / self.count, 3) if self.count else 0.0,
+            "max_ms": round(self.max_ms, 3)
+        }
+
+
+class PostTurnPipeline:
+    """
+    Runs per-turn enrichment off the response path.
+
+    Stages are registered in order and run by a pool of worker threads,
+    each fed from its own bounded queue. With key_field set, payloads with
+    the same value of that field always go to the same worker, so one
+    call's turns are processed one at a time and in order. Every stage
+    gets its own session and transaction, so one failing stage does not
+    undo the others. A failed stage is stored as a PipelineTask row. It is
+    retried with exponential backoff until it succeeds or runs out of
+    attempts, unless it was registered with retry=False. Turns that
+    depend on the ones before them should opt out, since a retry runs
+    after the call's later turns.
+
+    When a queue is full the caller waits up to submit_timeout and then
+    runs the turn itself, which slows producers down instead of dropping
+    work. Running a keyed turn inline would race the queued turns with the
+    same key, so a keyed turn is stored as PipelineTask rows instead and
+    run by the retry loop. Until start() is called every turn runs inline.
+    """
+
+    def __init__(self, session_factory=SessionLocal, workers: int = 2, max_queue: int = 1000,
+                 submit_timeout: float = 0.5, max_attempts: int = 5, retry_delay: float = 5,
+                 retry_poll_interval: float = 5, claim_timeout: float = 300, key_field: Optional[str] = None):
+        self.session_factory = session_factory
+        self.workers = workers
+        self.submit_timeout = submit_timeout
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.retry_poll_interval = retry_poll_interval
+        self.claim_timeout = claim_timeout
+        self.key_field = key_field
+        self.stages: List[Tuple[str, Stage]] = []
+        self.retried_stages: Set[str] = set()
+        self.stage_metrics: Dict[str, StageMetrics] = {}
+        self.submitted = 0
+        self.ran_inline = 0
+        self.deferred = 0
+        self._queues: List["queue.Queue"] = [
+            queue.Queue(maxsize=max(1, max_queue // max(1, workers))) for _ in range(max(1, workers))
+        ]
+        self._next_queue = 0
+        self._threads: List[threading.Thread] = []
+        self._metrics_lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def register_stage(self, name: str, stage: Stage, retry: bool = True) -> None:
+        """
+        Append a stage; stages run in registration order.
+
+        Args:
+            retry: Re-run the stage when it fails; otherwise a failure is
+                only recorded
+        """
+        self.stages.append((name, stage))
+        if retry:
+            self.retried_stages.add(name)
+        self.stage_metrics[name] = StageMetrics()
+
+    @property
+    def running(self) -> bool:
+        return bool(self._threads)
+
+    def submit(self, payload: Dict[str, Any]) -> None:
+        """
+        Queue a finished turn for post-processing.
+
+        Args:
+            payload: JSON-serializable turn data handed to every stage
+        """
+        with self._metrics_lock:
+            self.submitted += 1
+        if self.running:
+            try:
+                self._queue_for(payload).put((payload, None, None), timeout=self.submit_timeout)
+                return
+            except queue.Full:
+                if self._key(payload) is not None and self._defer(payload):
+                    return
+                logger.warning("Post-turn queue is full, processing turn inline")
+        with self._metrics_lock:
+            self.ran_inline += 1
+        self._process(payload, None, None)
+
+    def _defer(self, payload: Dict[str, Any]) -> bool:
+        """Store a turn for the retry loop; False if it could not be stored"""
+        db = self.session_factory()
+        try:
+            for name, _ in self.stages:
+                db.add(PipelineTask(stage=name, payload=payload, attempts=0, status="pending",
+                                    next_attempt_at=datetime.utcnow()))
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error deferring post-turn task: {str(e)}")
+            db.rollback()
+            return False
+        finally:
+            db.close()
+        logger.warning(f"Post-turn queue is full, deferred turn for {self._key(payload)} to the retry loop")
+        with self._metrics_lock:
+            self.deferred += 1
+        return True
+
+    def _key(self, payload: Dict[str, Any]) -> Optional[str]:
+        if self.key_field is None:
+            return None
+        key = payload.get(self.key_field)
+        return None if key is None else str(key)
+
+    def _queue_for(self, payload: Dict[str, Any]) -> "queue.Queue":
+        """The payload's key's queue, or the next one in turn for unkeyed payloads"""
+        key = self._key(payload)
+        if key is not None:
+            return self._queues[zlib.crc32(key.encode()) % len(self._queues)]
+        with self._metrics_lock:
+            self._next_queue = (self._next_queue + 1) % len(self._queues)
+            return self._queues[self._next_queue]
+
+    def _process(self, payload: Dict[str, Any], stage_names: Optional[List[str]],
+                 task_id: Optional[int]) -> None:
+        for name, stage in self.stages:
+            if stage_names is not None and name not in stage_names:
+                continue
+            db = self.session_factory()
+            started = time.perf_counter()
+            error = None
+            try:
+                stage(payload, db)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                error = e
+                logger.error(f"Post-turn stage {name} failed: {str(e)}")
+            finally:
+                db.close()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._metrics_lock:
+                self.stage_metrics[name].record(elapsed_ms, error is not None)
+            self._record_outcome(name, payload, task_id, error)
+
+    def _record_outcome(self, stage: str, payload: Dict[str, Any], task_id: Optional[int],
+                        error: Optional[Exception]) -> None:
+        if task_id is None and error is None:
+            return
+        db = self.session_factory()
+        try:
+            if task_id is None:
+                task = PipelineTask(stage=stage, payload=payload, attempts=0)
+                db.add(task)
+            else:
+                task = db.query(PipelineTask).filter(PipelineTask.id == task_id).first()
+                if task is None:
+                    return
+            if error is None:
+                task.status = "done"
+            else:
+                task.attempts = (task.attempts or 0) + 1
+                task.last_error = "".join(traceback.format_exception_only(type(error), error))[:1000]
+                if task.attempts >= self.max_attempts or stage not in self.retried_stages:
+                    task.status = "failed"
+                else:
+                    task.status = "pending"
+                    delay = self.retry_delay * (2 ** (task.attempts - 1))
+                    task.next_attempt_at = datetime.utcnow() + timedelta(seconds=delay)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error recording post-turn task for stage {stage}: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def retry_due(self, now: Optional[datetime] = None, limit: int = 100) -> int:
+        """Re-run failed stages whose backoff has elapsed, and turns deferred from a full queue"""
+        now = now or datetime.utcnow()
+        db = self.session_factory()
+        claimed = []
+        try:
+            due = (
+                db.query(PipelineTask.id, PipelineTask.stage, PipelineTask.payload)
+                .filter(
+                    PipelineTask.status.in_(["pending", "retrying"]),
+                    PipelineTask.next_attempt_at <= now
+                )
+                .order_by(PipelineTask.next_attempt_at)
+                .limit(limit)
+                .all()
+            )
+            # Claim each row so other workers skip it; a claim left behind by
+            # a crashed process lapses after claim_timeout
+            for task_id, stage, payload in due:
+                updated = db.query(PipelineTask).filter(
+                    PipelineTask.id == task_id,
+                    PipelineTask.status.in_(["pending", "retrying"]),
+                    PipelineTask.next_attempt_at <= now
+                ).update(
+                    {"status": "retrying",
+                     "next_attempt_at": now + timedelta(seconds=self.claim_timeout)},
+                    synchronize_session=False
+                )
+                if updated:
+                    claimed.append((task_id, stage, payload))
+            db.commit()
+        finally:
+            db.close()
+
+        for task_id, stage, payload in claimed:
+            if self.running:
+                self._queue_for(payload).put((payload, [stage], task_id))
+            else:
+                self._process(payload, [stage], task_id)
+        return len(claimed)
+
+    def metrics(self) -> Dict[str, Any]:
+        with self._metrics_lock:
+            return {
+                "queue_depth": sum(shard.qsize() for shard in self._queues),
+                "workers": self.workers if self.running else 0,
+                "submitted": self.submitted,
+                "ran_inline": self.ran_inline,
+                "deferred": self.deferred,
+                "stages": {name: m.to_dict() for name, m in self.stage_metrics.items()}
+            }
+
+    def start(self) -> None:
+        if self._threads:
+            return
+        self._stop.clear()
+        for i, shard in enumerate(self._queues):
+            thread = threading.Thread(target=self._work, args=(shard,), name=f"post-turn-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        retry_thread = threading.Thread(target=self._retry_loop, name="post-turn-retry", daemon=True)
+        retry_thread.start()
+        self._threads.append(retry_thread)
+
+    def stop(self) -> None:
+        """Drain the queue and stop the workers"""
+        if not self._threads:
+            return
+        self.join()
+        self._stop.set()
+        for shard in self._queues:
+            shard.put(None)
+        for thread in self._threads:
+            thread.join()
+        self._threads = []
+
+    def join(self) -> None:
+        """Block until every queued turn has been processed"""
+        for shard in self._queues:
+            shard.join()
+
+    def _work(self, shard: "queue.Queue") -> None:
+        while True:
+            job = shard.get()
+            try:
+                if job is None:
+                    return
+                self._process(*job)
+            except Exception as e:
+                logger.error(f"Post-turn worker error: {str(e)}")
+            finally:
+                shard.task_done()
+
+    def _retry_loop(self) -> None:
+        while not self._stop.wait(self.retry_poll_interval):
+            try:
+                self.retry_due()
+            except Exception as e:
+                logger.error(f"Error retrying post-turn tasks: {str(e)}")
@@ -0,0 +1,343 @@
+"""
+Agent presence: who is logged in, in what state, and with how many calls.
+
+Every worker keeps the whole index in memory, so routing and transfer
+validation never wait on a database. Each field of an agent is written
+on its own, so workers changing different fields at the same time never
+undo each other: a change gets a per-agent version from the state
+backend, its fields are stored in a hash (the snapshot a starting or
+reconnecting worker loads), one entry per field, and it is published on
+a channel. Every worker applies each field whose version is newer than
+the one it has, so duplicates and stale events are ignored.
+
+The load is a counter of its own, moved with a single INCRBY that also
+gives the change its version (see LOAD_SHIFT), so calls routed to one
+agent by several workers are all counted.
+
+Per skill, the agents who can take a call are kept in a dict in the order
+they became free, so "first available agent with skill X" is the dict's
+first key, O(1), and every state or load change is O(skills).
+"""
+import json
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple, Union
+from app.core.logger import logger
+from app.core.state import StateBackend, Subscription
+
+AGENT_STATES = ("available", "busy", "wrap-up", "offline")
+PRESENCE_CHANNEL = "presence"
+PRESENCE_KEY = "presence:agents"
+PROFILE_FIELDS = ("name", "skills", "capacity", "state")
+# A load counter holds (changes << LOAD_SHIFT) + load: every change adds
+# 1 << LOAD_SHIFT as well as the delta, so the count of changes is the
+# version of the load it leaves behind
+LOAD_SHIFT = 32
+
+
+def unpack_load(counter: int) -> Tuple[int, int]:
+    """(load, version) from a load counter"""
+    version = (counter + (1 << (LOAD_SHIFT - 1))) >> LOAD_SHIFT
+    return counter - (version << LOAD_SHIFT), version
+
+
+class AgentPresence:
+    __slots__ = ("agent_id", "name", "skills", "capacity", "state", "load", "version")
+
+    def __init__(self, agent_id: str, name: str, skills: Dict[str, int], capacity: int, state: str,
+                 load: int, version: int):
+        self.agent_id = agent_id
+        self.name = name
+        self.skills = skills
+        self.capacity = capacity
+        self.state = state
+        self.load = load
+        self.version = version
+
+    def can_take_call(self) -> bool:
+        return self.state == "available" and self.load < self.capacity
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "agent_id": self.agent_id,
+            "name": self.name,
+            "skills": dict(self.skills),
+            "capacity": self.capacity,
+            "state": self.state,
+            "load": self.load,
+            "version": self.version
+        }
+
+    @classmethod
+    def from_dict(cls, record: Dict[str, Any]) -> "AgentPresence":
+        return cls(record["agent_id"], record["name"], record["skills"], record["capacity"], record["state"],
+                   record["load"], record["version"])
+
+
+class PresenceIndex:
+    """
+    In-memory agent presence, replicated through the state backend.
+
+    Listeners registered with add_listener(callback) are called with
+    (agent_id, presence) after every applied change, local or from another
+    worker; presence is None when the agent was removed.
+    """
+
+    def __init__(self, state_backend: StateBackend, channel: str = PRESENCE_CHANNEL, key: str = PRESENCE_KEY):
+        self.state_backend = state_backend
+        self.channel = channel
+        self.key = key
+        self._agents: Dict[str, AgentPresence] = {}
+        self._fields: Dict[str, Dict[str, Any]] = {}
+        self._loads: Dict[str, int] = {}
+        # Latest version seen per agent and field, kept after removal so late events cannot revive it
+        self._versions: Dict[str, Dict[str, int]] = {}
+        self._free: Dict[str, Dict[str, None]] = {}
+        self._staffed: Dict[str, set] = {}
+        self._listeners: List[Callable[[str, Optional[AgentPresence]], None]] = []
+        self._lock = threading.RLock()
+        self._subscription: Optional[Subscription] = None
+
+    def add_listener(self, callback: Callable[[str, Optional[AgentPresence]], None]) -> None:
+        self._listeners.append(callback)
+
+    def start(self) -> None:
+        """Follow changes from other workers; loads the snapshot on every (re)connect"""
+        if self._subscription is None:
+            self._subscription = self.state_backend.subscribe(self.channel, self._on_message, on_connect=self.reload)
+
+    def stop(self) -> None:
+        if self._subscription is not None:
+            self._subscription.close()
+            self._subscription = None
+
+    def _version_key(self, agent_id: str) -> str:
+        return f"{self.key}:version:{agent_id}"
+
+    def _load_key(self, agent_id: str) -> str:
+        return f"{self.key}:load:{agent_id}"
+
+    def _call_key(self, call_id: str) -> str:
+        return f"{self.key}:call:{call_id}"
+
+    @staticmethod
+    def _field_key(agent_id: str, field: str) -> str:
+        return f"{agent_id}:{field}"
+
+    def reload(self) -> int:
+        """Apply the stored snapshot; returns the number of agents in it"""
+        snapshot: Dict[str, Dict[str, List]] = {}
+        for field_key, value in self.state_backend.hgetall(self.key).items():
+            agent_id, _, field = field_key.rpartition(":")
+            if field in PROFILE_FIELDS:
+                snapshot.setdefault(agent_id, {})[field] = json.loads(value)
+        for agent_id, fields in snapshot.items():
+            counter = self.state_backend.get(self._load_key(agent_id))
+            if counter is not None:
+                fields["load"] = list(unpack_load(int(counter)))
+            self._apply({"agent_id": agent_id, "fields": fields})
+        return len(snapshot)
+
+    def update(self, agent_id: str, name: Optional[str] = None,
+               skills: Union[Dict[str, int], Iterable[str], None] = None, capacity: Optional[int] = None,
+               state: Optional[str] = None) -> Optional[AgentPresence]:
+        """
+        Add an agent or change some of its fields, and tell the other workers.
+
+        Only the given fields are written. New agents default to no skills,
+        one call at a time and "available".
+
+        Raises:
+            ValueError: Unknown state, or a capacity below 1
+        """
+        if state is not None and state not in AGENT_STATES:
+            raise ValueError(f"Unknown agent state {state!r}; expected one of {', '.join(AGENT_STATES)}")
+        if capacity is not None and int(capacity) < 1:
+            raise ValueError("capacity must be at least 1")
+        if skills is not None and not isinstance(skills, dict):
+            skills = {skill: 1 for skill in skills}
+
+        fields = {field: value for field, value in (("name", name), ("skills", skills), ("capacity", capacity),
+                                                    ("state", state)) if value is not None}
+        if "capacity" in fields:
+            fields["capacity"] = int(fields["capacity"])
+        known = self.get(agent_id) is not None
+        if not known and self.state_backend.hget(self.key, self._field_key(agent_id, "state")) is None:
+            # Every field of a new agent is written, so no worker sees it half made
+            fields = dict({"name": agent_id, "skills": {}, "capacity": 1, "state": "available"}, **fields)
+        version = self.state_backend.incr(self._version_key(agent_id))
+        event = {"agent_id": agent_id, "fields": {field: [value, version] for field, value in fields.items()}}
+        for field, entry in event["fields"].items():
+            self.state_backend.hset(self.key, self._field_key(agent_id, field), json.dumps(entry))
+        self._apply(event)
+        self.state_backend.publish(self.channel, json.dumps(event))
+        return self.get(agent_id)
+
+    def adjust_load(self, agent_id: str, delta: int) -> Optional[AgentPresence]:
+        """
+        Count calls given to (delta > 0) or finished by an agent.
+
+        The count is a counter in the state backend, so workers routing
+        calls to the same agent do not overwrite each other's load.
+        """
+        if self.get(agent_id) is None:
+            return None
+        self._move_load(agent_id, delta)
+        return self.get(agent_id)
+
+    def reserve(self, agent_id: str, call_id: str) -> Optional[bool]:
+        """
+        Count a call given to an agent, unless they are already at capacity.
+
+        The load is raised first and checked after, so of several workers
+        routing calls to an agent's last free slot at once, one gets it.
+        The reservation is kept under call_id until release(call_id).
+
+        Returns:
+            True if reserved, False if the agent is unknown or full, None
+            if the call already has a reservation (another worker gave it
+            to an agent)
+        """
+        agent = self.get(agent_id)
+        if agent is None:
+            return False
+        if not self.state_backend.set(self._call_key(call_id), agent_id, nx=True):
+            return None
+        key = self._load_key(agent_id)
+        load, version = unpack_load(self.state_backend.incr(key, (1 << LOAD_SHIFT) + 1))
+        if load > agent.capacity:
+            self.state_backend.incr(key, (1 << LOAD_SHIFT) - 1)
+            self.state_backend.delete(self._call_key(call_id))
+            return False
+        self._publish_load(agent_id, load, version)
+        return True
+
+    def release(self, call_id: str) -> Optional[str]:
+        """
+        Give back the slot reserved for a call, whichever worker reserved it.
+
+        Returns:
+            The agent the call was with, or None if it had no reservation
+            (or it was already released)
+        """
+        agent_id = self.state_backend.get(self._call_key(call_id))
+        if agent_id is None or not self.state_backend.delete(self._call_key(call_id)):
+            return None
+        self._move_load(agent_id, -1)
+        return agent_id
+
+    def _move_load(self, agent_id: str, delta: int) -> None:
+        key = self._load_key(agent_id)
+        load, version = unpack_load(self.state_backend.incr(key, (1 << LOAD_SHIFT) + delta))
+        if load < 0:
+            load, version = unpack_load(self.state_backend.incr(key, (1 << LOAD_SHIFT) - load))
+        self._publish_load(agent_id, load, version)
+
+    def _publish_load(self, agent_id: str, load: int, version: int) -> None:
+        event = {"agent_id": agent_id, "fields": {"load": [load, version]}}
+        self._apply(event)
+        self.state_backend.publish(self.channel, json.dumps(event))
+
+    def remove(self, agent_id: str) -> bool:
+        """
+        Log an agent out of the index everywhere; False if unknown.
+
+        Their load is kept: calls already with them are still finished.
+        """
+        if self.get(agent_id) is None:
+            return False
+        version = self.state_backend.incr(self._version_key(agent_id))
+        event = {"agent_id": agent_id, "removed": True, "version": version}
+        for field in PROFILE_FIELDS:
+            self.state_backend.hdel(self.key, self._field_key(agent_id, field))
+        self._apply(event)
+        self.state_backend.publish(self.channel, json.dumps(event))
+        return True
+
+    def _on_message(self, message: str) -> None:
+        self._apply(json.loads(message))
+
+    def _apply(self, event: Dict[str, Any]) -> bool:
+        """Apply the fields of a change that are newer than those seen; returns whether any were"""
+        agent_id = event["agent_id"]
+        with self._lock:
+            versions = self._versions.setdefault(agent_id, {})
+            if event.get("removed"):
+                if event["version"] <= max(versions.get(field, 0) for field in PROFILE_FIELDS):
+                    return False
+                versions.update((field, event["version"]) for field in PROFILE_FIELDS)
+                self._fields.pop(agent_id, None)
+            else:
+                changed = {}
+                for field, (value, version) in event["fields"].items():
+                    if version > versions.get(field, 0):
+                        versions[field] = version
+                        changed[field] = value
+                if not changed:
+                    return False
+                if "load" in changed:
+                    self._loads[agent_id] = changed.pop("load")
+                if changed:
+                    self._fields.setdefault(agent_id, {}).update(changed)
+                if agent_id not in self._fields:
+                    # The load of an agent who was removed, kept for when they return
+                    return False
+            previous = self._agents.pop(agent_id, None)
+            presence = self._build(agent_id)
+            if presence:
+                self._agents[agent_id] = presence
+            self._reindex(agent_id, previous, presence)
+        for listener in self._listeners:
+            try:
+                listener(agent_id, presence)
+            except Exception as e:
+                logger.error(f"Error in presence listener for agent {agent_id}: {str(e)}")
+        return True
+
+    def _build(self, agent_id: str) -> Optional[AgentPresence]:
+        fields = self._fields.get(agent_id)
+        if fields is None:
+            return None
+        version = max(self._versions[agent_id].get(field, 0) for field in PROFILE_FIELDS)
+        return AgentPresence(agent_id, fields.get("name", agent_id), fields.get("skills", {}),
+                             fields.get("capacity", 1), fields.get("state", "available"),
+                             self._loads.get(agent_id, 0), version)
+
+    def _reindex(self, agent_id: str, previous: Optional[AgentPresence],
+                 presence: Optional[AgentPresence]) -> None:
+        skills = set(previous.skills if previous else ()) | set(presence.skills if presence else ())
+        for skill in skills:
+            has_skill = presence is not None and skill in presence.skills
+            if has_skill and presence.state != "offline":
+                self._staffed.setdefault(skill, set()).add(agent_id)
+            else:
+                self._staffed.get(skill, set()).discard(agent_id)
+            free = self._free.setdefault(skill, {})
+            if has_skill and presence.can_take_call():
+                # An agent who stays free keeps their place in the line
+                free.setdefault(agent_id, None)
+            else:
+                free.pop(agent_id, None)
+
+    def get(self, agent_id: str) -> Optional[AgentPresence]:
+        with self._lock:
+            return self._agents.get(agent_id)
+
+    def agents(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return [presence.to_dict() for presence in self._agents.values()]
+
+    def first_available(self, skill: str) -> Optional[AgentPresence]:
+        """The agent with skill who has been free the longest, if any"""
+        with self._lock:
+            free = self._free.get(skill)
+            return self._agents[next(iter(free))] if free else None
+
+    def available(self, skill: str) -> List[AgentPresence]:
+        """Every agent with skill who can take a call, longest free first"""
+        with self._lock:
+            return [self._agents[agent_id] for agent_id in self._free.get(skill, {})]
+
+    def is_staffed(self, skill: str) -> bool:
+        """Whether any agent who is not offline has the skill"""
+        with self._lock:
+            return bool(self._staffed.get(skill))
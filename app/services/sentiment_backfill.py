@@ -0,0 +1,222 @@
+"""
+Rescore stored transcripts with the current sentiment model.
+
+Messages are read in primary-key order, a chunk at a time, and scored by a
+pool of worker processes, each with its own SentimentService. Scores are
+written back with bulk updates, one transaction per chunk, and the last
+committed message id is checkpointed so an interrupted run picks up where
+it stopped. Once every message is scored, each call's sentiment_score is
+set to the average of its caller messages.
+
+    python -m app.services.sentiment_backfill --workers 8
+    python -m app.services.sentiment_backfill --restart   # ignore the checkpoint
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import time
+from collections import deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import func, update
+from app.core.logger import logger
+from app.database import SessionLocal, init_db
+from app.models.models import CallSimulation, Message
+from app.services.sentiment_service import SentimentService
+
+DEFAULT_CHECKPOINT = Path("data") / "sentiment_backfill.json"
+
+Chunk = List[Tuple[int, str]]
+
+_worker_service: Optional[SentimentService] = None
+
+
+def _init_worker() -> None:
+    global _worker_service
+    _worker_service = SentimentService()
+
+
+def score_chunk(chunk: Chunk) -> List[Tuple[int, float]]:
+    """Score one chunk of (message id, content) pairs in a worker process"""
+    service = _worker_service or SentimentService()
+    scores = service.analyze_many([content or "" for _, content in chunk])
+    return [(message_id, score["compound"]) for (message_id, _), score in zip(chunk, scores)]
+
+
+class SentimentBackfill:
+    def __init__(self, session_factory=SessionLocal, workers: Optional[int] = None,
+                 chunk_size: int = 2000, checkpoint_path: Path = DEFAULT_CHECKPOINT,
+                 progress: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.session_factory = session_factory
+        self.workers = workers or os.cpu_count() or 1
+        self.chunk_size = chunk_size
+        self.checkpoint_path = Path(checkpoint_path)
+        self.progress = progress or self._log_progress
+
+    def load_checkpoint(self) -> Dict[str, Any]:
+        try:
+            with open(self.checkpoint_path) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {"last_message_id": 0, "scored": 0}
+
+    def save_checkpoint(self, checkpoint: Dict[str, Any]) -> None:
+        self.checkpoint_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.checkpoint_path.with_suffix(".tmp")
+        with open(tmp_path, "w") as f:
+            json.dump(checkpoint, f)
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def _chunks(self, after_id: int) -> Iterator[Chunk]:
+        """Page through messages by id, so each query is an index range scan"""
+        while True:
+            db = self.session_factory()
+            try:
+                rows = (
+                    db.query(Message.id, Message.content)
+                    .filter(Message.id > after_id)
+                    .order_by(Message.id)
+                    .limit(self.chunk_size)
+                    .all()
+                )
+            finally:
+                db.close()
+            if not rows:
+                return
+            after_id = rows[-1][0]
+            yield [(row[0], row[1]) for row in rows]
+
+    def run(self, restart: bool = False) -> Dict[str, Any]:
+        """
+        Score every message after the checkpoint, then refresh per-call averages.
+
+        Args:
+            restart: Ignore any checkpoint and rescore from the first message
+
+        Returns:
+            Dict with the number of messages and calls updated and the throughput
+        """
+        checkpoint = {"last_message_id": 0, "scored": 0} if restart else self.load_checkpoint()
+        db = self.session_factory()
+        try:
+            remaining = db.query(func.count(Message.id)).filter(
+                Message.id > checkpoint["last_message_id"]
+            ).scalar()
+        finally:
+            db.close()
+
+        started = time.monotonic()
+        scored = 0
+        chunks = self._chunks(checkpoint["last_message_id"])
+        for results in self._score(chunks):
+            self._write_scores(results)
+            scored += len(results)
+            checkpoint = {
+                "last_message_id": results[-1][0],
+                "scored": checkpoint["scored"] + len(results)
+            }
+            self.save_checkpoint(checkpoint)
+            elapsed = time.monotonic() - started
+            self.progress({
+                "scored": scored,
+                "total": remaining,
+                "messages_per_second": scored / elapsed if elapsed else 0.0,
+                "last_message_id": checkpoint["last_message_id"]
+            })
+
+        calls = self._update_call_scores()
+        # A finished run leaves no checkpoint, so the next run rescores everything
+        self.checkpoint_path.unlink(missing_ok=True)
+        elapsed = time.monotonic() - started
+        return {
+            "messages": scored,
+            "calls": calls,
+            "seconds": round(elapsed, 3),
+            "messages_per_second": round(scored / elapsed, 1) if elapsed else 0.0
+        }
+
+    def _score(self, chunks: Iterator[Chunk]) -> Iterator[List[Tuple[int, float]]]:
+        """Yield scored chunks in id order, keeping a bounded number in flight"""
+        if self.workers == 1:
+            _init_worker()
+            for chunk in chunks:
+                yield score_chunk(chunk)
+            return
+
+        with multiprocessing.Pool(self.workers, initializer=_init_worker) as pool:
+            pending: Deque = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(score_chunk, (chunk,)))
+                if len(pending) >= self.workers * 2:
+                    yield pending.popleft().get()
+            while pending:
+                yield pending.popleft().get()
+
+    def _write_scores(self, results: List[Tuple[int, float]]) -> None:
+        db = self.session_factory()
+        try:
+            db.execute(
+                update(Message),
+                [{"id": message_id, "sentiment_score": score} for message_id, score in results]
+            )
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    def _update_call_scores(self) -> int:
+        """Set each call's score to the average over its caller messages"""
+        db = self.session_factory()
+        try:
+            averages = (
+                db.query(Message.simulation_id, func.avg(Message.sentiment_score))
+                .filter(Message.sender == "user", Message.sentiment_score.isnot(None))
+                .group_by(Message.simulation_id)
+                .all()
+            )
+            if averages:
+                db.execute(
+                    update(CallSimulation),
+                    [{"id": simulation_id, "sentiment_score": round(average, 4)}
+                     for simulation_id, average in averages]
+                )
+            db.commit()
+            return len(averages)
+        except Exception:
+            db.rollback()
+            raise
+        finally:
+            db.close()
+
+    @staticmethod
+    def _log_progress(progress: Dict[str, Any]) -> None:
+        total = progress["total"] or 1
+        logger.info(
+            f"Sentiment backfill: {progress['scored']}/{progress['total']} messages "
+            f"({100 * progress['scored'] / total:.1f}%), {progress['messages_per_second']:.0f} msg/s"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Rescore stored messages and calls with the current sentiment model")
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--chunk-size", type=int, default=2000)
+    parser.add_argument("--checkpoint", type=Path, default=DEFAULT_CHECKPOINT)
+    parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start over")
+    options = parser.parse_args()
+    init_db()
+    backfill = SentimentBackfill(
+        workers=options.workers,
+        chunk_size=options.chunk_size,
+        checkpoint_path=options.checkpoint,
+        progress=lambda p: print(
+            f"\r{p['scored']}/{p['total']} messages, {p['messages_per_second']:.0f} msg/s",
+            end="", flush=True
+        )
+    )
+    summary = backfill.run(restart=options.restart)
+    print(f"\nRescored {summary['messages']} messages and {summary['calls']} calls "
+          f"in {summary['seconds']}s ({summary['messages_per_second']} msg/s)")
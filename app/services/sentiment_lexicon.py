@@ -0,0 +1,88 @@
+"""
+Vendored VADER lexicon.
+
+The lexicon ships precompiled in data/vader_lexicon.pkl (a pickled
+word -> valence dict built from vader_lexicon.txt of vaderSentiment 3.3.2,
+MIT licensed, Copyright (c) 2016 C.J. Hutto). It is loaded once per process
+and shared by every analyzer, so constructing a SentimentService never
+reads the text lexicon or touches the network.
+
+Rebuild after updating the source lexicon with:
+
+    python -m app.services.sentiment_lexicon path/to/vader_lexicon.txt
+"""
+import pickle
+import sys
+import threading
+from pathlib import Path
+from typing import Dict, Optional
+from nltk.sentiment.vader import SentimentIntensityAnalyzer, VaderConstants
+
+LEXICON_PATH = Path(__file__).parent / "data" / "vader_lexicon.pkl"
+
+_lexicon: Optional[Dict[str, float]] = None
+_analyzer: Optional[SentimentIntensityAnalyzer] = None
+_lock = threading.RLock()
+
+
+def compile_lexicon(source: Path, destination: Path = LEXICON_PATH) -> int:
+    """
+    Compile a VADER text lexicon into the binary form loaded at runtime.
+
+    Args:
+        source: Tab-separated lexicon (token, mean valence, ...)
+        destination: Where to write the compiled lexicon
+
+    Returns:
+        int: Number of entries written
+    """
+    lexicon = {}
+    with open(source, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            word, measure = line.split("\t")[0:2]
+            lexicon[word] = float(measure)
+    destination.parent.mkdir(parents=True, exist_ok=True)
+    with open(destination, "wb") as f:
+        pickle.dump(lexicon, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return len(lexicon)
+
+
+def load_lexicon() -> Dict[str, float]:
+    """Return the process-wide lexicon, loading it on first use"""
+    global _lexicon
+    if _lexicon is None:
+        with _lock:
+            if _lexicon is None:
+                with open(LEXICON_PATH, "rb") as f:
+                    _lexicon = pickle.load(f)
+    return _lexicon
+
+
+class VendoredSentimentIntensityAnalyzer(SentimentIntensityAnalyzer):
+    """NLTK's VADER analyzer backed by the vendored lexicon"""
+
+    def __init__(self, lexicon: Optional[Dict[str, float]] = None):
+        self.lexicon_file = None
+        self.lexicon = lexicon if lexicon is not None else load_lexicon()
+        self.constants = VaderConstants()
+
+
+def get_analyzer() -> SentimentIntensityAnalyzer:
+    """Return the shared analyzer; it holds no per-call state"""
+    global _analyzer
+    if _analyzer is None:
+        with _lock:
+            if _analyzer is None:
+                _analyzer = VendoredSentimentIntensityAnalyzer(load_lexicon())
+    return _analyzer
+
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("usage: python -m app.services.sentiment_lexicon path/to/vader_lexicon.txt")
+        sys.exit(1)
+    count = compile_lexicon(Path(sys.argv[1]))
+    print(f"Compiled {count} lexicon entries into {LEXICON_PATH}")
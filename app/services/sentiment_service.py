@@ -1,16 +1,22 @@
-from typing import Dict, List
-import nltk
-from nltk.sentiment import SentimentIntensityAnalyzer
+from typing import Dict, List, Sequence
+import numpy as np
 from app.core.logger import logger
+from app.services.batch_sentiment import BatchSentimentScorer
+from app.services.sentiment_lexicon import get_analyzer
+
+NEUTRAL_SCORES = {"pos": 0, "neg": 0, "neu": 1, "compound": 0}
 
 class SentimentService:
     def __init__(self):
+        # The analyzer and its vendored lexicon are shared process-wide, so
+        # construction is cheap and never needs the network
         try:
-            nltk.download('vader_lexicon', quiet=True)
-            self.analyzer = SentimentIntensityAnalyzer()
+            self.analyzer = get_analyzer()
+            self.batch_scorer = BatchSentimentScorer(self.analyzer)
         except Exception as e:
             logger.error(f"Error initializing sentiment analyzer: {str(e)}")
             self.analyzer = None
+            self.batch_scorer = None
 
     def analyze_text(self, text: str) -> Dict[str, float]:
         """
@@ -31,6 +37,26 @@ class SentimentService:
             logger.error(f"Error analyzing sentiment: {str(e)}")
             return {"pos": 0, "neg": 0, "neu": 1, "compound": 0}
 
+    def analyze_many(self, texts: Sequence[str]) -> List[Dict[str, float]]:
+        """
+        Analyze the sentiment of many texts in one vectorized pass.
+
+        Args:
+            texts: Texts to analyze
+
+        Returns:
+            List of dicts with sentiment scores (pos, neg, neu, compound),
+            identical to calling analyze_text on each text
+        """
+        try:
+            if not self.batch_scorer:
+                return [dict(NEUTRAL_SCORES) for _ in texts]
+
+            return self.batch_scorer.score(texts)
+        except Exception as e:
+            logger.error(f"Error analyzing sentiment batch: {str(e)}")
+            return [dict(NEUTRAL_SCORES) for _ in texts]
+
     def get_sentiment_label(self, compound_score: float) -> str:
         """
         Get a sentiment label based on the compound score.
@@ -67,16 +93,11 @@ class SentimentService:
                     "sentiment_scores": {"pos": 0, "neg": 0, "neu": 1, "compound": 0}
                 }
             
-            # Analyze each message
-            sentiments = [self.analyze_text(msg) for msg in user_messages]
-            
-            # Calculate average scores
-            avg_scores = {
-                "pos": sum(s["pos"] for s in sentiments) / len(sentiments),
-                "neg": sum(s["neg"] for s in sentiments) / len(sentiments),
-                "neu": sum(s["neu"] for s in sentiments) / len(sentiments),
-                "compound": sum(s["compound"] for s in sentiments) / len(sentiments)
-            }
+            # Analyze all messages in one batch and average the columns
+            keys = ["pos", "neg", "neu", "compound"]
+            sentiments = self.analyze_many(user_messages)
+            means = np.array([[s[k] for k in keys] for s in sentiments]).mean(axis=0)
+            avg_scores = {k: float(v) for k, v in zip(keys, means)}
             
             return {
                 "overall_sentiment": self.get_sentiment_label(avg_scores["compound"]),
@@ -0,0 +1,155 @@
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+
+class CallSentimentState:
+    """
+    Running sentiment of one call, updated in O(1) per turn.
+
+    Keeps an exponential moving average, the minimum over the last `window`
+    turns (monotonic deque) and the least-squares slope of score against
+    turn number over the same window (running sums). Only the EMA, the
+    turn count, the escalation flag and the window scores are persisted;
+    everything else is rebuilt from them.
+    """
+
+    def __init__(self, window: int = 5, alpha: float = 0.5):
+        self.window = window
+        self.alpha = alpha
+        self.turns = 0
+        self.ema: Optional[float] = None
+        self.escalated = False
+        self._scores: Deque[Tuple[int, float]] = deque()
+        self._minimums: Deque[Tuple[int, float]] = deque()
+        self._sum_x = 0.0
+        self._sum_y = 0.0
+        self._sum_xx = 0.0
+        self._sum_xy = 0.0
+
+    def update(self, score: float) -> None:
+        x = self.turns
+        self.turns += 1
+        self.ema = score if self.ema is None else self.alpha * score + (1 - self.alpha) * self.ema
+
+        self._scores.append((x, score))
+        self._sum_x += x
+        self._sum_y += score
+        self._sum_xx += x * x
+        self._sum_xy += x * score
+        if len(self._scores) > self.window:
+            old_x, old_y = self._scores.popleft()
+            self._sum_x -= old_x
+            self._sum_y -= old_y
+            self._sum_xx -= old_x * old_x
+            self._sum_xy -= old_x * old_y
+
+        while self._minimums and self._minimums[-1][1] >= score:
+            self._minimums.pop()
+        self._minimums.append((x, score))
+        if self._minimums[0][0] <= x - self.window:
+            self._minimums.popleft()
+
+    @property
+    def window_min(self) -> Optional[float]:
+        return self._minimums[0][1] if self._minimums else None
+
+    @property
+    def slope(self) -> float:
+        n = len(self._scores)
+        denominator = n * self._sum_xx - self._sum_x * self._sum_x
+        if n < 2 or denominator == 0:
+            return 0.0
+        return (n * self._sum_xy - self._sum_x * self._sum_y) / denominator
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Compact form stored in CallSimulation.quality_metrics"""
+        return {
+            "n": self.turns,
+            "ema": round(self.ema, 4) if self.ema is not None else None,
+            "w": [round(score, 4) for _, score in self._scores],
+            "esc": self.escalated
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any], window: int = 5, alpha: float = 0.5) -> "CallSentimentState":
+        state = cls(window=window, alpha=alpha)
+        scores = data.get("w", [])[-window:]
+        # Replay the window to rebuild the minimum and regression sums,
+        # then restore the values that depend on the full history
+        state.turns = data.get("n", len(scores)) - len(scores)
+        for score in scores:
+            state.update(score)
+        state.ema = data.get("ema")
+        state.escalated = data.get("esc", False)
+        return state
+
+
+class SentimentTracker:
+    """
+    Per-call sentiment state with escalation triggers.
+
+    A call escalates once when its EMA, its window minimum or its downward
+    trend crosses the configured threshold, and re-arms after the EMA
+    recovers to neutral or better. Nothing is cached between turns: each
+    update starts from the state stored with the call, so a turn whose
+    transaction is rolled back leaves no trace.
+    """
+
+    def __init__(self, window: int = 5, alpha: float = 0.5, ema_threshold: float = -0.3,
+                 min_threshold: float = -0.6, slope_threshold: float = -0.25, min_turns: int = 2):
+        self.window = window
+        self.alpha = alpha
+        self.ema_threshold = ema_threshold
+        self.min_threshold = min_threshold
+        self.slope_threshold = slope_threshold
+        self.min_turns = min_turns
+
+    def update(self, simulation_id: str, score: float,
+               persisted: Optional[Dict[str, Any]] = None) -> Tuple[CallSentimentState, Optional[Dict[str, Any]]]:
+        """
+        Fold one turn's score into the call's state.
+
+        Args:
+            simulation_id: The call
+            score: Compound sentiment of the caller's latest message
+            persisted: The call's stored state (CallSentimentState.to_dict),
+                or None for its first turn
+
+        Returns:
+            The updated state, to be stored with the call, and the
+            escalation event, if one fired
+        """
+        if persisted:
+            state = CallSentimentState.from_dict(persisted, self.window, self.alpha)
+        else:
+            state = CallSentimentState(self.window, self.alpha)
+        state.update(score)
+        return state, self._check(simulation_id, state)
+
+    def _check(self, simulation_id: str, state: CallSentimentState) -> Optional[Dict[str, Any]]:
+        if state.escalated:
+            if state.ema >= 0:
+                state.escalated = False
+            return None
+        if state.turns < self.min_turns:
+            return None
+
+        reasons = []
+        if state.ema <= self.ema_threshold:
+            reasons.append("ema")
+        if state.window_min is not None and state.window_min <= self.min_threshold:
+            reasons.append("window_min")
+        if state.slope <= self.slope_threshold:
+            reasons.append("trend")
+        if not reasons:
+            return None
+
+        state.escalated = True
+        return {
+            "simulation_id": simulation_id,
+            "reasons": reasons,
+            "turn": state.turns,
+            "ema": round(state.ema, 4),
+            "window_min": round(state.window_min, 4),
+            "slope": round(state.slope, 4)
+        }
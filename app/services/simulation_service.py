@@ -1,56 +1,185 @@
-from typing import Dict, Optional, List
-from datetime import datetime
+from typing import Callable, Dict, Iterator, Optional, List
+from datetime import datetime, timezone
+from app.services.acd_service import Agent, CallDistributor, agent_skill
 from app.services.llm_service import LLMService
+from app.services.presence_service import PresenceIndex
+from app.services.lifecycle_service import CallLifecycleScheduler
+from app.services.network_simulator import (
+    CHUNK_SAMPLES, DEFAULT_PROFILE, NetworkSimulator, get_profile, pack_series, pack_sketch, sketch_add,
+    sketch_percentile, stored_summary, unpack_series, unpack_sketch
+)
+from app.services.pipeline_service import PostTurnPipeline
+from app.services.sentiment_service import SentimentService
+from app.services.sentiment_tracker import SentimentTracker
+from app.core.admission import AdmissionController, AdmissionRejected
 from app.core.logger import logger
+from app.core.state import InProcessStateBackend, StateBackend
+import os
+import threading
 import uuid
+import zlib
 import random
-from ..models.models import CallSimulation, Message
+import numpy as np
+from ..models.models import CallSimulation, Message, NetworkChunk, NetworkSeries
 from ..database import SessionLocal
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 
+# Tags that move a call into a different LLM scheduling class
+ESCALATED_TAGS = {"escalated", "escalation-risk", "vip"}
+LOW_PRIORITY_TAGS = {"low-priority", "bulk", "test"}
+ESCALATION_TAG = "escalation-risk"
+
 class SimulationService:
-    def __init__(self, llm_service: LLMService):
+    def __init__(self, llm_service: LLMService, session_factory=SessionLocal,
+                 idle_timeout: Optional[float] = None,
+                 state_backend: Optional[StateBackend] = None):
         self.llm_service = llm_service
-        self.db = SessionLocal()
+        self.session_factory = session_factory
+        self.db = session_factory()
+        if idle_timeout is None:
+            idle_timeout = float(os.getenv("CALL_IDLE_TIMEOUT_SECONDS", "300"))
+        self.lifecycle = CallLifecycleScheduler(
+            self.expire_simulation,
+            idle_timeout=idle_timeout,
+            state_backend=state_backend
+        )
+        self.pipeline = PostTurnPipeline(
+            session_factory,
+            workers=int(os.getenv("POST_TURN_WORKERS", "2")),
+            max_queue=int(os.getenv("POST_TURN_QUEUE_SIZE", "1000")),
+            key_field="simulation_id"
+        )
+        self.pipeline.register_stage("transcript", self._persist_transcript)
+        # Both fold each turn into what the turns before it left, so a
+        # retry (which runs after the call's later turns) would misorder them
+        self.pipeline.register_stage("sentiment", self._update_sentiment, retry=False)
+        self.pipeline.register_stage("network", self._record_network, retry=False)
+        self.network_profile = os.getenv("NETWORK_PROFILE", DEFAULT_PROFILE)
+        self.network_seed = os.getenv("NETWORK_SEED")
+        self._networks: Dict[str, NetworkSimulator] = {}
+        self._network_lock = threading.Lock()
+        self.sentiment_service = SentimentService()
+        self.sentiment_tracker = SentimentTracker(
+            window=int(os.getenv("SENTIMENT_WINDOW_TURNS", "5")),
+            alpha=float(os.getenv("SENTIMENT_EMA_ALPHA", "0.5")),
+            ema_threshold=float(os.getenv("SENTIMENT_ESCALATION_EMA", "-0.3")),
+            min_threshold=float(os.getenv("SENTIMENT_ESCALATION_MIN", "-0.6")),
+            slope_threshold=float(os.getenv("SENTIMENT_ESCALATION_SLOPE", "-0.25")),
+            min_turns=int(os.getenv("SENTIMENT_ESCALATION_MIN_TURNS", "2"))
+        )
+        self.admission = AdmissionController(
+            max_concurrency=int(os.getenv("LLM_MAX_CONCURRENCY", "8")),
+            max_queue_depth=int(os.getenv("LLM_MAX_QUEUE_DEPTH", "32")),
+            max_wait=float(os.getenv("LLM_MAX_QUEUE_WAIT_SECONDS", "5")),
+            class_weights=self._parse_class_weights(os.getenv("LLM_CLASS_WEIGHTS")),
+            aging_after=float(os.getenv("LLM_PRIORITY_AGING_SECONDS", "2"))
+        )
+        self.presence = PresenceIndex(state_backend or InProcessStateBackend())
+        self.acd = CallDistributor(on_assign=self._connect_agent, presence=self.presence)
+        self._end_listeners: List[Callable[[str], None]] = []
 
     def __del__(self):
         self.db.close()
 
-    def start_simulation(self) -> str:
-        """Start a new call simulation"""
+    def add_end_listener(self, callback: Callable[[str], None]) -> None:
+        """Call callback(simulation_id) whenever a call ends, is expired or is handed to an agent"""
+        self._end_listeners.append(callback)
+
+    def _notify_ended(self, simulation_id: str) -> None:
+        for listener in self._end_listeners:
+            try:
+                listener(simulation_id)
+            except Exception as e:
+                logger.error(f"Error in end listener for simulation {simulation_id}: {str(e)}")
+
+    @staticmethod
+    def _parse_class_weights(spec: Optional[str]) -> Optional[Dict[str, float]]:
+        """Parse "escalated=8,standard=4,low=1" into a weight map"""
+        if not spec:
+            return None
+        weights = {}
+        for item in spec.split(","):
+            name, weight = item.split("=")
+            weights[name.strip()] = float(weight)
+        return weights
+
+    @staticmethod
+    def _priority_class(simulation: CallSimulation) -> str:
+        """Pick the LLM scheduling class for a call from its tags and sentiment escalation state"""
+        tags = set(simulation.tags or [])
+        sentiment = (simulation.quality_metrics or {}).get("sentiment") or {}
+        if sentiment.get("esc") or tags & ESCALATED_TAGS:
+            return "escalated"
+        if tags & LOW_PRIORITY_TAGS:
+            return "low"
+        return "standard"
+
+    def _get_simulation(self, simulation_id: str) -> Optional[CallSimulation]:
+        # Background workers update calls through their own sessions, so
+        # always reload rather than trust this session's identity map
+        return (
+            self.db.query(CallSimulation)
+            .filter(CallSimulation.id == simulation_id)
+            .populate_existing()
+            .first()
+        )
+
+    def start_simulation(self, call_sid: Optional[str] = None, network_profile: Optional[str] = None) -> str:
+        """
+        Start a new call simulation, optionally for a Twilio call.
+
+        The caller's connection follows network_profile (NETWORK_PROFILE by
+        default); each turn adds a latency, jitter and loss sample to it.
+
+        Raises:
+            ValueError: Unknown network profile
+        """
+        profile = get_profile(network_profile or self.network_profile)
         simulation_id = str(uuid.uuid4())
         simulation = CallSimulation(
             id=simulation_id,
+            call_sid=call_sid,
             status="in-progress",
             start_time=datetime.utcnow(),
-            quality_metrics={
-                "network_latency": 50,  # ms
-                "packet_loss": 0.01,    # 1%
-                "jitter": 5,            # ms
-                "sentiment_score": 0.0
-            }
+            quality_metrics={"network_profile": profile.name},
+            sentiment_score=0.0
         )
         
+        # Runs in the threadpool for the Twilio endpoints, so it must not
+        # share self.db with handlers on the event loop
+        db = self.session_factory()
         try:
-            self.db.add(simulation)
-            self.db.commit()
+            db.add(simulation)
+            db.add(NetworkSeries(simulation_id=simulation_id, profile=profile.name, samples=0))
+            db.commit()
+            self.lifecycle.touch(simulation_id)
             return simulation_id
         except Exception as e:
             logger.error(f"Error starting simulation: {str(e)}")
-            self.db.rollback()
+            db.rollback()
             return None
+        finally:
+            db.close()
 
     def end_simulation(self, simulation_id: str) -> bool:
-        """End an active call simulation"""
-        simulation = self.db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
-        if not simulation or simulation.status != "in-progress":
+        """End an active call simulation; a caller still waiting for an agent abandons the queue"""
+        simulation = self._get_simulation(simulation_id)
+        if not simulation or simulation.status not in ("in-progress", "queued"):
             return False
         
         try:
-            simulation.status = "completed"
+            if simulation.status == "queued":
+                self.acd.cancel(simulation_id)
+                simulation.status = "abandoned"
+            else:
+                simulation.status = "completed"
             simulation.end_time = datetime.utcnow()
             simulation.resolution_time = int((simulation.end_time - simulation.start_time).total_seconds())
             self.db.commit()
+            self.lifecycle.forget(simulation_id)
+            self._networks.pop(simulation_id, None)
+            self._notify_ended(simulation_id)
             return True
         except Exception as e:
             logger.error(f"Error ending simulation: {str(e)}")
@@ -58,59 +187,349 @@ class SimulationService:
             return False
 
     def process_message(self, simulation_id: str, message: str) -> Optional[str]:
-        """Process a message in the simulation"""
-        simulation = self.db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
-        if not simulation or simulation.status != "in-progress":
+        """
+        Process a message in the simulation.
+
+        Safe to call from several threads at once: the call is looked up in
+        a short-lived session and everything after the LLM call is handed to
+        the post-turn pipeline.
+
+        Raises:
+            AdmissionRejected: The LLM is saturated and the caller should retry
+        """
+        priority_class = self._active_priority_class(simulation_id)
+        if priority_class is None:
             logger.warning(f"Attempted to process message for invalid simulation ID: {simulation_id}")
             return None
         
+        self.lifecycle.touch(simulation_id, engaged=True)
         try:
             # Log incoming message
             logger.info(f"Processing message for simulation {simulation_id}: {message[:100]}...")
-            
-            # Add user message to database
-            user_message = Message(
-                simulation_id=simulation_id,
-                content=message,
-                sender="user",
-                timestamp=datetime.utcnow()
-            )
-            self.db.add(user_message)
+            user_timestamp = datetime.utcnow()
             
             # Get AI response
             try:
-                response = self.llm_service.get_response(message)
+                with self.admission.slot(priority_class):
+                    response = self.llm_service.get_response(message)
                 logger.info(f"Received LLM response for simulation {simulation_id}")
+            except AdmissionRejected:
+                logger.warning(f"LLM saturated, rejected message for simulation {simulation_id}")
+                raise
             except Exception as llm_error:
                 logger.error(f"LLM service error for simulation {simulation_id}: {str(llm_error)}")
+                self.record_turn(simulation_id, message, None, user_timestamp)
                 return "I apologize, but I'm experiencing technical difficulties. Please try again in a moment."
             
-            # Add AI response to database
-            agent_message = Message(
-                simulation_id=simulation_id,
-                content=response,
-                sender="agent",
-                timestamp=datetime.utcnow()
-            )
-            self.db.add(agent_message)
-            
-            # Update sentiment score
-            simulation.quality_metrics["sentiment_score"] = self._analyze_sentiment(message)
-            
-            self.db.commit()
+            self.record_turn(simulation_id, message, response, user_timestamp)
             return response
+        except AdmissionRejected:
+            raise
         except Exception as e:
             logger.error(f"Error processing message for simulation {simulation_id}: {str(e)}")
-            self.db.rollback()
             return "I apologize, but I'm having trouble processing your message. Could you please try again?"
 
+    def _active_priority_class(self, simulation_id: str) -> Optional[str]:
+        """Scheduling class of an in-progress call, or None if the call is not active"""
+        db = self.session_factory()
+        try:
+            simulation = db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
+            if not simulation or simulation.status != "in-progress":
+                return None
+            return self._priority_class(simulation)
+        finally:
+            db.close()
+
+    def is_active(self, simulation_id: str) -> bool:
+        return self._active_priority_class(simulation_id) is not None
+
+    def stream_message(self, simulation_id: str, message: str) -> Optional[Iterator[str]]:
+        """
+        Like process_message, but the reply is returned as text deltas while
+        the LLM generates it.
+
+        Returns:
+            Iterator over the reply, or None if the call is not active. The
+            turn is recorded once the iterator finishes or is closed.
+
+        Raises:
+            AdmissionRejected: From the first next() when the LLM is saturated
+        """
+        priority_class = self._active_priority_class(simulation_id)
+        if priority_class is None:
+            logger.warning(f"Attempted to stream message for invalid simulation ID: {simulation_id}")
+            return None
+        self.lifecycle.touch(simulation_id, engaged=True)
+        return self._stream_reply(simulation_id, message, priority_class, datetime.utcnow())
+
+    def _stream_reply(self, simulation_id: str, message: str, priority_class: str,
+                      user_timestamp: datetime) -> Iterator[str]:
+        parts = []
+        completed = False
+        rejected = False
+        try:
+            with self.admission.slot(priority_class):
+                try:
+                    for delta in self.llm_service.stream_response(message):
+                        parts.append(delta)
+                        yield delta
+                    completed = True
+                except Exception as llm_error:
+                    logger.error(f"LLM service error for simulation {simulation_id}: {str(llm_error)}")
+                    if not parts:
+                        yield "I apologize, but I'm experiencing technical difficulties. Please try again in a moment."
+        except AdmissionRejected:
+            rejected = True
+            logger.warning(f"LLM saturated, rejected message for simulation {simulation_id}")
+            raise
+        finally:
+            # A failed or abandoned reply is recorded like an LLM error
+            if not rejected:
+                self.record_turn(simulation_id, message, "".join(parts) if completed else None, user_timestamp)
+
+    def record_turn(self, simulation_id: str, message: str, response: Optional[str],
+                    user_timestamp: Optional[datetime] = None) -> None:
+        """Hand a finished turn to the post-turn pipeline"""
+        user_timestamp = user_timestamp or datetime.utcnow()
+        self.pipeline.submit({
+            "simulation_id": simulation_id,
+            "user_message": message,
+            "agent_response": response,
+            "user_timestamp": user_timestamp.isoformat(),
+            "agent_timestamp": datetime.utcnow().isoformat()
+        })
+
+    def _persist_transcript(self, turn: Dict, db: Session) -> None:
+        """Post-turn stage: store both sides of the turn"""
+        db.add(Message(
+            simulation_id=turn["simulation_id"],
+            content=turn["user_message"],
+            sender="user",
+            timestamp=datetime.fromisoformat(turn["user_timestamp"])
+        ))
+        if turn["agent_response"] is not None:
+            db.add(Message(
+                simulation_id=turn["simulation_id"],
+                content=turn["agent_response"],
+                sender="agent",
+                timestamp=datetime.fromisoformat(turn["agent_timestamp"])
+            ))
+
+    def _update_sentiment(self, turn: Dict, db: Session) -> None:
+        """Post-turn stage: fold the caller's message into the call's running sentiment"""
+        simulation = db.query(CallSimulation).filter(CallSimulation.id == turn["simulation_id"]).first()
+        if not simulation:
+            return
+        score = self.sentiment_service.analyze_text(turn["user_message"])["compound"]
+        metrics = simulation.quality_metrics or {}
+        state, event = self.sentiment_tracker.update(simulation.id, score, metrics.get("sentiment"))
+        simulation.quality_metrics = {**metrics, "sentiment": state.to_dict()}
+        # The call's score is the average over its caller messages, as the
+        # sentiment backfill and batch transcription store it
+        previous = simulation.sentiment_score or 0.0
+        simulation.sentiment_score = previous + (score - previous) / state.turns
+        if event:
+            self._flag_escalation(simulation, event)
+
+    def _record_network(self, turn: Dict, db: Session) -> None:
+        """
+        Post-turn stage: add the turn's simulated latency, jitter and loss to the call's series.
+
+        Only the last chunk of samples is rewritten and the summary is kept
+        as running averages and a latency sketch, so a turn costs the same
+        however long the call has run.
+        """
+        simulation_id = turn["simulation_id"]
+        series = db.query(NetworkSeries).filter(NetworkSeries.simulation_id == simulation_id).first()
+        if not series:
+            return
+        count = series.samples or 0
+        chunk = db.get(NetworkChunk, (simulation_id, (count - 1) // CHUNK_SAMPLES)) if count else None
+        status = db.query(CallSimulation.status).filter(CallSimulation.id == simulation_id).scalar()
+        latency, jitter, loss = self._next_network_sample(series, chunk, keep=status == "in-progress")
+
+        if chunk is None or count % CHUNK_SAMPLES == 0:
+            chunk = NetworkChunk(simulation_id=simulation_id, chunk=count // CHUNK_SAMPLES,
+                                 latency_ms=b"", jitter_ms=b"", packet_loss=b"")
+            db.add(chunk)
+        chunk.latency_ms = (chunk.latency_ms or b"") + pack_series([latency])
+        chunk.jitter_ms = (chunk.jitter_ms or b"") + pack_series([jitter])
+        chunk.packet_loss = (chunk.packet_loss or b"") + pack_series([loss])
+
+        count += 1
+        series.samples = count
+        series.avg_latency_ms = (series.avg_latency_ms or 0.0) + (latency - (series.avg_latency_ms or 0.0)) / count
+        series.avg_jitter_ms = (series.avg_jitter_ms or 0.0) + (jitter - (series.avg_jitter_ms or 0.0)) / count
+        series.avg_packet_loss = (series.avg_packet_loss or 0.0) + (loss - (series.avg_packet_loss or 0.0)) / count
+        sketch = unpack_sketch(series.latency_sketch)
+        sketch_add(sketch, latency)
+        series.latency_sketch = pack_sketch(sketch)
+        series.p95_latency_ms = sketch_percentile(sketch, 95)
+
+    def _next_network_sample(self, series: NetworkSeries, last_chunk: Optional[NetworkChunk], keep: bool):
+        """
+        The call's next sample. The simulator is cached only while the call
+        is in progress (keep), so a late turn of an ended call does not
+        leave one behind.
+        """
+        with self._network_lock:
+            simulator = self._networks.get(series.simulation_id)
+            if simulator is None:
+                try:
+                    profile = get_profile(series.profile)
+                except ValueError:
+                    logger.warning(f"Unknown network profile {series.profile!r} for simulation "
+                                   f"{series.simulation_id}, using {DEFAULT_PROFILE}")
+                    profile = get_profile(DEFAULT_PROFILE)
+                seed = None
+                if self.network_seed is not None:
+                    seed = [int(self.network_seed), zlib.crc32(series.simulation_id.encode()), series.samples or 0]
+                if last_chunk is not None and last_chunk.latency_ms:
+                    # Another worker or a previous process ran the earlier turns
+                    simulator = NetworkSimulator.resume(
+                        profile, float(unpack_series(last_chunk.latency_ms)[-1]),
+                        float(unpack_series(last_chunk.jitter_ms)[-1]),
+                        float(unpack_series(last_chunk.packet_loss)[-1]),
+                        seed=seed
+                    )
+                else:
+                    simulator = NetworkSimulator(profile, seed=seed)
+                if keep:
+                    self._networks[series.simulation_id] = simulator
+            elif not keep:
+                self._networks.pop(series.simulation_id, None)
+            return simulator.next_turn()
+
+    def get_network_series(self, simulation_id: str) -> Optional[Dict]:
+        """A call's per-turn network samples and their summary, or None if it has none"""
+        db = self.session_factory()
+        try:
+            series = db.query(NetworkSeries).filter(NetworkSeries.simulation_id == simulation_id).first()
+            if not series:
+                return None
+            chunks = (
+                db.query(NetworkChunk)
+                .filter(NetworkChunk.simulation_id == simulation_id)
+                .order_by(NetworkChunk.chunk)
+                .all()
+            )
+            latency, jitter, loss = (
+                np.concatenate([unpack_series(getattr(chunk, column)) for chunk in chunks])
+                if chunks else unpack_series(None)
+                for column in ("latency_ms", "jitter_ms", "packet_loss")
+            )
+            return {
+                "simulation_id": simulation_id,
+                "profile": series.profile,
+                "latency_ms": [round(float(value), 2) for value in latency],
+                "jitter_ms": [round(float(value), 2) for value in jitter],
+                "packet_loss": [round(float(value), 5) for value in loss],
+                "summary": stored_summary(series)
+            }
+        finally:
+            db.close()
+
+    @staticmethod
+    def _flag_escalation(simulation: CallSimulation, event: Dict) -> None:
+        """Tag a call whose caller turned negative and suggest a transfer"""
+        logger.warning(f"Sentiment escalation for simulation {simulation.id}: {event}")
+        if ESCALATION_TAG not in (simulation.tags or []):
+            simulation.tags = list(simulation.tags or []) + [ESCALATION_TAG]
+        simulation.notes = list(simulation.notes or []) + [{
+            "content": (
+                f"Caller sentiment is turning negative ({', '.join(event['reasons'])}: "
+                f"average {event['ema']}, low {event['window_min']}, trend {event['slope']}). "
+                "Consider transferring to a supervisor."
+            ),
+            "timestamp": datetime.utcnow().isoformat()
+        }]
+
+    def expire_simulation(self, simulation_id: str, last_activity: datetime, engaged: bool) -> bool:
+        """
+        Close a call that went idle.
+
+        Runs on the lifecycle scheduler thread, so it uses its own session.
+        Calls where the caller spoke are completed, the rest are abandoned;
+        either way the call ends at its last recorded activity.
+        """
+        db = self.session_factory()
+        try:
+            simulation = db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
+            if not simulation or simulation.status != "in-progress":
+                return False
+
+            simulation.status = "completed" if engaged else "abandoned"
+            simulation.end_time = max(last_activity, simulation.start_time)
+            simulation.resolution_time = int((simulation.end_time - simulation.start_time).total_seconds())
+            simulation.tags = list(simulation.tags or []) + ["idle-timeout"]
+            db.commit()
+            self._networks.pop(simulation_id, None)
+            self._notify_ended(simulation_id)
+            logger.info(f"Simulation {simulation_id} {simulation.status} after idle timeout")
+            return True
+        except Exception as e:
+            logger.error(f"Error expiring simulation {simulation_id}: {str(e)}")
+            db.rollback()
+            return False
+        finally:
+            db.close()
+
+    def resume_lifecycle(self) -> int:
+        """Start tracking calls left in progress by a previous process"""
+        last_messages = (
+            self.db.query(Message.simulation_id, func.max(Message.timestamp).label("last_activity"))
+            .filter(Message.sender == "user")
+            .group_by(Message.simulation_id)
+            .subquery()
+        )
+        rows = (
+            self.db.query(CallSimulation.id, CallSimulation.start_time, last_messages.c.last_activity)
+            .outerjoin(last_messages, last_messages.c.simulation_id == CallSimulation.id)
+            .filter(CallSimulation.status == "in-progress")
+            .all()
+        )
+        for simulation_id, start_time, last_activity in rows:
+            activity = last_activity or start_time
+            self.lifecycle.touch(
+                simulation_id,
+                engaged=last_activity is not None,
+                timestamp=activity.replace(tzinfo=timezone.utc).timestamp()
+            )
+        return len(rows)
+
     def get_simulation_details(self, simulation_id: str) -> Optional[Dict]:
         """Get details about a specific simulation"""
-        simulation = self.db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
+        simulation = self._get_simulation(simulation_id)
         if not simulation:
             return None
         
-        messages = self.db.query(Message).filter(Message.simulation_id == simulation_id).all()
+        messages = (
+            self.db.query(Message)
+            .filter(Message.simulation_id == simulation_id)
+            .order_by(Message.timestamp, Message.id)
+            .all()
+        )
+        quality_metrics = dict(simulation.quality_metrics or {})
+        series = (
+            self.db.query(NetworkSeries)
+            .filter(NetworkSeries.simulation_id == simulation_id)
+            .populate_existing()
+            .first()
+        )
+        if series and series.samples:
+            quality_metrics.update({
+                "network_latency": series.avg_latency_ms,
+                "packet_loss": series.avg_packet_loss,
+                "jitter": series.avg_jitter_ms,
+                "network_samples": series.samples
+            })
+        else:
+            # No turns yet, or a call recorded without a series (older
+            # calls keep the values they were stored with)
+            for key in ("network_latency", "packet_loss", "jitter"):
+                if quality_metrics.get(key) is None:
+                    quality_metrics[key] = 0.0
+            quality_metrics["network_samples"] = 0
         
         return {
             "id": simulation.id,
@@ -118,7 +537,7 @@ class SimulationService:
             "start_time": simulation.start_time.isoformat(),
             "end_time": simulation.end_time.isoformat() if simulation.end_time else None,
             "resolution_time": simulation.resolution_time,
-            "quality_metrics": simulation.quality_metrics,
+            "quality_metrics": quality_metrics,
             "messages": [
                 {
                     "content": msg.content,
@@ -129,7 +548,7 @@ class SimulationService:
             ],
             "notes": simulation.notes,
             "tags": simulation.tags,
-            "sentiment_score": simulation.quality_metrics.get("sentiment_score", 0.0)
+            "sentiment_score": simulation.sentiment_score or 0.0
         }
 
     def get_all_simulations(self) -> List[Dict]:
@@ -142,43 +561,165 @@ class SimulationService:
                 "start_time": sim.start_time.isoformat(),
                 "end_time": sim.end_time.isoformat() if sim.end_time else None,
                 "resolution_time": sim.resolution_time,
-                "sentiment_score": sim.quality_metrics.get("sentiment_score", 0.0)
+                "sentiment_score": sim.sentiment_score or 0.0
             }
             for sim in simulations
         ]
 
-    def transfer_call(self, simulation_id: str, agent: str, reason: str) -> bool:
-        """Transfer a call to another agent"""
-        simulation = self.db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
+    def transfer_call(self, simulation_id: str, target: str, reason: str) -> bool:
+        """
+        Queue a call for a human agent.
+
+        Args:
+            simulation_id: The call to transfer
+            target: A skill, or an agent id for a transfer to that agent
+            reason: Why the call is transferred
+
+        Returns:
+            False if the call is not active, or the target is neither an
+            agent who is logged in (not offline) nor a skill such an agent
+            has. The call waits with status "queued" until the ACD hands it
+            to an agent, at which point it becomes "transferred".
+        """
+        db = self.session_factory()
+        try:
+            return self._transfer(db, simulation_id, target, reason)
+        finally:
+            db.close()
+
+    def _transfer(self, db: Session, simulation_id: str, target: str, reason: str) -> bool:
+        simulation = db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
         if not simulation or simulation.status != "in-progress":
             return False
+        agent = self.presence.get(target)
+        if agent is not None and agent.state != "offline":
+            skill = agent_skill(target)
+        elif self.presence.is_staffed(target):
+            skill = target
+        else:
+            logger.warning(f"No agent can take transfers for {target}")
+            return False
         
         try:
-            simulation.transferred_to = agent
             simulation.transfer_reason = reason
-            simulation.status = "transferred"
-            simulation.end_time = datetime.utcnow()
-            simulation.resolution_time = int((simulation.end_time - simulation.start_time).total_seconds())
-            self.db.commit()
-            return True
+            simulation.transfer_skill = skill
+            simulation.status = "queued"
+            db.commit()
+            self.lifecycle.forget(simulation_id)
+            self._networks.pop(simulation_id, None)
         except Exception as e:
             logger.error(f"Error transferring call: {str(e)}")
-            self.db.rollback()
+            db.rollback()
+            return False
+        try:
+            self.acd.enqueue(simulation_id, skill, self._priority_class(simulation))
+        except ValueError as e:
+            # The last agent with the skill left in the meantime
+            logger.warning(f"Could not queue simulation {simulation_id}: {str(e)}")
+            db.query(CallSimulation).filter(
+                CallSimulation.id == simulation_id, CallSimulation.status == "queued"
+            ).update({"status": "in-progress"}, synchronize_session=False)
+            db.commit()
+            self.lifecycle.touch(simulation_id)
+            return False
+        return True
+
+    def _connect_agent(self, simulation_id: str, agent: Agent) -> None:
+        """
+        ACD callback: a queued call has been handed to an agent.
+
+        Every worker that was running when a call was queued, or started
+        since, may have it in its queue; only a call that is still queued
+        is connected, and otherwise the agent's slot is given back.
+        """
+        db = self.session_factory()
+        try:
+            simulation = db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
+            if not simulation:
+                return
+            end_time = datetime.utcnow()
+            connected = db.query(CallSimulation).filter(
+                CallSimulation.id == simulation_id, CallSimulation.status == "queued"
+            ).update({
+                "transferred_to": agent.agent_id,
+                "status": "transferred",
+                "end_time": end_time,
+                "resolution_time": int((end_time - simulation.start_time).total_seconds())
+            }, synchronize_session=False)
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error connecting simulation {simulation_id} to agent {agent.agent_id}: {str(e)}")
+            db.rollback()
+            return
+        finally:
+            db.close()
+        if not connected:
+            logger.info(f"Simulation {simulation_id} is no longer queued, freeing agent {agent.agent_id}")
+            self.acd.complete(simulation_id)
+            return
+        self._notify_ended(simulation_id)
+        logger.info(f"Simulation {simulation_id} transferred to agent {agent.agent_id}")
+
+    def complete_agent_call(self, agent_id: str, simulation_id: str) -> bool:
+        """
+        An agent finished a transferred call; they get the next waiting one.
+
+        The call may have been routed by another worker, or before a
+        restart, so the database says who has it when the ACD here does not.
+
+        Returns:
+            False if the call is not with the agent
+        """
+        assigned = self.acd.assigned_agent(simulation_id)
+        if assigned is None:
+            db = self.session_factory()
+            try:
+                simulation = db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
+                if simulation and simulation.status == "transferred":
+                    assigned = simulation.transferred_to
+            finally:
+                db.close()
+        if assigned != agent_id:
             return False
+        self.acd.complete(simulation_id)
+        return True
+
+    def resume_transfers(self) -> int:
+        """Queue the calls a previous process left waiting for an agent again"""
+        self.presence.reload()
+        queued = (
+            self.db.query(CallSimulation)
+            .filter(CallSimulation.status == "queued")
+            .order_by(CallSimulation.start_time)
+            .all()
+        )
+        for simulation in queued:
+            if self.acd.is_queued(simulation.id) or self.acd.assigned_agent(simulation.id):
+                continue
+            try:
+                if not simulation.transfer_skill:
+                    raise ValueError("it was queued before transfer targets were stored")
+                self.acd.enqueue(simulation.id, simulation.transfer_skill, self._priority_class(simulation))
+            except ValueError as e:
+                # As in transfer_call: nobody can take it, so the call carries on
+                logger.warning(f"Could not queue simulation {simulation.id} again: {str(e)}")
+                simulation.status = "in-progress"
+                self.db.commit()
+                self.lifecycle.touch(simulation.id)
+        return len(queued)
 
     def add_note(self, simulation_id: str, note: str) -> bool:
         """Add a note to the call"""
-        simulation = self.db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
+        simulation = self._get_simulation(simulation_id)
         if not simulation:
             return False
         
         try:
-            if not simulation.notes:
-                simulation.notes = []
-            simulation.notes.append({
+            # Assign a new list: in-place changes to a JSON column are not tracked
+            simulation.notes = list(simulation.notes or []) + [{
                 "content": note,
                 "timestamp": datetime.utcnow().isoformat()
-            })
+            }]
             self.db.commit()
             return True
         except Exception as e:
@@ -188,31 +729,16 @@ class SimulationService:
 
     def add_tag(self, simulation_id: str, tag: str) -> bool:
         """Add a tag to the call"""
-        simulation = self.db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
+        simulation = self._get_simulation(simulation_id)
         if not simulation:
             return False
         
         try:
-            if not simulation.tags:
-                simulation.tags = []
-            if tag not in simulation.tags:
-                simulation.tags.append(tag)
+            if tag not in (simulation.tags or []):
+                simulation.tags = list(simulation.tags or []) + [tag]
             self.db.commit()
             return True
         except Exception as e:
             logger.error(f"Error adding tag: {str(e)}")
             self.db.rollback()
             return False
-
-    def _analyze_sentiment(self, message: str) -> float:
-        """Basic sentiment analysis"""
-        positive_words = ["happy", "great", "excellent", "good", "thanks", "helpful"]
-        negative_words = ["bad", "poor", "terrible", "unhappy", "frustrated", "angry"]
-        
-        words = message.lower().split()
-        positive_count = sum(1 for w in words if w in positive_words)
-        negative_count = sum(1 for w in words if w in negative_words)
-        
-        if positive_count + negative_count > 0:
-            return (positive_count - negative_count) / (positive_count + negative_count)
-        return 0.0 
\ No newline at end of file
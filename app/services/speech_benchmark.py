@@ -0,0 +1,162 @@
+"""
+Compare speech-to-text configurations for speed and accuracy.
+
+Each configuration transcribes the same clips and reports its real-time
+factor (processing time / audio duration; below 1 is faster than real
+time) and word error rate against reference transcripts, with deltas from
+the first configuration. Clips are audio files with a same-named .txt
+file holding the reference transcript:
+
+    clips/billing-question.wav
+    clips/billing-question.txt
+
+A configuration is MODEL[:int8][:tTHREADS], e.g.
+
+    python -m app.services.speech_benchmark clips/ base base:int8 base:int8:t2
+"""
+import argparse
+import os
+import re
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+from app.services.audio_processing import WHISPER_SAMPLE_RATE, load_audio
+from app.services.speech_server import Clip, WhisperTranscriber
+
+AUDIO_SUFFIXES = {".wav", ".flac", ".ogg", ".mp3"}
+
+BenchmarkClip = Tuple[str, np.ndarray, str]
+
+
+def _words(text: str) -> List[str]:
+    # Case and punctuation are not transcription errors
+    return re.findall(r"[a-z0-9']+", text.lower())
+
+
+def word_errors(reference: str, hypothesis: str) -> Tuple[int, int]:
+    """Word-level edit distance and reference length"""
+    ref, hyp = _words(reference), _words(hypothesis)
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i]
+        for j, hyp_word in enumerate(hyp, 1):
+            current.append(min(
+                previous[j] + 1,                             # deletion
+                current[j - 1] + 1,                          # insertion
+                previous[j - 1] + (ref_word != hyp_word)     # substitution
+            ))
+        previous = current
+    return previous[-1], len(ref)
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """
+    Word error rate: (substitutions + deletions + insertions) / reference words.
+
+    Returns:
+        float: 0.0 for a perfect transcript; may exceed 1.0 when the
+        hypothesis has many insertions
+    """
+    errors, words = word_errors(reference, hypothesis)
+    if words == 0:
+        return float(errors > 0)
+    return errors / words
+
+
+def load_clips(directory: Path) -> List[BenchmarkClip]:
+    """(name, 16 kHz samples, reference transcript) for every clip with a transcript"""
+    clips = []
+    for path in sorted(Path(directory).iterdir()):
+        reference = path.with_suffix(".txt")
+        if path.suffix.lower() in AUDIO_SUFFIXES and reference.exists():
+            clips.append((path.name, load_audio(path.read_bytes()), reference.read_text(encoding="utf-8").strip()))
+    return clips
+
+
+def run_benchmark(transcribe_batch: Callable[[List[Clip]], List[str]], clips: List[BenchmarkClip]) -> Dict:
+    """
+    Transcribe each clip on its own and score the results.
+
+    The first clip is transcribed once before timing starts so model
+    loading is not counted. WER is over the whole set (total errors over
+    total reference words), so long clips weigh more than short ones.
+    """
+    if not clips:
+        raise ValueError("No clips to benchmark")
+    transcribe_batch([clips[0][1]])
+
+    seconds = 0.0
+    errors = words = 0
+    per_clip = []
+    for name, samples, reference in clips:
+        started = time.perf_counter()
+        text = transcribe_batch([samples])[0]
+        elapsed = time.perf_counter() - started
+        clip_errors, clip_words = word_errors(reference, text)
+        seconds += elapsed
+        errors += clip_errors
+        words += clip_words
+        per_clip.append({
+            "clip": name,
+            "rtf": elapsed / (len(samples) / WHISPER_SAMPLE_RATE),
+            "wer": clip_errors / clip_words if clip_words else float(clip_errors > 0),
+            "text": text
+        })
+
+    audio_seconds = sum(len(samples) for _, samples, _ in clips) / WHISPER_SAMPLE_RATE
+    return {
+        "clips": len(clips),
+        "audio_seconds": round(audio_seconds, 2),
+        "seconds": round(seconds, 2),
+        "rtf": seconds / audio_seconds,
+        "wer": errors / words if words else 0.0,
+        "per_clip": per_clip
+    }
+
+
+def parse_config(spec: str) -> Dict:
+    """"base:int8:t4" -> {"model_name": "base", "quantize": "int8", "threads": 4}"""
+    model_name, *options = spec.split(":")
+    config = {"model_name": model_name, "quantize": None, "threads": None}
+    for option in options:
+        if option == "int8":
+            config["quantize"] = "int8"
+        elif option.startswith("t") and option[1:].isdigit():
+            config["threads"] = int(option[1:])
+        else:
+            raise ValueError(f"Unknown option {option!r} in {spec!r}")
+    return config
+
+
+def compare(results: List[Tuple[str, Dict]]) -> str:
+    """A table of RTF and WER per configuration, with deltas from the first"""
+    _, baseline = results[0]
+    lines = [f"{'config':<20}{'RTF':>8}{'speedup':>10}{'WER':>8}{'WER delta':>12}"]
+    for spec, result in results:
+        lines.append(
+            f"{spec:<20}{result['rtf']:>8.3f}{baseline['rtf'] / result['rtf']:>9.2f}x"
+            f"{result['wer'] * 100:>7.1f}%{(result['wer'] - baseline['wer']) * 100:>+11.1f}%"
+        )
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark speech-to-text speed and accuracy")
+    parser.add_argument("clips", type=Path, help="directory of audio files with .txt references")
+    parser.add_argument("configs", nargs="+", help="MODEL[:int8][:tTHREADS]; the first is the baseline")
+    parser.add_argument("--device", default="cpu")
+    options = parser.parse_args()
+
+    clips = load_clips(options.clips)
+    print(f"{len(clips)} clips, {sum(len(s) for _, s, _ in clips) / WHISPER_SAMPLE_RATE:.1f}s of audio")
+    results = []
+    for spec in options.configs:
+        config = parse_config(spec)
+        # torch's thread count is process-wide, so set it for every config
+        config["threads"] = config["threads"] or os.cpu_count()
+        transcriber = WhisperTranscriber(device=options.device, **config)
+        results.append((spec, run_benchmark(transcriber.transcribe_batch, clips)))
+        print(f"{spec}: RTF {results[-1][1]['rtf']:.3f}, WER {results[-1][1]['wer'] * 100:.1f}%")
+    print()
+    print(compare(results))
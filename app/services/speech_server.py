@@ -0,0 +1,354 @@
+"""
+Shared speech model server.
+
+One process holds the Whisper model and serves every web worker over a
+local socket, so the model is loaded (and kept in memory) once instead of
+once per worker. The model is loaded on the first request, not at startup.
+Requests that arrive close together are decoded as one batch.
+
+    SPEECH_SERVER_AUTHKEY=... python -m app.services.speech_server --address 127.0.0.1:6390
+    SPEECH_SERVER_AUTHKEY=... SPEECH_SERVER_ADDRESS=127.0.0.1:6390 uvicorn app.main:app --workers 8
+
+Requests are pickled, and unpickling runs code, so the connection is only
+as safe as its key: SPEECH_SERVER_AUTHKEY is required and must be secret.
+"""
+import argparse
+import os
+import queue
+import tempfile
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Connection, Listener
+from typing import Callable, List, Optional, Tuple, Union
+import numpy as np
+from app.core.logger import logger
+
+Address = Union[str, Tuple[str, int]]
+# A request is either a 16 kHz float32 array or encoded audio file bytes
+Clip = Union[np.ndarray, bytes]
+
+
+def parse_address(address: str) -> Address:
+    """"host:port" for TCP, anything else is a Unix socket path"""
+    host, _, port = address.rpartition(":")
+    if host and port.isdigit():
+        return host, int(port)
+    return address
+
+
+def _authkey() -> bytes:
+    """
+    Raises:
+        ValueError: SPEECH_SERVER_AUTHKEY is not set
+    """
+    authkey = os.getenv("SPEECH_SERVER_AUTHKEY")
+    if not authkey:
+        raise ValueError("SPEECH_SERVER_AUTHKEY not found in environment variables")
+    return authkey.encode()
+
+
+def configure_torch_threads(threads: Optional[int] = None, interop_threads: Optional[int] = None) -> None:
+    """
+    Size torch's CPU thread pools.
+
+    threads is the intra-op pool (the threads one matrix multiply is split
+    across); interop_threads runs independent ops side by side and can only
+    be set before torch starts any parallel work.
+    """
+    import torch
+
+    if threads:
+        torch.set_num_threads(threads)
+    if interop_threads:
+        try:
+            torch.set_num_interop_threads(interop_threads)
+        except RuntimeError as e:
+            logger.warning(f"Could not set torch inter-op threads: {str(e)}")
+
+
+def quantize_dynamic(model):
+    """
+    Dynamically quantize a Whisper model's linear layers to int8.
+
+    The weights are stored as int8 and activations quantized on the fly,
+    which roughly halves CPU inference time on the attention and MLP
+    layers. Only useful on CPU; quantized layers have no CUDA kernels.
+    """
+    import torch
+    import whisper
+
+    # Whisper wraps nn.Linear in a subclass that casts weights to the input
+    # dtype; quantize_dynamic only swaps exact nn.Linear modules
+    for module in model.modules():
+        if type(module) is whisper.model.Linear:
+            module.__class__ = torch.nn.Linear
+    return torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+
+class WhisperTranscriber:
+    """
+    Loads a Whisper model on first use and transcribes batches of clips.
+
+    For CPU-only hosts the model can be quantized to int8 (quantize="int8")
+    and torch's thread pools sized with threads and interop_threads.
+    """
+
+    def __init__(self, model_name: str = "base", device: Optional[str] = None, quantize: Optional[str] = None,
+                 threads: Optional[int] = None, interop_threads: Optional[int] = None):
+        self.model_name = model_name
+        self.device = device
+        self.quantize = quantize if quantize != "none" else None
+        self.threads = threads
+        self.interop_threads = interop_threads
+        self._model = None
+        self._lock = threading.Lock()
+
+    @property
+    def model(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._load()
+        return self._model
+
+    def _load(self):
+        import whisper
+
+        started = time.monotonic()
+        configure_torch_threads(self.threads, self.interop_threads)
+        model = whisper.load_model(self.model_name, device=self.device)
+        if self.quantize == "int8":
+            if model.device.type == "cpu":
+                model = quantize_dynamic(model)
+            else:
+                logger.warning(f"Int8 quantization is CPU-only, keeping the model in float on {model.device}")
+        elif self.quantize:
+            raise ValueError(f"Unsupported quantization: {self.quantize}")
+        logger.info(
+            f"Loaded Whisper model {self.model_name} ({self.quantize or 'float'}, "
+            f"{self.threads or 'default'} threads) in {time.monotonic() - started:.1f}s"
+        )
+        return model
+
+    def transcribe_batch(self, clips: List[Clip]) -> List[str]:
+        import torch
+        import whisper
+
+        model = self.model
+        texts: List[Optional[str]] = [None] * len(clips)
+        batched = []
+        for i, clip in enumerate(clips):
+            if isinstance(clip, np.ndarray) and len(clip) <= whisper.audio.N_SAMPLES:
+                batched.append(i)
+            else:
+                texts[i] = self._transcribe_one(clip)
+
+        # Clips of up to 30 seconds fit a single decoder window, so they can
+        # share one forward pass
+        if batched:
+            mels = torch.stack([
+                whisper.log_mel_spectrogram(whisper.pad_or_trim(torch.from_numpy(clips[i])))
+                for i in batched
+            ]).to(model.device)
+            options = whisper.DecodingOptions(fp16=model.device.type == "cuda")
+            for i, result in zip(batched, whisper.decode(model, mels, options)):
+                texts[i] = result.text.strip()
+        return texts
+
+    def _transcribe_one(self, clip: Clip) -> str:
+        if isinstance(clip, np.ndarray):
+            return self.model.transcribe(clip, fp16=self.model.device.type == "cuda")["text"].strip()
+        # Encoded audio that could not be decoded in memory; Whisper's
+        # ffmpeg loader needs a file
+        temp_path = None
+        try:
+            with tempfile.NamedTemporaryFile(suffix=".audio", delete=False) as temp_file:
+                temp_path = temp_file.name
+                temp_file.write(clip)
+            return self.model.transcribe(temp_path, fp16=self.model.device.type == "cuda")["text"].strip()
+        finally:
+            if temp_path:
+                os.unlink(temp_path)
+
+
+def create_transcriber(workers: int = 1) -> WhisperTranscriber:
+    """
+    A transcriber configured from the environment.
+
+    WHISPER_MODEL, WHISPER_DEVICE (cpu or cuda; the default picks CUDA when
+    available), WHISPER_QUANTIZE (none or int8), WHISPER_THREADS and
+    WHISPER_INTEROP_THREADS. Without WHISPER_THREADS the CPUs are shared
+    evenly between the given number of workers.
+    """
+    threads = os.getenv("WHISPER_THREADS")
+    interop_threads = os.getenv("WHISPER_INTEROP_THREADS")
+    return WhisperTranscriber(
+        os.getenv("WHISPER_MODEL", "base"),
+        device=os.getenv("WHISPER_DEVICE") or None,
+        quantize=os.getenv("WHISPER_QUANTIZE", "none"),
+        threads=int(threads) if threads else max(1, (os.cpu_count() or 1) // workers),
+        interop_threads=int(interop_threads) if interop_threads else None
+    )
+
+
+class SpeechModelServer:
+    """
+    Serves transcription requests from a single model.
+
+    Each client connection gets a thread that forwards its requests to one
+    inference thread. That thread takes whatever is queued, waiting up to
+    batch_window for more once the first request arrives, and transcribes
+    up to max_batch clips per model call.
+
+    With workers > 1 there are that many inference threads, each with its
+    own model instance, so batches on a CPU host run side by side instead
+    of contending for one model.
+    """
+
+    def __init__(self, address: Address = ("127.0.0.1", 6390),
+                 transcribe_batch: Optional[Callable[[List[Clip]], List[str]]] = None,
+                 max_batch: int = 8, batch_window: float = 0.02, authkey: Optional[bytes] = None,
+                 workers: int = 1, transcriber_factory: Optional[Callable[[int], WhisperTranscriber]] = None):
+        authkey = authkey or _authkey()
+        if transcribe_batch:
+            self.transcribers = [transcribe_batch] * workers
+        else:
+            factory = transcriber_factory or create_transcriber
+            self.transcribers = [factory(workers).transcribe_batch for _ in range(workers)]
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.listener = Listener(address, backlog=64, authkey=authkey)
+        self.address = self.listener.address
+        self.batches: List[int] = []
+        self._requests: "queue.Queue[Tuple[Clip, Future]]" = queue.Queue()
+        self._running = False
+
+    def serve_forever(self) -> None:
+        self._running = True
+        for i, transcribe_batch in enumerate(self.transcribers):
+            threading.Thread(
+                target=self._inference_loop, args=(transcribe_batch,), name=f"speech-inference-{i}", daemon=True
+            ).start()
+        while self._running:
+            try:
+                connection = self.listener.accept()
+            except OSError:
+                break
+            except Exception as e:
+                logger.warning(f"Rejected speech client: {str(e)}")
+                continue
+            threading.Thread(target=self._serve_client, args=(connection,), daemon=True).start()
+
+    def start_background(self) -> threading.Thread:
+        thread = threading.Thread(target=self.serve_forever, name="speech-server", daemon=True)
+        thread.start()
+        return thread
+
+    def close(self) -> None:
+        self._running = False
+        self.listener.close()
+
+    def _serve_client(self, connection: Connection) -> None:
+        with connection:
+            while True:
+                try:
+                    clip = connection.recv()
+                except (EOFError, OSError):
+                    return
+                future: Future = Future()
+                self._requests.put((clip, future))
+                try:
+                    reply = ("ok", future.result())
+                except Exception as e:
+                    reply = ("error", str(e))
+                try:
+                    connection.send(reply)
+                except OSError:
+                    return
+
+    def _inference_loop(self, transcribe_batch: Callable[[List[Clip]], List[str]]) -> None:
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.batch_window
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            self.batches.append(len(batch))
+            try:
+                texts = transcribe_batch([clip for clip, _ in batch])
+                for (_, future), text in zip(batch, texts):
+                    future.set_result(text)
+            except Exception as e:
+                logger.error(f"Speech batch of {len(batch)} failed: {str(e)}")
+                for _, future in batch:
+                    future.set_exception(e)
+
+
+class SpeechClient:
+    """Talks to a SpeechModelServer; one connection per calling thread"""
+
+    def __init__(self, address: Address, authkey: Optional[bytes] = None):
+        self.address = parse_address(address) if isinstance(address, str) else address
+        self.authkey = authkey or _authkey()
+        self._local = threading.local()
+
+    def _connection(self) -> Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = Client(self.address, authkey=self.authkey)
+            self._local.connection = connection
+        return connection
+
+    def transcribe(self, clip: Clip) -> str:
+        """
+        Transcribe a clip on the server.
+
+        Args:
+            clip: 16 kHz mono float32 samples, or encoded audio file bytes
+
+        Returns:
+            str: Transcribed text
+
+        Raises:
+            RuntimeError: The server failed to transcribe the clip
+        """
+        try:
+            connection = self._connection()
+            connection.send(clip)
+            status, result = connection.recv()
+        except (EOFError, OSError):
+            # Drop the broken connection so the next call reconnects
+            self._local.connection = None
+            raise
+        if status != "ok":
+            raise RuntimeError(f"Speech server error: {result}")
+        return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve speech-to-text from one shared Whisper model")
+    parser.add_argument("--address", default=os.getenv("SPEECH_SERVER_ADDRESS", "127.0.0.1:6390"),
+                        help="host:port or a Unix socket path")
+    parser.add_argument("--max-batch", type=int, default=8)
+    parser.add_argument("--batch-window-ms", type=float, default=20)
+    parser.add_argument("--workers", type=int, default=int(os.getenv("SPEECH_SERVER_WORKERS", "1")),
+                        help="inference threads, each with its own model instance")
+    options = parser.parse_args()
+    try:
+        server = SpeechModelServer(
+            parse_address(options.address),
+            max_batch=options.max_batch,
+            batch_window=options.batch_window_ms / 1000,
+            workers=options.workers
+        )
+    except ValueError as e:
+        parser.error(str(e))
+    print(f"Speech server listening on {options.address} with {options.workers} worker(s) "
+          f"(models load on first request)")
+    server.serve_forever()
@@ -1,71 +1,192 @@
-import whisper
 from gtts import gTTS
-import tempfile
+from gtts.lang import tts_langs
+import functools
+import io
 import os
-import soundfile as sf
+import threading
+from pathlib import Path
+from typing import Callable, Dict, Optional, Tuple
 import numpy as np
-from typing import Tuple
+from app.core.logger import logger
+from app.services.audio_processing import WHISPER_SAMPLE_RATE, VoiceActivityDetector, load_audio
+from app.services.speech_server import Clip, SpeechClient, create_transcriber
+from app.services.streaming_stt import StreamingTranscriber
+from app.services.tts_cache import DEFAULT_CACHE_DIR, TTSCache, tts_cache_key
+
+# vad_stats key of the totals over every call
+VAD_TOTALS = "_all"
+# gTTS accents, i.e. the translate.google.<tld> hosts synthesis may contact
+TTS_VOICES = ("com", "com.au", "co.uk", "us", "ca", "co.in", "ie", "co.za", "com.ng", "fr", "com.br", "pt",
+              "com.mx", "es")
+TTS_MAX_TEXT_CHARS = int(os.getenv("TTS_MAX_TEXT_CHARS", "1000"))
+
+
+@functools.lru_cache(maxsize=1)
+def _tts_languages() -> frozenset:
+    return frozenset(tts_langs())
+
+
+def validate_tts_request(text: str, lang: str, voice: str) -> None:
+    """
+    Raises:
+        ValueError: Empty or too long text, or an unsupported language or voice
+    """
+    if not text.strip():
+        raise ValueError("text is required")
+    if len(text) > TTS_MAX_TEXT_CHARS:
+        raise ValueError(f"text is longer than {TTS_MAX_TEXT_CHARS} characters")
+    if lang not in _tts_languages():
+        raise ValueError(f"Unsupported language {lang!r}")
+    if voice not in TTS_VOICES:
+        raise ValueError(f"Unsupported voice {voice!r}; expected one of {', '.join(TTS_VOICES)}")
 
 class SpeechService:
-    def __init__(self):
-        self.whisper_model = whisper.load_model("base")
+    def __init__(self, server_address: Optional[str] = None, tts_cache: Optional[TTSCache] = None):
+        # With SPEECH_SERVER_ADDRESS set, transcription goes to the shared
+        # model server; otherwise the model is loaded here on first use
+        server_address = server_address or os.getenv("SPEECH_SERVER_ADDRESS")
+        self.client = SpeechClient(server_address) if server_address else None
+        self.transcriber = None if self.client else create_transcriber()
+        self.vad = VoiceActivityDetector(
+            threshold_db=float(os.getenv("VAD_THRESHOLD_DB", "-50")),
+            margin_db=float(os.getenv("VAD_MARGIN_DB", "10")),
+            min_speech_ms=float(os.getenv("VAD_MIN_SPEECH_MS", "120")),
+            min_silence_ms=float(os.getenv("VAD_MIN_SILENCE_MS", "300")),
+            padding_ms=float(os.getenv("VAD_PADDING_MS", "90"))
+        ) if os.getenv("VAD_ENABLED", "true").lower() == "true" else None
+        self.vad_stats: Dict[str, Dict[str, float]] = {}
+        self.tts_cache = tts_cache or TTSCache(
+            Path(os.getenv("TTS_CACHE_DIR", str(DEFAULT_CACHE_DIR))),
+            memory_max_bytes=int(os.getenv("TTS_CACHE_MEMORY_MB", "32")) * 1024 * 1024,
+            disk_max_bytes=int(os.getenv("TTS_CACHE_DISK_MB", "512")) * 1024 * 1024
+        )
+        self._stats_lock = threading.Lock()
+
+    def _transcribe(self, clip: Clip) -> str:
+        if self.client:
+            return self.client.transcribe(clip)
+        return self.transcriber.transcribe_batch([clip])[0]
         
-    def speech_to_text(self, audio_data: bytes) -> str:
+    def speech_to_text(self, audio_data: bytes, call_id: Optional[str] = None) -> str:
         """
         Convert speech to text using Whisper.
+
+        Silence is trimmed before transcription, so the model only sees
+        the voiced parts of the clip.
         
         Args:
             audio_data: Raw audio data in bytes
+            call_id: Call to attribute the trimming stats to
             
         Returns:
             str: Transcribed text
         """
         try:
-            # Save audio data to temporary file
-            with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
-                temp_path = temp_file.name
-                # Convert audio data to numpy array
-                audio_array, sample_rate = sf.read(audio_data)
-                sf.write(temp_path, audio_array, sample_rate)
-            
-            # Transcribe audio
-            result = self.whisper_model.transcribe(temp_path)
-            
-            # Clean up temporary file
-            os.unlink(temp_path)
-            
-            return result["text"].strip()
+            clip = load_audio(audio_data)
         except Exception as e:
-            print(f"Error in speech-to-text conversion: {str(e)}")
+            # Formats libsndfile cannot read are passed on encoded, for
+            # Whisper's own ffmpeg-based loader
+            logger.warning(f"In-memory audio decode failed, passing encoded audio: {str(e)}")
+            clip = audio_data
+
+        if self.vad and isinstance(clip, np.ndarray):
+            voiced, segments = self.vad.trim(clip)
+            self._record_vad(call_id, len(clip), sum(end - start for start, end in segments), len(segments))
+            if not segments:
+                return ""
+            clip = voiced
+
+        try:
+            return self._transcribe(clip)
+        except Exception as e:
+            logger.error(f"Error in speech-to-text conversion: {str(e)}")
             return ""
-            
-    def text_to_speech(self, text: str) -> Tuple[bytes, str]:
+
+    def transcribe_samples(self, samples: np.ndarray) -> str:
+        """Transcribe 16 kHz mono float32 audio that has already been segmented"""
+        try:
+            return self._transcribe(samples)
+        except Exception as e:
+            logger.error(f"Error in speech-to-text conversion: {str(e)}")
+            return ""
+
+    def streaming_transcriber(self, call_id: Callable[[], Optional[str]], **kwargs) -> StreamingTranscriber:
+        """
+        A StreamingTranscriber on this service's model and VAD settings.
+
+        Args:
+            call_id: Returns the call to attribute trimming stats to; asked
+                at each utterance, since a stream may learn its call late
+        """
+        return StreamingTranscriber(
+            self.transcribe_samples,
+            vad=self.vad,
+            on_utterance=lambda input_samples, voiced_samples: self._record_vad(
+                call_id(), input_samples, voiced_samples, 1
+            ),
+            **kwargs
+        )
+
+    def _record_vad(self, call_id: Optional[str], input_samples: int, voiced_samples: int,
+                    segments: int) -> None:
+        # Every utterance also counts towards the service-wide totals
+        with self._stats_lock:
+            for key in {call_id or VAD_TOTALS, VAD_TOTALS}:
+                stats = self.vad_stats.setdefault(key, {
+                    "utterances": 0, "segments": 0, "input_seconds": 0.0, "voiced_seconds": 0.0
+                })
+                stats["utterances"] += 1
+                stats["segments"] += segments
+                stats["input_seconds"] += input_samples / WHISPER_SAMPLE_RATE
+                stats["voiced_seconds"] += voiced_samples / WHISPER_SAMPLE_RATE
+
+    def get_vad_stats(self, call_id: str = VAD_TOTALS) -> Optional[Dict[str, float]]:
+        """Trimmed-duration stats for a call, or for every call so far"""
+        with self._stats_lock:
+            stats = self.vad_stats.get(call_id)
+            if stats is None:
+                return None
+            trimmed = max(stats["input_seconds"] - stats["voiced_seconds"], 0.0)
+            return {
+                **stats,
+                "trimmed_seconds": round(trimmed, 3),
+                "trimmed_ratio": round(trimmed / stats["input_seconds"], 3) if stats["input_seconds"] else 0.0
+            }
+
+    def forget_call(self, call_id: str) -> None:
+        """Drop a call's stats once it has ended; the totals keep them"""
+        if call_id == VAD_TOTALS:
+            return
+        with self._stats_lock:
+            self.vad_stats.pop(call_id, None)
+
+    def text_to_speech(self, text: str, lang: str = "en", voice: str = "com",
+                       slow: bool = False) -> Tuple[bytes, str]:
         """
         Convert text to speech using gTTS.
+
+        Audio is served from the TTS cache when the same text was
+        synthesized before with the same settings.
         
         Args:
             text: Text to convert to speech
+            lang: Language code
+            voice: gTTS accent (top-level domain), e.g. "com", "co.uk"
+            slow: Speak slowly
             
         Returns:
             Tuple[bytes, str]: Audio data in bytes and content type
         """
+        key = tts_cache_key(text, lang, voice, slow)
         try:
-            # Create temporary file for audio
-            with tempfile.NamedTemporaryFile(suffix=".mp3", delete=False) as temp_file:
-                temp_path = temp_file.name
-                
-                # Generate speech
-                tts = gTTS(text=text, lang='en')
-                tts.save(temp_path)
-                
-                # Read the generated audio file
-                with open(temp_path, 'rb') as audio_file:
-                    audio_data = audio_file.read()
-                
-                # Clean up temporary file
-                os.unlink(temp_path)
-                
-                return audio_data, 'audio/mpeg'
+            validate_tts_request(text, lang, voice)
+            return self.tts_cache.get_or_create(key, lambda: self._synthesize(text, lang, voice, slow)), 'audio/mpeg'
         except Exception as e:
-            print(f"Error in text-to-speech conversion: {str(e)}")
-            return b"", 'audio/mpeg' 
\ No newline at end of file
+            logger.error(f"Error in text-to-speech conversion: {str(e)}")
+            return b"", 'audio/mpeg'
+
+    @staticmethod
+    def _synthesize(text: str, lang: str, voice: str, slow: bool) -> bytes:
+        buffer = io.BytesIO()
+        gTTS(text=text, lang=lang, tld=voice, slow=slow).write_to_fp(buffer)
+        return buffer.getvalue()
@@ -0,0 +1,194 @@
+from collections import deque
+from typing import Callable, Dict, List, Optional
+import numpy as np
+from app.services.audio_processing import WHISPER_SAMPLE_RATE, VoiceActivityDetector
+
+
+class RingBuffer:
+    """Fixed-size float32 audio buffer addressed by absolute sample index"""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self.written = 0
+
+    @property
+    def oldest(self) -> int:
+        return max(0, self.written - self.capacity)
+
+    def write(self, samples: np.ndarray) -> None:
+        if len(samples) > self.capacity:
+            self.written += len(samples) - self.capacity
+            samples = samples[-self.capacity:]
+        start = self.written % self.capacity
+        first = min(len(samples), self.capacity - start)
+        self._data[start:start + first] = samples[:first]
+        self._data[:len(samples) - first] = samples[first:]
+        self.written += len(samples)
+
+    def read(self, start: int, end: int) -> np.ndarray:
+        """Copy samples [start, end); anything already overwritten is skipped"""
+        start = max(start, self.oldest)
+        end = min(end, self.written)
+        if end <= start:
+            return np.zeros(0, dtype=np.float32)
+        i, j = start % self.capacity, end % self.capacity
+        if i < j:
+            return self._data[i:j].copy()
+        return np.concatenate((self._data[i:], self._data[:j]))
+
+
+class StreamingTranscriber:
+    """
+    Incremental speech-to-text over a live audio stream.
+
+    Audio is appended to a ring buffer and classified frame by frame as it
+    arrives, with the same energy rule as VoiceActivityDetector but a
+    running noise floor. The floor follows silent frames, and also rises
+    towards the quietest frame of the last noise_window_ms when that window
+    is steady (its frames lie within half the margin of each other, which
+    speech with its syllables and pauses does not), so a line whose
+    background noise is louder than the threshold from the start does not
+    count as one endless utterance. While the caller speaks, the open utterance is
+    re-transcribed every partial_interval seconds of new audio; after
+    end_silence_ms of silence it is transcribed one last time and emitted
+    as final. If the last partial already covered every voiced frame, its
+    text is reused, so the final costs nothing after end of speech.
+
+    on_utterance(input_samples, voiced_samples) is called with every final:
+    the audio streamed since the previous final and the part of it that
+    was sent to the model.
+    """
+
+    def __init__(self, transcribe: Callable[[np.ndarray], str],
+                 vad: Optional[VoiceActivityDetector] = None,
+                 sample_rate: int = WHISPER_SAMPLE_RATE, buffer_seconds: float = 30,
+                 partial_interval: float = 1.0, end_silence_ms: float = 600,
+                 max_utterance_seconds: float = 25, noise_window_ms: float = 2000,
+                 on_utterance: Optional[Callable[[int, int], None]] = None):
+        self.transcribe = transcribe
+        self.on_utterance = on_utterance
+        self.vad = vad or VoiceActivityDetector(sample_rate=sample_rate)
+        self.sample_rate = sample_rate
+        self.buffer = RingBuffer(int(buffer_seconds * sample_rate))
+        self.partial_samples = int(partial_interval * sample_rate)
+        self.end_silence_frames = max(1, int(np.ceil(end_silence_ms * sample_rate / 1000 / self.vad.frame)))
+        self.max_utterance_samples = int(max_utterance_seconds * sample_rate)
+        self.padding = self.vad.padding_frames * self.vad.frame
+        self.noise_floor = self.vad.threshold_db
+        self.noise_window_frames = max(1, int(noise_window_ms * sample_rate / 1000 / self.vad.frame))
+        # (frame number, energy), monotonic so the fronts are the window's minimum and maximum
+        self._quietest: deque = deque()
+        self._loudest: deque = deque()
+        self._frames_seen = 0
+        self._accounted = 0
+        self._remainder = np.zeros(0, dtype=np.float32)
+        self._reset_utterance()
+
+    def _reset_utterance(self) -> None:
+        self.in_speech = False
+        self._voiced_run = 0
+        self._silent_run = 0
+        self._utterance_start = 0
+        self._voiced_end = 0
+        self._partial_end = 0
+        self._partial_text = ""
+
+    def feed(self, samples: np.ndarray) -> List[Dict]:
+        """
+        Append audio and return any transcripts it completes.
+
+        Args:
+            samples: Mono float32 samples at the stream's sample rate
+
+        Returns:
+            List[Dict]: Events, each {"type": "partial" | "final", "text", "start", "end"}
+        """
+        samples = np.asarray(samples, dtype=np.float32)
+        self.buffer.write(samples)
+        frames = np.concatenate((self._remainder, samples))
+        n_frames = len(frames) // self.vad.frame
+        self._remainder = frames[n_frames * self.vad.frame:]
+        events = []
+        for energy in self.vad.frame_energy(frames[:n_frames * self.vad.frame]):
+            event = self._step(float(energy))
+            if event:
+                events.append(event)
+        if self.in_speech and self._voiced_end - self._partial_end >= self.partial_samples:
+            events.append(self._partial())
+        return events
+
+    def _track_background(self, energy: float) -> None:
+        for extremes, keep in ((self._quietest, lambda last: last < energy),
+                               (self._loudest, lambda last: last > energy)):
+            while extremes and not keep(extremes[-1][1]):
+                extremes.pop()
+            extremes.append((self._frames_seen, energy))
+            if extremes[0][0] <= self._frames_seen - self.noise_window_frames:
+                extremes.popleft()
+        quietest, loudest = self._quietest[0][1], self._loudest[0][1]
+        if (self._frames_seen >= self.noise_window_frames // 4 and quietest > self.noise_floor
+                and loudest - quietest < self.vad.margin_db / 2):
+            self.noise_floor += 0.05 * (quietest - self.noise_floor)
+
+    def _step(self, energy: float) -> Optional[Dict]:
+        self._track_background(energy)
+        frame_end = (self._frames_seen + 1) * self.vad.frame
+        self._frames_seen += 1
+        threshold = max(self.vad.threshold_db, self.noise_floor + self.vad.margin_db)
+        if energy > threshold:
+            self._voiced_run += 1
+            self._silent_run = 0
+            if not self.in_speech and self._voiced_run >= self.vad.min_speech_frames:
+                self.in_speech = True
+                start = frame_end - self._voiced_run * self.vad.frame - self.padding
+                self._utterance_start = max(start, self.buffer.oldest, 0)
+                self._partial_end = self._utterance_start
+            if self.in_speech:
+                self._voiced_end = frame_end
+                if frame_end - self._utterance_start >= self.max_utterance_samples:
+                    return self._final()
+            return None
+
+        self._voiced_run = 0
+        self._silent_run += 1
+        # Track the noise floor only from silence so speech cannot raise it
+        self.noise_floor = 0.95 * self.noise_floor + 0.05 * energy
+        if self.in_speech and self._silent_run >= self.end_silence_frames:
+            return self._final()
+        return None
+
+    def _utterance_end(self) -> int:
+        return min(self._voiced_end + self.padding, self.buffer.written)
+
+    def _partial(self) -> Dict:
+        end = self._utterance_end()
+        self._partial_text = self.transcribe(self.buffer.read(self._utterance_start, end))
+        self._partial_end = self._voiced_end
+        return self._event("partial", self._partial_text, end)
+
+    def _final(self) -> Dict:
+        end = self._utterance_end()
+        if self._partial_end >= self._voiced_end:
+            text = self._partial_text
+        else:
+            text = self.transcribe(self.buffer.read(self._utterance_start, end))
+        event = self._event("final", text, end)
+        if self.on_utterance and end > self._accounted:
+            # Padding can reach back into audio the previous final covered
+            self.on_utterance(end - self._accounted, end - max(self._utterance_start, self._accounted))
+        self._accounted = max(self._accounted, end)
+        self._reset_utterance()
+        return event
+
+    def _event(self, kind: str, text: str, end: int) -> Dict:
+        return {
+            "type": kind,
+            "text": text,
+            "start": round(self._utterance_start / self.sample_rate, 3),
+            "end": round(end / self.sample_rate, 3)
+        }
+
+    def flush(self) -> List[Dict]:
+        """Finish the open utterance, e.g. when the caller stops the stream"""
+        return [self._final()] if self.in_speech else []
@@ -0,0 +1,149 @@
+import os
+import queue
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Iterable, Iterator, List, Optional
+
+# A sentence ends at . ! or ? (optionally followed by closing quotes or
+# brackets) and whitespace, unless the word before the stop is an abbreviation
+_SENTENCE_END = re.compile(r"[.!?]+[\"')\]]*\s+")
+_ABBREVIATIONS = {"mr", "mrs", "ms", "dr", "prof", "sr", "jr", "st", "vs", "etc", "e.g", "i.e", "approx"}
+# Only abbreviations when a number follows: "No. 5", but "the answer is no. Please hold."
+_NUMBER_ABBREVIATIONS = {"no"}
+
+
+def _is_abbreviation(text: str, stop: int, end: int) -> Optional[bool]:
+    """Whether the stop at text[stop] ends an abbreviation; None if that depends on text not yet received"""
+    words = text[:stop].split()
+    word = words[-1].lower().rstrip(".") if words else ""
+    if word in _NUMBER_ABBREVIATIONS:
+        return text[end].isdigit() if end < len(text) else None
+    return word in _ABBREVIATIONS
+
+
+class SentenceChunker:
+    """
+    Splits text into sentences as it arrives.
+
+    feed() takes text deltas (LLM tokens, say) and returns the sentences
+    they complete; sentences shorter than min_chars are held back and
+    joined with the next, so each synthesis request is worth its overhead.
+    """
+
+    def __init__(self, min_chars: int = 20):
+        self.min_chars = min_chars
+        self._buffer = ""
+
+    def feed(self, text: str) -> List[str]:
+        self._buffer += text
+        sentences = []
+        start = 0
+        for match in _SENTENCE_END.finditer(self._buffer):
+            abbreviation = _is_abbreviation(self._buffer, match.start(), match.end())
+            if abbreviation is None:
+                break
+            if abbreviation:
+                continue
+            sentence = self._buffer[start:match.end()].strip()
+            if len(sentence) < self.min_chars:
+                continue
+            sentences.append(sentence)
+            start = match.end()
+        self._buffer = self._buffer[start:]
+        return sentences
+
+    def flush(self) -> List[str]:
+        rest, self._buffer = self._buffer.strip(), ""
+        return [rest] if rest else []
+
+
+def split_sentences(text: str, min_chars: int = 20) -> List[str]:
+    chunker = SentenceChunker(min_chars)
+    return chunker.feed(text) + chunker.flush()
+
+
+class StreamingSynthesizer:
+    """
+    Sentence-at-a-time text-to-speech.
+
+    Sentences are synthesized on a small thread pool, at most `lookahead`
+    ahead of the one being sent, and audio is yielded strictly in sentence
+    order as soon as each is ready. The sentences are read on their own
+    thread, so a slow source (an LLM still generating) never holds back
+    audio that is already synthesized. The first audio is therefore ready
+    after one sentence rather than the whole reply, and each sentence goes
+    through the SpeechService TTS cache.
+    """
+
+    def __init__(self, speech_service, workers: Optional[int] = None, lookahead: Optional[int] = None):
+        self.speech_service = speech_service
+        self.workers = workers or int(os.getenv("TTS_STREAM_WORKERS", "3"))
+        self.lookahead = lookahead or self.workers
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="tts")
+
+    def submit(self, sentence: str, lang: str = "en", voice: str = "com", slow: bool = False) -> Future:
+        """Start synthesizing one sentence; the future holds (audio, content type)"""
+        return self.executor.submit(self.speech_service.text_to_speech, sentence, lang, voice, slow)
+
+    def stream_sentences(self, sentences: Iterable[str], lang: str = "en", voice: str = "com",
+                         slow: bool = False) -> Iterator[bytes]:
+        """
+        Synthesize sentences in order.
+
+        Args:
+            sentences: Sentences to speak; may be a generator that is still
+                producing them (an LLM stream, say)
+
+        Yields:
+            bytes: MP3 audio per sentence, in order
+        """
+        submitted: "queue.Queue" = queue.Queue()
+        slots = threading.Semaphore(self.lookahead)
+        stop = threading.Event()
+        threading.Thread(
+            target=self._read_sentences, args=(iter(sentences), submitted, slots, stop, lang, voice, slow),
+            name="tts-sentences", daemon=True
+        ).start()
+        try:
+            while True:
+                kind, value = submitted.get()
+                if kind == "end":
+                    return
+                if kind == "error":
+                    raise value
+                audio, _ = value.result()
+                slots.release()
+                if audio:
+                    yield audio
+        finally:
+            # The consumer went away (client disconnected); skip the rest
+            stop.set()
+            slots.release()
+            while not submitted.empty():
+                kind, value = submitted.get_nowait()
+                if kind == "audio":
+                    value.cancel()
+
+    def _read_sentences(self, sentences: Iterator[str], submitted: "queue.Queue", slots: threading.Semaphore,
+                        stop: threading.Event, lang: str, voice: str, slow: bool) -> None:
+        try:
+            for sentence in sentences:
+                slots.acquire()
+                if stop.is_set():
+                    break
+                submitted.put(("audio", self.submit(sentence, lang, voice, slow)))
+        except Exception as e:
+            submitted.put(("error", e))
+            return
+        finally:
+            close = getattr(sentences, "close", None)
+            if close:
+                close()
+        submitted.put(("end", None))
+
+    def stream(self, text: str, **kwargs) -> Iterator[bytes]:
+        return self.stream_sentences(split_sentences(text), **kwargs)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
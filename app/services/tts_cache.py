@@ -0,0 +1,181 @@
+"""
+Content-addressed cache for synthesized speech.
+
+Audio is keyed by a hash of everything that changes the output (text,
+language, voice and speed), kept in an in-memory LRU and backed by a
+size-capped directory on disk that survives restarts and is shared by
+every worker on the host. Fixed prompts can be synthesized ahead of time:
+
+    python -m app.services.tts_cache                  # the built-in prompts
+    python -m app.services.tts_cache phrases.txt      # plus one phrase per line
+"""
+import hashlib
+import hmac
+import os
+import sys
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable, Dict, Iterable, Optional
+from app.core.auth import SECRET_KEY
+from app.core.logger import logger
+
+DEFAULT_CACHE_DIR = Path("data") / "tts_cache"
+
+
+def tts_cache_key(text: str, lang: str = "en", voice: str = "com", slow: bool = False) -> str:
+    """Hash of the synthesis inputs; voice is the gTTS accent (tld)"""
+    material = "\x00".join([text.strip(), lang, voice, "slow" if slow else "normal"])
+    return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+
+def tts_signature(text: str, lang: str = "en", voice: str = "com", slow: bool = False) -> str:
+    """
+    HMAC of the synthesis inputs, so TTS URLs we hand out (e.g. to Twilio
+    for <Play>) can be fetched without credentials but not forged.
+    """
+    return hmac.new(SECRET_KEY.encode(), tts_cache_key(text, lang, voice, slow).encode(), hashlib.sha256).hexdigest()
+
+
+def verify_tts_signature(signature: str, text: str, lang: str = "en", voice: str = "com",
+                         slow: bool = False) -> bool:
+    return hmac.compare_digest(signature, tts_signature(text, lang, voice, slow))
+
+
+class TTSCache:
+    """
+    Two-tier audio cache.
+
+    Memory holds up to memory_max_bytes of the most recently used clips.
+    Disk holds up to disk_max_bytes; the least recently read files (by
+    mtime, refreshed on every disk hit) are removed once the cap is passed.
+    get_or_create synthesizes each missing key once even when several
+    threads ask for it together.
+    """
+
+    def __init__(self, directory: Path = DEFAULT_CACHE_DIR, memory_max_bytes: int = 32 * 1024 * 1024,
+                 disk_max_bytes: int = 512 * 1024 * 1024):
+        self.directory = Path(directory)
+        self.memory_max_bytes = memory_max_bytes
+        self.disk_max_bytes = disk_max_bytes
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._memory_bytes = 0
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self.stats = {"memory_hits": 0, "disk_hits": 0, "misses": 0}
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._disk_bytes = sum(path.stat().st_size for path in self.directory.glob("*/*.mp3"))
+
+    def _path(self, key: str) -> Path:
+        return self.directory / key[:2] / f"{key}.mp3"
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            audio = self._memory.get(key)
+            if audio is not None:
+                self._memory.move_to_end(key)
+                self.stats["memory_hits"] += 1
+                return audio
+        path = self._path(key)
+        try:
+            audio = path.read_bytes()
+            os.utime(path)
+        except FileNotFoundError:
+            return None
+        with self._lock:
+            self.stats["disk_hits"] += 1
+        self._remember(key, audio)
+        return audio
+
+    def put(self, key: str, audio: bytes) -> None:
+        self._remember(key, audio)
+        path = self._path(key)
+        try:
+            path.parent.mkdir(exist_ok=True)
+            tmp_path = path.with_suffix(f".{threading.get_ident()}.tmp")
+            tmp_path.write_bytes(audio)
+            existed = path.exists()
+            os.replace(tmp_path, path)
+            if not existed:
+                with self._lock:
+                    self._disk_bytes += len(audio)
+            if self._disk_bytes > self.disk_max_bytes:
+                self._evict_disk()
+        except OSError as e:
+            logger.warning(f"Could not write TTS cache entry {key}: {str(e)}")
+
+    def get_or_create(self, key: str, synthesize: Callable[[], bytes]) -> bytes:
+        audio = self.get(key)
+        if audio is not None:
+            return audio
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+        with key_lock:
+            audio = self.get(key)
+            if audio is None:
+                with self._lock:
+                    self.stats["misses"] += 1
+                audio = synthesize()
+                if audio:
+                    self.put(key, audio)
+        with self._lock:
+            self._key_locks.pop(key, None)
+        return audio
+
+    def _remember(self, key: str, audio: bytes) -> None:
+        if len(audio) > self.memory_max_bytes:
+            return
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = audio
+            self._memory_bytes += len(audio)
+            while self._memory_bytes > self.memory_max_bytes:
+                _, evicted = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted)
+
+    def _evict_disk(self) -> None:
+        # Trim to 90% of the cap so eviction does not run on every write
+        entries = []
+        for path in self.directory.glob("*/*.mp3"):
+            try:
+                stat = path.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        target = int(self.disk_max_bytes * 0.9)
+        for _, size, path in sorted(entries, key=lambda entry: entry[0]):
+            if total <= target:
+                break
+            try:
+                path.unlink()
+                total -= size
+            except FileNotFoundError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+
+def prewarm(speech_service, phrases: Iterable[str]) -> int:
+    """Synthesize phrases into the cache; returns how many were new"""
+    created = 0
+    for phrase in phrases:
+        misses = speech_service.tts_cache.stats["misses"]
+        speech_service.text_to_speech(phrase)
+        created += speech_service.tts_cache.stats["misses"] - misses
+    return created
+
+
+if __name__ == "__main__":
+    from app.services.speech_service import SpeechService
+    from app.services.twilio_service import PROMPTS
+    from app.services.voice_turn_service import PROMPTS as VOICE_TURN_PROMPTS
+
+    phrases = list(PROMPTS) + VOICE_TURN_PROMPTS
+    for source in sys.argv[1:]:
+        with open(source, encoding="utf-8") as f:
+            phrases += [line.strip() for line in f if line.strip()]
+    created = prewarm(SpeechService(), phrases)
+    print(f"Prewarmed {len(phrases)} phrases ({created} newly synthesized)")
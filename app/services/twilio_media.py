@@ -0,0 +1,87 @@
+"""
+Twilio Media Streams ingestion.
+
+With <Connect><Stream> in the call's TwiML, Twilio opens a WebSocket and
+sends the caller's audio as JSON messages: "connected", "start" (stream
+and call ids plus any custom parameters), a "media" message per 20 ms
+frame of base64 8 kHz mu-law audio, and "stop". Frames are decoded with a
+table lookup, upsampled to 16 kHz and fed to a StreamingTranscriber, so
+transcripts are ready moments after the caller stops speaking instead of
+after a <Gather> round trip.
+
+Replies go back the same way: synthesized speech is decoded, downsampled
+to 8 kHz, mu-law encoded and sent as "media" messages on the stream,
+followed by a "mark" so Twilio reports when the caller has heard it.
+"""
+import base64
+from typing import Dict, List, Optional
+from app.services.audio_processing import (
+    TELEPHONY_SAMPLE_RATE, Upsampler2x, decode_audio, mulaw_decode, mulaw_encode, resample
+)
+from app.services.streaming_stt import StreamingTranscriber
+
+FRAME_BYTES = 160  # 20 ms at 8 kHz
+
+
+class MediaStreamSession:
+    """State for one Media Streams connection"""
+
+    def __init__(self, transcriber: StreamingTranscriber):
+        self.transcriber = transcriber
+        self.upsampler = Upsampler2x()
+        self.stream_sid: Optional[str] = None
+        self.call_sid: Optional[str] = None
+        self.parameters: Dict[str, str] = {}
+        self.frames = 0
+        self.replies = 0
+        self.stopped = False
+
+    def handle(self, message: Dict) -> List[Dict]:
+        """
+        Process one message from Twilio.
+
+        Args:
+            message: The decoded JSON message
+
+        Returns:
+            List[Dict]: Transcript events, as from StreamingTranscriber.feed
+        """
+        event = message.get("event")
+        if event == "start":
+            start = message.get("start", {})
+            self.stream_sid = message.get("streamSid") or start.get("streamSid")
+            self.call_sid = start.get("callSid")
+            self.parameters = start.get("customParameters") or {}
+        elif event == "media":
+            media = message.get("media", {})
+            # Only the caller's side; outbound audio is our own speech
+            if media.get("track", "inbound") != "inbound":
+                return []
+            self.frames += 1
+            samples = self.upsampler.process(mulaw_decode(base64.b64decode(media["payload"])))
+            return self.transcriber.feed(samples)
+        elif event == "stop":
+            self.stopped = True
+            return self.transcriber.flush()
+        return []
+
+    def reply_messages(self, audio: bytes) -> List[Dict]:
+        """
+        Messages that play encoded audio (mp3, wav...) to the caller.
+
+        Returns:
+            List[Dict]: A "media" message per 20 ms frame and a closing
+            "mark"; none if the audio is empty or cannot be decoded
+        """
+        if not audio or not self.stream_sid:
+            return []
+        samples, sample_rate = decode_audio(audio)
+        payload = mulaw_encode(resample(samples, sample_rate, TELEPHONY_SAMPLE_RATE))
+        messages = [
+            {"event": "media", "streamSid": self.stream_sid,
+             "media": {"payload": base64.b64encode(payload[offset:offset + FRAME_BYTES]).decode()}}
+            for offset in range(0, len(payload), FRAME_BYTES)
+        ]
+        self.replies += 1
+        messages.append({"event": "mark", "streamSid": self.stream_sid, "mark": {"name": f"reply-{self.replies}"}})
+        return messages
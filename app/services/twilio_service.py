@@ -1,12 +1,80 @@
+import os
+from twilio.request_validator import RequestValidator
 from twilio.rest import Client
-from twilio.twiml.voice_response import VoiceResponse, Gather
-from typing import Optional
+from typing import Dict, Optional
+from app.services import twiml
+
+GATHER_PROMPT = "Please speak after the tone."
+RETRY_PROMPT = "I didn't catch that. Please try again."
+# Fixed phrases spoken on every call; prewarmed into the TTS cache
+PROMPTS = [GATHER_PROMPT, RETRY_PROMPT]
+
+# Everything after the spoken message is the same on every response, so it
+# is rendered once
+_GATHER_TAIL_SAY = (
+    twiml.gather(twiml.say(GATHER_PROMPT), '/api/voice/process-speech')
+    + twiml.say(RETRY_PROMPT)
+    + twiml.redirect('/api/voice/handle-call')
+)
+_GATHER_TAIL_PLAY = (
+    twiml.gather(twiml.play_tts(GATHER_PROMPT), '/api/voice/process-speech')
+    + twiml.play_tts(RETRY_PROMPT)
+    + twiml.redirect('/api/voice/handle-call')
+)
 
 class TwilioService:
-    def __init__(self, account_sid: str, auth_token: str, phone_number: str):
-        self.client = Client(account_sid, auth_token)
+    def __init__(self, account_sid: Optional[str], auth_token: Optional[str], phone_number: Optional[str],
+                 tts_playback: Optional[bool] = None, public_base_url: Optional[str] = None,
+                 media_streams: Optional[bool] = None):
+        self.account_sid = account_sid
+        self.auth_token = auth_token
         self.phone_number = phone_number
+        # Where Twilio reaches our webhooks, e.g. https://calls.example.com
+        self.public_base_url = (public_base_url or os.getenv("PUBLIC_BASE_URL", "")).rstrip("/")
+        self._client = None
+        # Speak with <Play> of our cached TTS audio instead of Twilio's <Say>
+        if tts_playback is None:
+            tts_playback = os.getenv("TWILIO_TTS_PLAYBACK", "false").lower() == "true"
+        self.tts_playback = tts_playback
+        # Answer calls with a Media Stream to /ws/twilio/media instead of <Gather>;
+        # Twilio needs an absolute wss:// URL, so this requires PUBLIC_BASE_URL
+        if media_streams is None:
+            media_streams = os.getenv("TWILIO_MEDIA_STREAMS", "false").lower() == "true"
+        self.media_streams = media_streams and bool(self.public_base_url)
+
+    @property
+    def client(self) -> Client:
+        # Created on first use: answering webhooks only needs TwiML, and the
+        # REST client refuses to construct without credentials
+        if self._client is None:
+            self._client = Client(self.account_sid, self.auth_token)
+        return self._client
         
+    def validate_request(self, path: str, params: Dict[str, str], signature: Optional[str]) -> bool:
+        """
+        Check that a webhook request was signed by Twilio.
+
+        Args:
+            path: The request's path and query string
+            params: The request's form parameters
+            signature: The X-Twilio-Signature header
+
+        Returns:
+            bool: False for unsigned or forged requests, or when no auth token is configured
+        """
+        if not self.auth_token or not signature:
+            return False
+        return RequestValidator(self.auth_token).validate(f"{self.public_base_url}{path}", params, signature)
+
+    def validate_stream_request(self, signature: Optional[str]) -> bool:
+        """Check that a Media Streams WebSocket was opened by Twilio, which signs media_stream_url"""
+        if not self.auth_token or not signature or not self.public_base_url:
+            return False
+        return RequestValidator(self.auth_token).validate(self.media_stream_url, {}, signature)
+
+    def _speak(self, text: Optional[str]) -> Optional[str]:
+        return twiml.play_tts(text) if self.tts_playback else twiml.say(text)
+
     def create_twiml_response(self, message: Optional[str] = None) -> str:
         """
         Create a TwiML response for Twilio.
@@ -17,29 +85,62 @@ class TwilioService:
         Returns:
             str: TwiML response
         """
-        response = VoiceResponse()
-        
-        if message:
-            response.say(message)
-            
-        # Gather speech input
-        gather = Gather(
-            input='speech',
-            action='/api/voice/process-speech',
-            method='POST',
-            language='en-US',
-            speechTimeout='auto'
-        )
-        
-        gather.say("Please speak after the tone.")
-        response.append(gather)
-        
-        # Add a fallback message
-        response.say("I didn't catch that. Please try again.")
-        response.redirect('/api/voice/handle-call')
-        
-        return str(response)
-        
+        # Gather speech input, with a fallback message if none comes
+        tail = _GATHER_TAIL_PLAY if self.tts_playback else _GATHER_TAIL_SAY
+        return twiml.response(self._speak(message), tail)
+
+    def create_hold_twiml(self, redirect_url: str, message: Optional[str] = None) -> str:
+        """
+        Create a TwiML response that keeps the caller on the line.
+
+        Args:
+            redirect_url: Where Twilio fetches the next instructions from
+            message: Optional message to speak first
+
+        Returns:
+            str: TwiML response
+        """
+        return twiml.response(self._speak(message), twiml.redirect(redirect_url, method='POST'))
+
+    def create_hangup_twiml(self, message: Optional[str] = None) -> str:
+        """Create a TwiML response that ends the call"""
+        return twiml.response(self._speak(message), twiml.HANGUP)
+
+    def create_dial_twiml(self, number: str, message: Optional[str] = None, timeout: int = 30) -> str:
+        """
+        Create a TwiML response that connects the caller to another number.
+
+        Args:
+            number: The number to dial, e.g. a human agent's line
+            message: Optional message to speak first
+            timeout: Seconds to let the number ring
+
+        Returns:
+            str: TwiML response
+        """
+        return twiml.response(self._speak(message), twiml.dial(number, self.phone_number, timeout))
+
+    @property
+    def media_stream_url(self) -> str:
+        """wss:// URL of our Media Streams endpoint"""
+        base = self.public_base_url.replace("https://", "wss://", 1).replace("http://", "ws://", 1)
+        return f"{base}/ws/twilio/media"
+
+    def create_stream_twiml(self, stream_url: str, parameters: Optional[Dict[str, str]] = None,
+                            message: Optional[str] = None) -> str:
+        """
+        Create a TwiML response that streams the caller's audio to us.
+
+        Args:
+            stream_url: wss:// URL of the Media Streams endpoint
+            parameters: Custom parameters passed back in the stream's start message
+            message: Optional message to speak before streaming starts
+
+        Returns:
+            str: TwiML response
+        """
+        return twiml.response(self._speak(message), twiml.stream(stream_url, parameters))
+
     def make_call(self, to_number: str) -> str:
         """
         Initiate a call to a phone number.
@@ -54,7 +155,7 @@ class TwilioService:
             call = self.client.calls.create(
                 to=to_number,
                 from_=self.phone_number,
-                url='http://your-domain.com/api/voice/handle-call'  # Replace with your domain
+                url=f'{self.public_base_url}/api/voice/handle-call'
             )
             return call.sid
         except Exception as e:
@@ -0,0 +1,165 @@
+"""
+Precompiled TwiML.
+
+The twilio VoiceResponse builder creates an element tree and serializes
+it through ElementTree for every response, although a webhook's response
+only differs from the last one in the text it speaks. Here each verb is a
+template parsed once at import into literal markup and slots; rendering
+escapes the slot values and joins the pieces. The output is byte-for-byte
+what the builder produces, which the tests check.
+
+    python -m app.services.twiml      # benchmark against the builder
+"""
+import re
+import string
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlencode
+from app.services.tts_cache import tts_signature
+
+XML_DECLARATION = '<?xml version="1.0" encoding="UTF-8"?>'
+
+# Characters XML 1.0 does not allow at all, even escaped; an LLM reply
+# containing one would otherwise make Twilio reject the whole document
+_INVALID_XML = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+_TEXT_ESCAPES = str.maketrans({"&": "&amp;", "<": "&lt;", ">": "&gt;"})
+_ATTRIBUTE_ESCAPES = str.maketrans({
+    "&": "&amp;", "<": "&lt;", ">": "&gt;", '"': "&quot;", "\n": "&#10;", "\r": "&#13;", "\t": "&#09;"
+})
+
+
+class TwiML(str):
+    """Rendered markup; inserted into a template slot as is, not escaped"""
+
+
+def escape_text(value: str) -> str:
+    return _INVALID_XML.sub("", value).translate(_TEXT_ESCAPES)
+
+
+def escape_attribute(value: str) -> str:
+    return _INVALID_XML.sub("", value).translate(_ATTRIBUTE_ESCAPES)
+
+
+class TwiMLTemplate:
+    """
+    Markup with {name} slots, split once into literal pieces and slots.
+
+    A slot inside a tag is escaped as an attribute value, anywhere else as
+    element text. TwiML values (rendered fragments) are inserted unescaped.
+    """
+
+    def __init__(self, source: str):
+        self.source = source
+        self._parts: List[Tuple[str, Optional[str], bool]] = []
+        in_tag = False
+        for literal, name, _, _ in string.Formatter().parse(source):
+            # Whether the slot sits between a "<" and its ">"
+            last_open, last_close = literal.rfind("<"), literal.rfind(">")
+            if last_open != last_close:
+                in_tag = last_open > last_close
+            self._parts.append((literal, name, in_tag))
+
+    def render(self, **values: str) -> TwiML:
+        out = []
+        for literal, name, in_tag in self._parts:
+            out.append(literal)
+            if name is None:
+                continue
+            value = values[name]
+            if isinstance(value, TwiML):
+                out.append(value)
+            else:
+                out.append(escape_attribute(value) if in_tag else escape_text(str(value)))
+        return TwiML("".join(out))
+
+
+RESPONSE = TwiMLTemplate(XML_DECLARATION + "<Response>{body}</Response>")
+SAY = TwiMLTemplate("<Say>{text}</Say>")
+PLAY = TwiMLTemplate("<Play>{url}</Play>")
+REDIRECT = TwiMLTemplate("<Redirect>{url}</Redirect>")
+REDIRECT_WITH_METHOD = TwiMLTemplate('<Redirect method="{method}">{url}</Redirect>')
+GATHER = TwiMLTemplate(
+    '<Gather action="{action}" input="speech" language="{language}" method="POST" '
+    'speechTimeout="auto">{prompt}</Gather>'
+)
+DIAL = TwiMLTemplate('<Dial timeout="{timeout}">{number}</Dial>')
+DIAL_WITH_CALLER_ID = TwiMLTemplate('<Dial callerId="{caller_id}" timeout="{timeout}">{number}</Dial>')
+HANGUP = TwiML("<Hangup />")
+STREAM = TwiMLTemplate('<Connect><Stream url="{url}">{parameters}</Stream></Connect>')
+STREAM_PARAMETER = TwiMLTemplate('<Parameter name="{name}" value="{value}" />')
+
+
+def response(*verbs: Optional[str]) -> str:
+    """A whole TwiML document; None verbs are skipped"""
+    return RESPONSE.render(body=TwiML("".join(verb for verb in verbs if verb)))
+
+
+def say(text: Optional[str]) -> Optional[TwiML]:
+    return SAY.render(text=text) if text else None
+
+
+def play(url: str) -> TwiML:
+    return PLAY.render(url=url)
+
+
+def tts_url(text: str, lang: str = "en", voice: str = "com") -> str:
+    """Signed URL of our cached TTS audio for text, for <Play>"""
+    return "/api/speech/tts?" + urlencode({
+        "text": text, "lang": lang, "voice": voice, "sig": tts_signature(text, lang, voice)
+    })
+
+
+def play_tts(text: Optional[str], lang: str = "en", voice: str = "com") -> Optional[TwiML]:
+    """Speak text with our own (cached) TTS instead of Twilio's <Say>"""
+    return play(tts_url(text, lang, voice)) if text else None
+
+
+def redirect(url: str, method: Optional[str] = None) -> TwiML:
+    if method:
+        return REDIRECT_WITH_METHOD.render(url=url, method=method)
+    return REDIRECT.render(url=url)
+
+
+def gather(prompt: Optional[str], action: str, language: str = "en-US") -> TwiML:
+    """Speech <Gather>; prompt is rendered markup (say(...) or play_tts(...))"""
+    return GATHER.render(action=action, language=language, prompt=TwiML(prompt or ""))
+
+
+def dial(number: str, caller_id: Optional[str] = None, timeout: int = 30) -> TwiML:
+    if caller_id:
+        return DIAL_WITH_CALLER_ID.render(number=number, caller_id=caller_id, timeout=str(timeout))
+    return DIAL.render(number=number, timeout=str(timeout))
+
+
+def stream(url: str, parameters: Optional[Dict[str, str]] = None) -> TwiML:
+    rendered = "".join(
+        STREAM_PARAMETER.render(name=name, value=value) for name, value in (parameters or {}).items()
+    )
+    return STREAM.render(url=url, parameters=TwiML(rendered))
+
+
+if __name__ == "__main__":
+    import timeit
+    from twilio.twiml.voice_response import Gather, VoiceResponse
+    from app.services.twilio_service import TwilioService
+
+    service = TwilioService(None, None, None)
+    message = "Thanks for waiting. Your balance is $42 & your next bill is due on <May 3rd>."
+
+    def build():
+        builder = VoiceResponse()
+        builder.say(message)
+        prompt = Gather(input="speech", action="/api/voice/process-speech", method="POST",
+                        language="en-US", speechTimeout="auto")
+        prompt.say("Please speak after the tone.")
+        builder.append(prompt)
+        builder.say("I didn't catch that. Please try again.")
+        builder.redirect("/api/voice/handle-call")
+        return str(builder)
+
+    assert build() == service.create_twiml_response(message)
+    runs = 20000
+    builder_seconds = min(timeit.repeat(build, number=runs, repeat=3))
+    template_seconds = min(timeit.repeat(lambda: service.create_twiml_response(message), number=runs, repeat=3))
+    print(f"VoiceResponse builder: {builder_seconds / runs * 1e6:.1f} us per response")
+    print(f"Precompiled templates: {template_seconds / runs * 1e6:.1f} us per response "
+          f"({builder_seconds / template_seconds:.1f}x faster)")
@@ -0,0 +1,173 @@
+import asyncio
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Optional
+from app.core.admission import AdmissionRejected
+from app.core.logger import logger
+from app.core.state import StateBackend
+from app.models.models import CallSimulation
+from app.services.twilio_service import TwilioService
+from app.services.voice_turn_service import APOLOGY_PROMPT, HOLD_PROMPT
+
+GREETING = "Thank you for calling. How can I help you today?"
+BUSY_PROMPT = "All of our agents are busy right now. Please say that again in a moment."
+GOODBYE_PROMPT = "This call has ended. Goodbye."
+
+
+class VoiceCallService:
+    """
+    Twilio voice webhooks.
+
+    Twilio waits at most 15 seconds for a webhook, and the caller hears
+    silence until it answers. A caller's speech is therefore handed to a
+    background worker straight away. If the reply is ready within
+    fast_reply_seconds it is spoken in the same response; otherwise Twilio
+    gets a hold prompt and a redirect to the reply endpoint, which waits up
+    to poll_seconds for the reply and redirects to itself again while it
+    is still being generated. Replies are kept in the state backend, so
+    the poll can land on any worker.
+    """
+
+    def __init__(self, simulation_service, twilio_service: TwilioService, state_backend: StateBackend,
+                 workers: Optional[int] = None, fast_reply_seconds: Optional[float] = None,
+                 poll_seconds: Optional[float] = None, max_polls: Optional[int] = None,
+                 reply_ttl: float = 600, poll_interval: float = 0.1):
+        self.simulation_service = simulation_service
+        self.twilio_service = twilio_service
+        self.state_backend = state_backend
+        self.fast_reply_seconds = fast_reply_seconds or float(os.getenv("VOICE_FAST_REPLY_SECONDS", "2"))
+        self.poll_seconds = poll_seconds or float(os.getenv("VOICE_POLL_SECONDS", "5"))
+        self.max_polls = max_polls or int(os.getenv("VOICE_MAX_POLLS", "6"))
+        self.reply_ttl = reply_ttl
+        # How often a waiting webhook checks the state backend for the reply
+        self.poll_interval = poll_interval
+        self.executor = ThreadPoolExecutor(
+            max_workers=workers or int(os.getenv("VOICE_REPLY_WORKERS", "8")), thread_name_prefix="voice-reply"
+        )
+
+    @staticmethod
+    def _call_key(call_sid: str) -> str:
+        return f"voice:call:{call_sid}"
+
+    @staticmethod
+    def _reply_key(call_sid: str) -> str:
+        return f"voice:reply:{call_sid}"
+
+    def simulation_for_call(self, call_sid: str, create: bool = False) -> Optional[str]:
+        """
+        The simulation a Twilio call is attached to.
+
+        Args:
+            call_sid: Twilio's CallSid
+            create: Start a simulation for the call if it has none
+
+        Returns:
+            Simulation ID, or None if the call is unknown (and create is False)
+        """
+        simulation_id = self.state_backend.get(self._call_key(call_sid))
+        if simulation_id:
+            return simulation_id
+        db = self.simulation_service.session_factory()
+        try:
+            simulation = db.query(CallSimulation).filter(CallSimulation.call_sid == call_sid).first()
+            simulation_id = simulation.id if simulation else None
+        finally:
+            db.close()
+        if simulation_id is None and create:
+            simulation_id = self.simulation_service.start_simulation(call_sid=call_sid)
+        if simulation_id:
+            self.state_backend.set(self._call_key(call_sid), simulation_id, ttl=4 * 3600)
+        return simulation_id
+
+    def handle_call(self, call_sid: str) -> Optional[str]:
+        """TwiML answering an incoming call, or None if no simulation could be started"""
+        simulation_id = self.simulation_for_call(call_sid, create=True)
+        if not simulation_id:
+            return None
+        logger.info(f"Call {call_sid} attached to simulation {simulation_id}")
+        if self.twilio_service.media_streams:
+            return self.twilio_service.create_stream_twiml(
+                self.twilio_service.media_stream_url, {"simulation_id": simulation_id}, GREETING
+            )
+        return self.twilio_service.create_twiml_response(GREETING)
+
+    def start_reply(self, call_sid: str, speech: str) -> Optional[int]:
+        """
+        Start generating the reply to what the caller said.
+
+        Returns:
+            The turn number to wait on, or None if the call is unknown
+        """
+        simulation_id = self.simulation_for_call(call_sid)
+        if not simulation_id:
+            return None
+        turn = self.state_backend.incr(f"voice:turn:{call_sid}", ttl=self.reply_ttl)
+        self._store(call_sid, {"turn": turn, "status": "pending"})
+        self.executor.submit(self._generate, call_sid, simulation_id, turn, speech)
+        return turn
+
+    def _generate(self, call_sid: str, simulation_id: str, turn: int, speech: str) -> None:
+        try:
+            reply = self.simulation_service.process_message(simulation_id, speech)
+            result = {"turn": turn, "status": "ready", "reply": reply} if reply is not None else {
+                "turn": turn, "status": "ended"
+            }
+        except AdmissionRejected:
+            result = {"turn": turn, "status": "busy"}
+        except Exception as e:
+            logger.error(f"Error generating reply for call {call_sid}: {str(e)}")
+            result = {"turn": turn, "status": "error"}
+        self._store(call_sid, result)
+
+    def _store(self, call_sid: str, result: Dict) -> None:
+        self.state_backend.set(self._reply_key(call_sid), json.dumps(result), ttl=self.reply_ttl)
+
+    def reply_for(self, call_sid: str, turn: int) -> Optional[Dict]:
+        """The finished reply for a turn, or None while it is being generated"""
+        stored = self.state_backend.get(self._reply_key(call_sid))
+        if stored is None:
+            return {"turn": turn, "status": "error"}
+        result = json.loads(stored)
+        if result["turn"] != turn:
+            # A newer turn replaced this one; it is not coming back
+            return {"turn": turn, "status": "error"} if result["turn"] > turn else None
+        return None if result["status"] == "pending" else result
+
+    async def wait_for_reply(self, call_sid: str, turn: int, timeout: float) -> Optional[Dict]:
+        """Wait up to timeout seconds for a turn's reply without blocking the event loop"""
+        deadline = time.monotonic() + timeout
+        while True:
+            # The state backend may be a network round trip, so it is read off the loop
+            result = await asyncio.to_thread(self.reply_for, call_sid, turn)
+            if result is not None or time.monotonic() >= deadline:
+                return result
+            await asyncio.sleep(self.poll_interval)
+
+    def reply_twiml(self, turn: int, result: Optional[Dict], attempt: int = 0) -> str:
+        """
+        TwiML for a turn: the reply if it is ready, else hold and poll again.
+
+        Args:
+            turn: The turn being answered
+            result: From wait_for_reply
+            attempt: How many times Twilio has polled for this turn
+        """
+        if result is None:
+            if attempt >= self.max_polls:
+                return self.twilio_service.create_twiml_response(APOLOGY_PROMPT)
+            return self.twilio_service.create_hold_twiml(
+                f"/api/voice/reply?turn={turn}&attempt={attempt + 1}",
+                HOLD_PROMPT if attempt == 0 else None
+            )
+        if result["status"] == "ready":
+            return self.twilio_service.create_twiml_response(result["reply"])
+        if result["status"] == "busy":
+            return self.twilio_service.create_twiml_response(BUSY_PROMPT)
+        if result["status"] == "ended":
+            return self.twilio_service.create_hangup_twiml(GOODBYE_PROMPT)
+        return self.twilio_service.create_twiml_response(APOLOGY_PROMPT)
+
+    def shutdown(self) -> None:
+        self.executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,273 @@
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeout
+from typing import Deque, Dict, Iterator, List, Optional
+import numpy as np
+from app.core.admission import AdmissionRejected
+from app.core.logger import logger
+from app.models.models import VoiceTurnMetric
+from app.services.streaming_tts import SentenceChunker, StreamingSynthesizer
+
+HOLD_PROMPT = "One moment, please."
+REPEAT_PROMPT = "Sorry, I didn't catch that. Could you say it again?"
+APOLOGY_PROMPT = "I'm sorry, I'm having trouble right now. Please bear with me."
+# Spoken when a stage runs late; prewarmed into the TTS cache
+PROMPTS = [HOLD_PROMPT, REPEAT_PROMPT, APOLOGY_PROMPT]
+
+
+class VoiceTurn:
+    """
+    One caller utterance and the agent's spoken reply.
+
+    Created by VoiceTurnOrchestrator.start_turn once the caller's speech is
+    transcribed; audio() then streams the reply. Times are measured from
+    the moment the turn started, i.e. the caller's end of speech.
+    """
+
+    def __init__(self, orchestrator: "VoiceTurnOrchestrator", simulation_id: str, started: float):
+        self.orchestrator = orchestrator
+        self.simulation_id = simulation_id
+        self.started = started
+        self.transcript = ""
+        self.reply_stream: Optional[Iterator[str]] = None
+        self.reply_parts: List[str] = []
+        self.timings: Dict[str, Optional[float]] = {"stt_ms": None, "first_token_ms": None, "first_audio_ms": None}
+        self.missed: List[str] = []
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.started) * 1000
+
+    @property
+    def reply(self) -> str:
+        return "".join(self.reply_parts)
+
+    def audio(self) -> Iterator[bytes]:
+        """Stream the spoken reply, recording the turn's timings when done"""
+        try:
+            yield from self.orchestrator._speak_reply(self)
+        finally:
+            self.orchestrator._record(self)
+
+
+class VoiceTurnOrchestrator:
+    """
+    Runs a voice turn with the stages overlapped.
+
+    The LLM reply is streamed on a producer thread; its text is cut into
+    sentences as it arrives and each sentence is sent to TTS straight away,
+    so the first sentence is being spoken while the LLM is still writing
+    the rest. The turn has a latency budget for end of speech to first
+    audio, and deadlines for the stages before it: a transcription that
+    runs late is abandoned and the caller asked to repeat, a late first
+    token gets a short hold prompt, and a reply that misses the whole
+    budget is replaced by an apology.
+    """
+
+    def __init__(self, simulation_service, speech_service, synthesizer: StreamingSynthesizer,
+                 budget_ms: Optional[float] = None, stt_deadline_ms: Optional[float] = None,
+                 first_token_deadline_ms: Optional[float] = None):
+        self.simulation_service = simulation_service
+        self.speech_service = speech_service
+        self.synthesizer = synthesizer
+        self.budget_ms = budget_ms or float(os.getenv("VOICE_TURN_BUDGET_MS", "3000"))
+        self.stt_deadline_ms = stt_deadline_ms or float(os.getenv("VOICE_TURN_STT_DEADLINE_MS", "1200"))
+        self.first_token_deadline_ms = first_token_deadline_ms or float(
+            os.getenv("VOICE_TURN_FIRST_TOKEN_DEADLINE_MS", "1500")
+        )
+        self._stt_executor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("VOICE_TURN_STT_WORKERS", "2")), thread_name_prefix="voice-stt"
+        )
+
+    def start_turn(self, simulation_id: str, audio_data: Optional[bytes] = None,
+                   transcript: Optional[str] = None) -> Optional[VoiceTurn]:
+        """
+        Transcribe the caller's speech and prepare the reply.
+
+        Args:
+            simulation_id: The call
+            audio_data: The caller's utterance as an encoded audio file
+            transcript: Already transcribed text (e.g. a streaming final)
+
+        Returns:
+            VoiceTurn, or None if the call is not active
+        """
+        turn = VoiceTurn(self, simulation_id, time.perf_counter())
+        if not self.simulation_service.is_active(simulation_id):
+            return None
+        if transcript is None:
+            future: Future = self._stt_executor.submit(self.speech_service.speech_to_text, audio_data, simulation_id)
+            try:
+                transcript = future.result(timeout=self.stt_deadline_ms / 1000)
+            except FutureTimeout:
+                turn.missed.append("stt")
+                transcript = ""
+            turn.timings["stt_ms"] = turn.elapsed_ms()
+        turn.transcript = transcript.strip()
+        if turn.transcript:
+            turn.reply_stream = self.simulation_service.stream_message(simulation_id, turn.transcript)
+            if turn.reply_stream is None:
+                return None
+        return turn
+
+    def _speak_reply(self, turn: VoiceTurn) -> Iterator[bytes]:
+        if turn.reply_stream is None:
+            # Nothing usable was heard, or transcription ran out of time
+            yield from self._prompt(turn, REPEAT_PROMPT)
+            return
+
+        events: "queue.Queue" = queue.Queue()
+        stop = threading.Event()
+        threading.Thread(
+            target=self._produce, args=(turn.reply_stream, events, stop), name="voice-llm", daemon=True
+        ).start()
+
+        chunker = SentenceChunker()
+        pending: Deque[Future] = deque()
+        budget_at = turn.started + self.budget_ms / 1000
+        first_token_at = turn.started + self.first_token_deadline_ms / 1000
+        held = False
+        finished = False
+        try:
+            while not finished or pending:
+                while pending and pending[0].done():
+                    audio, _ = pending.popleft().result()
+                    if audio:
+                        if turn.timings["first_audio_ms"] is None:
+                            turn.timings["first_audio_ms"] = turn.elapsed_ms()
+                        yield audio
+                if finished and not pending:
+                    break
+
+                now = time.perf_counter()
+                if turn.timings["first_audio_ms"] is None and now >= budget_at:
+                    turn.missed.append("budget")
+                    yield from self._prompt(turn, APOLOGY_PROMPT)
+                    return
+                if turn.timings["first_token_ms"] is None and not held and now >= first_token_at:
+                    turn.missed.append("first_token")
+                    held = True
+                    yield from self._prompt(turn, HOLD_PROMPT)
+                    continue
+
+                deadlines = [budget_at] if turn.timings["first_audio_ms"] is None else []
+                if turn.timings["first_token_ms"] is None and not held:
+                    deadlines.append(first_token_at)
+                timeout = max(min(deadlines) - now, 0) if deadlines else None
+                try:
+                    kind, value = events.get(timeout=timeout)
+                except queue.Empty:
+                    continue
+                if kind == "token":
+                    if turn.timings["first_token_ms"] is None:
+                        turn.timings["first_token_ms"] = turn.elapsed_ms()
+                    turn.reply_parts.append(value)
+                    for sentence in chunker.feed(value):
+                        self._synthesize(sentence, pending, events)
+                elif kind == "end":
+                    finished = True
+                    for sentence in chunker.flush():
+                        self._synthesize(sentence, pending, events)
+                elif kind == "rejected":
+                    turn.missed.append("admission")
+                    yield from self._prompt(turn, HOLD_PROMPT if not held else APOLOGY_PROMPT)
+                    return
+        finally:
+            stop.set()
+            for future in pending:
+                future.cancel()
+
+    def _synthesize(self, sentence: str, pending: Deque[Future], events: "queue.Queue") -> None:
+        future = self.synthesizer.submit(sentence)
+        # Wake the turn loop when audio is ready
+        future.add_done_callback(lambda _: events.put(("audio", None)))
+        pending.append(future)
+
+    @staticmethod
+    def _produce(reply_stream: Iterator[str], events: "queue.Queue", stop: threading.Event) -> None:
+        try:
+            for delta in reply_stream:
+                if stop.is_set():
+                    break
+                events.put(("token", delta))
+        except AdmissionRejected:
+            events.put(("rejected", None))
+            return
+        except Exception as e:
+            logger.error(f"Voice turn reply stream failed: {str(e)}")
+        finally:
+            reply_stream.close()
+        events.put(("end", None))
+
+    def _prompt(self, turn: VoiceTurn, text: str) -> Iterator[bytes]:
+        audio, _ = self.speech_service.text_to_speech(text)
+        if audio:
+            if turn.timings["first_audio_ms"] is None:
+                turn.timings["first_audio_ms"] = turn.elapsed_ms()
+            yield audio
+
+    def _record(self, turn: VoiceTurn) -> None:
+        total_ms = turn.elapsed_ms()
+        first_audio = turn.timings["first_audio_ms"]
+        db = self.simulation_service.session_factory()
+        try:
+            db.add(VoiceTurnMetric(
+                simulation_id=turn.simulation_id,
+                stt_ms=turn.timings["stt_ms"],
+                first_token_ms=turn.timings["first_token_ms"],
+                first_audio_ms=first_audio,
+                total_ms=total_ms,
+                budget_ms=self.budget_ms,
+                within_budget=first_audio is not None and first_audio <= self.budget_ms and not turn.missed,
+                missed_deadlines=list(turn.missed)
+            ))
+            db.commit()
+        except Exception as e:
+            logger.error(f"Error recording voice turn for simulation {turn.simulation_id}: {str(e)}")
+            db.rollback()
+        finally:
+            db.close()
+
+    def get_turn_metrics(self, simulation_id: str) -> Dict:
+        """Per-turn timing breakdown for a call, with percentiles per stage"""
+        db = self.simulation_service.session_factory()
+        try:
+            rows = (
+                db.query(VoiceTurnMetric)
+                .filter(VoiceTurnMetric.simulation_id == simulation_id)
+                .order_by(VoiceTurnMetric.id)
+                .all()
+            )
+        finally:
+            db.close()
+
+        turns = [
+            {
+                "stt_ms": row.stt_ms,
+                "first_token_ms": row.first_token_ms,
+                "first_audio_ms": row.first_audio_ms,
+                "total_ms": row.total_ms,
+                "budget_ms": row.budget_ms,
+                "within_budget": row.within_budget,
+                "missed_deadlines": row.missed_deadlines or [],
+                "created_at": row.created_at.isoformat()
+            }
+            for row in rows
+        ]
+        summary = {}
+        for stage in ["stt_ms", "first_token_ms", "first_audio_ms", "total_ms"]:
+            values = np.array([t[stage] for t in turns if t[stage] is not None])
+            summary[stage] = {
+                "p50": round(float(np.percentile(values, 50)), 1),
+                "p95": round(float(np.percentile(values, 95)), 1)
+            } if len(values) else None
+        return {
+            "turns": turns,
+            "summary": summary,
+            "within_budget": sum(1 for t in turns if t["within_budget"])
+        }
+
+    def shutdown(self) -> None:
+        self._stt_executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,83 @@
+import io
+import numpy as np
+import pytest
+import soundfile as sf
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from sqlalchemy.pool import StaticPool
+from app.database import Base
+from app.models import models  # noqa: F401 - registers the tables on Base
+from app.services.audio_processing import WHISPER_SAMPLE_RATE
+
+
+class FakeLLMService:
+    """Stands in for LLMService so tests never reach Groq"""
+
+    def __init__(self, reply: str = "How can I help you today?"):
+        self.reply = reply
+        self.calls = []
+
+    def get_response(self, message: str) -> str:
+        self.calls.append(message)
+        return self.reply
+
+
+class RecordingTranscriber:
+    """Stands in for the Whisper model, remembering the clips it was given"""
+
+    def __init__(self):
+        self.clips = []
+
+    def transcribe_batch(self, clips):
+        self.clips += clips
+        return ["hello"] * len(clips)
+
+
+def speechlike(seconds, rng, rate=WHISPER_SAMPLE_RATE):
+    """Noise bursts shaped like syllables, at conversational level"""
+    n = int(seconds * rate)
+    envelope = 0.5 + 0.5 * np.sin(2 * np.pi * 4 * np.arange(n) / rate) ** 2
+    return (0.2 * envelope * rng.standard_normal(n)).astype(np.float32)
+
+
+def silence(seconds, rng, rate=WHISPER_SAMPLE_RATE):
+    """Room noise well below speech"""
+    return (0.001 * rng.standard_normal(int(seconds * rate))).astype(np.float32)
+
+
+def wav_bytes(samples: np.ndarray, sample_rate: int) -> bytes:
+    buffer = io.BytesIO()
+    sf.write(buffer, samples, sample_rate, format="WAV", subtype="PCM_16")
+    return buffer.getvalue()
+
+
+@pytest.fixture
+def session_factory():
+    engine = create_engine(
+        "sqlite://",
+        connect_args={"check_same_thread": False},
+        poolclass=StaticPool
+    )
+    Base.metadata.create_all(bind=engine)
+    return sessionmaker(autocommit=False, autoflush=False, bind=engine)
+
+
+@pytest.fixture
+def fake_llm():
+    return FakeLLMService()
+
+
+@pytest.fixture(scope="session")
+def app_main(tmp_path_factory):
+    """app.main, for driving its routes with a TestClient; services can be swapped with monkeypatch"""
+    workdir = tmp_path_factory.mktemp("app")
+    (workdir / "app" / "static").mkdir(parents=True)
+    patch = pytest.MonkeyPatch()
+    patch.setenv("GROQ_API_KEY", "test")
+    # StaticFiles wants its directory to exist when the app is built
+    patch.chdir(workdir)
+    try:
+        import app.main
+    finally:
+        patch.undo()
+    return app.main
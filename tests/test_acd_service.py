@@ -0,0 +1,157 @@
+import random
+import time
+from app.core.state import InProcessStateBackend
+from app.models.models import CallSimulation
+from app.services.acd_service import CallDistributor
+from app.services.simulation_service import SimulationService
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_waiting_calls_are_routed_by_priority_then_arrival():
+    clock = FakeClock()
+    assigned = []
+    acd = CallDistributor(on_assign=lambda call, agent: assigned.append((call, agent.agent_id)), clock=clock)
+    acd.register_agent("ann", skills=["billing"])
+    acd.set_available("ann", False)
+    for call, priority_class in [("low-1", "low"), ("std-1", "standard"), ("esc-1", "escalated"),
+                                 ("std-2", "standard")]:
+        clock.now += 1
+        assert acd.enqueue(call, "billing", priority_class) is None
+
+    clock.now += 1
+    acd.set_available("ann", True)
+    for _ in range(3):
+        acd.complete(assigned[-1][0])
+
+    assert [call for call, _ in assigned] == ["esc-1", "std-1", "std-2", "low-1"]
+    metrics = acd.metrics()
+    assert metrics["routed"] == 4 and metrics["calls_waiting"] == 0
+    # low-1 arrived first and waited for all the others
+    assert metrics["wait_ms"]["max"] == 4000.0
+
+
+def test_least_loaded_then_most_skilled_agent_gets_the_call():
+    clock = FakeClock()
+    acd = CallDistributor(clock=clock)
+    acd.register_agent("ann", skills={"billing": 1}, capacity=2)
+    clock.now += 1
+    acd.register_agent("bob", skills={"billing": 5}, capacity=2)
+    clock.now += 1
+    acd.register_agent("cat", skills={"billing": 5}, capacity=2)
+
+    # Same load and level: bob has been idle longest
+    assert acd.enqueue("call-1", "billing") == "bob"
+    assert acd.enqueue("call-2", "billing") == "cat"
+    # Everyone else is busier than ann now, whatever her level
+    assert acd.enqueue("call-3", "billing") == "ann"
+    assert acd.enqueue("call-4", "billing") == "bob"
+
+    acd.set_available("cat", False)
+    assert acd.enqueue("call-5", "billing") == "ann"
+    assert acd.enqueue("call-6", "billing") is None
+    assert acd.metrics()["skills"] == {"billing": {"waiting": 1, "oldest_wait_ms": 0.0}}
+    # Direct transfers go through the agent's own queue
+    assert acd.enqueue("call-7", "agent:cat") is None
+    acd.set_available("cat", True)
+    assert acd.assigned_agent("call-6") == "cat"
+    acd.complete("call-2")
+    assert acd.assigned_agent("call-7") == "cat"
+
+
+def test_transfer_queues_the_call_until_an_agent_is_free(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    service.presence.update("ann", skills=["billing"])
+    first = service.start_simulation()
+    second = service.start_simulation()
+    third = service.start_simulation()
+
+    assert not service.transfer_call(first, "claims", "No such skill")
+    assert service.transfer_call(first, "billing", "Refund request")
+    assert service.transfer_call(second, "billing", "Refund request")
+    assert service.transfer_call(third, "ann", "Asked for Ann")
+
+    db = session_factory()
+    statuses = {s.id: (s.status, s.transferred_to) for s in db.query(CallSimulation)}
+    assert statuses[first] == ("transferred", "ann")
+    assert statuses[second] == ("queued", None)
+    assert not service.is_active(second)
+
+    assert service.end_simulation(second)
+    assert service.acd.metrics()["abandoned"] == 1
+    assert service.presence.get("ann").load == 1
+    service.acd.complete(first)
+    db.expire_all()
+    assert db.get(CallSimulation, third).status == "transferred"
+    assert db.get(CallSimulation, second).status == "abandoned"
+    db.close()
+    assert service.presence.get("ann").load == 1
+
+    # Transfers are checked against presence: nobody logged in has the skill
+    service.presence.update("ann", state="offline")
+    fourth = service.start_simulation()
+    assert not service.transfer_call(fourth, "billing", "Refund request")
+    assert not service.transfer_call(fourth, "ann", "Asked for Ann")
+
+
+def test_workers_share_agents_and_queued_calls_survive_a_restart(session_factory, fake_llm):
+    backend = InProcessStateBackend()
+    first = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60, state_backend=backend)
+    first.presence.start()
+    first.presence.update("ann", skills=["billing"], state="busy")
+    early = first.start_simulation()
+    assert first.transfer_call(early, "billing", "Refund request")
+
+    # A worker started later queues the waiting call too
+    second = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60, state_backend=backend)
+    second.presence.start()
+    assert second.resume_transfers() == 1
+    late = second.start_simulation()
+    assert second.transfer_call(late, "billing", "Refund request")
+
+    # Both route to ann when she is free; her one slot goes to one call
+    second.presence.update("ann", state="available")
+    db = session_factory()
+    statuses = {s.id: (s.status, s.transferred_to) for s in db.query(CallSimulation)}
+    assert statuses == {early: ("transferred", "ann"), late: ("queued", None)}
+    assert first.presence.get("ann").load == second.presence.get("ann").load == 1
+
+    # Completed on the worker that did not route it, which frees ann for the next call
+    router, other = (first, second) if first.acd.assigned_agent(early) else (second, first)
+    assert other.acd.assigned_agent(early) is None
+    assert not other.complete_agent_call("bob", early)
+    assert other.complete_agent_call("ann", early)
+    db.expire_all()
+    assert db.get(CallSimulation, late).transferred_to == "ann"
+    db.close()
+    assert first.presence.get("ann").load == second.presence.get("ann").load == 1
+    assert second.complete_agent_call("ann", late)
+    assert first.presence.get("ann").load == 0
+
+
+def test_routing_stays_fast_with_a_large_backlog():
+    rng = random.Random(0)
+    skills = [f"skill-{i}" for i in range(20)]
+    acd = CallDistributor()
+    for i in range(300):
+        acd.register_agent(f"agent-{i}", skills=rng.sample(skills, 3), capacity=2)
+        acd.set_available(f"agent-{i}", False)
+    for i in range(5000):
+        acd.enqueue(f"call-{i}", rng.choice(skills), rng.choice(["escalated", "standard", "low"]))
+
+    for i in range(300):
+        acd.set_available(f"agent-{i}", True)
+    calls = [call for agent in acd.registry.agents.values() for call in agent.calls]
+    started = time.perf_counter()
+    for call in calls:
+        acd.complete(call)
+    per_call = (time.perf_counter() - started) / len(calls)
+
+    assert acd.metrics()["calls_with_agents"] == 600
+    assert per_call < 0.001
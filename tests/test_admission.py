@@ -0,0 +1,180 @@
+import threading
+import time
+import pytest
+from app.core.admission import AdmissionController, AdmissionRejected, WeightedFairQueue
+from app.models.models import CallSimulation
+from app.services.simulation_service import SimulationService
+
+
+def _hold(controller, release, results, name):
+    try:
+        with controller.slot() as waited:
+            results.append((name, waited))
+            release.wait(5)
+    except AdmissionRejected as e:
+        results.append((name, e.reason))
+
+
+def test_admits_up_to_concurrency_without_waiting():
+    controller = AdmissionController(max_concurrency=2, max_queue_depth=0)
+    assert controller.acquire() < 0.01
+    assert controller.acquire() < 0.01
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire()
+    assert excinfo.value.reason == "queue_full"
+    assert excinfo.value.retry_after >= 1
+    controller.release()
+    assert controller.acquire() < 0.01
+
+
+def test_waiters_time_out_after_max_wait():
+    controller = AdmissionController(max_concurrency=1, max_queue_depth=4, max_wait=0.05)
+    controller.acquire()
+    started = time.monotonic()
+    with pytest.raises(AdmissionRejected) as excinfo:
+        controller.acquire()
+    assert excinfo.value.reason == "timeout"
+    assert time.monotonic() - started < 0.5
+    assert controller.queue_depth == 0
+    assert controller.metrics()["rejected"] == {"queue_full": 0, "timeout": 1}
+
+
+def test_queued_callers_are_admitted_in_order():
+    controller = AdmissionController(max_concurrency=1, max_queue_depth=4, max_wait=5)
+    controller.acquire()
+    order = []
+
+    def worker(name):
+        with controller.slot():
+            order.append(name)
+
+    threads = []
+    for name in ["a", "b", "c"]:
+        thread = threading.Thread(target=worker, args=(name,))
+        thread.start()
+        threads.append(thread)
+        while controller.queue_depth < len(threads):
+            time.sleep(0.001)
+    controller.release()
+    for thread in threads:
+        thread.join()
+    assert order == ["a", "b", "c"]
+
+
+def test_overload_sheds_fast_and_bounds_admitted_wait():
+    controller = AdmissionController(max_concurrency=2, max_queue_depth=2, max_wait=0.2)
+    release = threading.Event()
+    results = []
+    threads = [
+        threading.Thread(target=_hold, args=(controller, release, results, i))
+        for i in range(10)
+    ]
+    started = time.monotonic()
+    for thread in threads:
+        thread.start()
+    time.sleep(0.05)
+    rejected_fast = [r for r in results if r[1] == "queue_full"]
+    # 2 running + 2 queued; the other 6 were turned away without waiting
+    assert len(rejected_fast) == 6
+    assert time.monotonic() - started < 0.2
+    release.set()
+    for thread in threads:
+        thread.join()
+    waits = [r[1] for r in results if isinstance(r[1], float)]
+    assert len(waits) == 4
+    assert max(waits) <= 0.2
+    metrics = controller.metrics()
+    assert metrics["admitted"] == 4
+    assert metrics["active"] == 0
+
+
+class SlowLLM:
+    def __init__(self, release):
+        self.release = release
+
+    def get_response(self, message):
+        self.release.wait(5)
+        return "Thanks for waiting."
+
+
+def test_process_message_raises_when_llm_saturated(session_factory):
+    release = threading.Event()
+    service = SimulationService(SlowLLM(release), session_factory=session_factory, idle_timeout=60)
+    service.admission = AdmissionController(max_concurrency=1, max_queue_depth=0)
+    simulation_id = service.start_simulation()
+
+    replies = []
+    busy = threading.Thread(target=lambda: replies.append(service.process_message(simulation_id, "hi")))
+    busy.start()
+    while service.admission.active == 0:
+        time.sleep(0.001)
+    with pytest.raises(AdmissionRejected):
+        service.process_message(simulation_id, "anyone?")
+    release.set()
+    busy.join()
+    assert replies == ["Thanks for waiting."]
+
+
+def _drain(queue, now=0.0):
+    order = []
+    while len(queue):
+        ticket = queue.peek(now)
+        queue.pop(ticket)
+        order.append(ticket.priority_class)
+    return order
+
+
+def test_wfq_shares_slots_by_weight():
+    queue = WeightedFairQueue({"standard": 4, "low": 1}, aging_after=60)
+    for _ in range(40):
+        queue.push("low", 0.0)
+    for _ in range(40):
+        queue.push("standard", 0.0)
+    first_25 = _drain(queue)[:25]
+    assert first_25.count("standard") == 20
+    assert first_25.count("low") == 5
+
+
+def test_wfq_serves_late_escalation_ahead_of_backlog():
+    queue = WeightedFairQueue(aging_after=60)
+    for _ in range(10):
+        queue.push("standard", 0.0)
+    escalated = queue.push("escalated", 0.0)
+    assert queue.peek(0.0) is escalated
+
+
+def test_wfq_aging_prevents_starvation():
+    queue = WeightedFairQueue({"escalated": 100, "low": 1}, aging_after=2)
+    low = queue.push("low", 0.0)
+    for _ in range(50):
+        queue.push("escalated", 1.0)
+    assert queue.peek(1.5) is not low
+    assert queue.peek(2.5) is low
+
+
+def test_unknown_priority_class_is_rejected():
+    with pytest.raises(ValueError):
+        AdmissionController().acquire("platinum")
+
+
+def test_per_class_latency_metrics():
+    controller = AdmissionController(max_concurrency=1)
+    with controller.slot("escalated"):
+        time.sleep(0.01)
+    with controller.slot("low"):
+        pass
+    classes = controller.metrics()["classes"]
+    assert classes["escalated"]["admitted"] == 1
+    assert classes["escalated"]["latency_ms"]["p50"] >= 10
+    assert classes["low"]["admitted"] == 1
+    assert classes["standard"]["admitted"] == 0
+
+
+def test_priority_class_from_tags_and_escalation_state():
+    assert SimulationService._priority_class(CallSimulation(tags=[])) == "standard"
+    assert SimulationService._priority_class(CallSimulation(tags=["vip"])) == "escalated"
+    assert SimulationService._priority_class(CallSimulation(tags=["bulk"])) == "low"
+    assert SimulationService._priority_class(
+        CallSimulation(tags=["bulk"], quality_metrics={"sentiment": {"n": 3, "esc": True}})
+    ) == "escalated"
+    assert SimulationService._parse_class_weights("gold=5, standard=1") == {"gold": 5.0, "standard": 1.0}
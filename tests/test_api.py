@@ -1,11 +1,16 @@
 import pytest
 from fastapi.testclient import TestClient
+from twilio.request_validator import RequestValidator
+from app import main as app_main
 from app.main import app
 import json
 from datetime import datetime
 
 client = TestClient(app)
 
+TWILIO_AUTH_TOKEN = "test-auth-token"
+PUBLIC_BASE_URL = "https://calls.example.com"
+
 @pytest.fixture
 def auth_headers():
     # Get authentication token
@@ -16,6 +21,18 @@ def auth_headers():
     token = response.json()["access_token"]
     return {"Authorization": f"Bearer {token}"}
 
+@pytest.fixture
+def twilio_post(monkeypatch):
+    """POST to a Twilio webhook, signed the way Twilio signs it"""
+    monkeypatch.setattr(app_main.twilio_service, "auth_token", TWILIO_AUTH_TOKEN)
+    monkeypatch.setattr(app_main.twilio_service, "public_base_url", PUBLIC_BASE_URL)
+
+    def post(path, data):
+        signature = RequestValidator(TWILIO_AUTH_TOKEN).compute_signature(PUBLIC_BASE_URL + path, data)
+        return client.post(path, data=data, headers={"X-Twilio-Signature": signature})
+
+    return post
+
 def test_get_call_statistics(auth_headers):
     response = client.get("/api/calls/statistics", headers=auth_headers)
     assert response.status_code == 200
@@ -54,8 +71,8 @@ def test_make_call_authorized(auth_headers):
     )
     assert response.status_code in [200, 500]  # 500 if Twilio credentials are not set
 
-def test_handle_call():
-    response = client.post(
+def test_handle_call(twilio_post):
+    response = twilio_post(
         "/api/voice/handle-call",
         data={
             "CallSid": "test_call_123",
@@ -67,8 +84,8 @@ def test_handle_call():
     assert response.headers["content-type"] == "application/xml"
     assert "<Response>" in response.text
 
-def test_process_speech():
-    response = client.post(
+def test_process_speech(twilio_post):
+    response = twilio_post(
         "/api/voice/process-speech",
         data={
             "CallSid": "test_call_123",
@@ -78,4 +95,7 @@ def test_process_speech():
     assert response.status_code in [200, 404]  # 404 if call not found
     if response.status_code == 200:
         assert response.headers["content-type"] == "application/xml"
-        assert "<Response>" in response.text 
\ No newline at end of file
+        assert "<Response>" in response.text 
+def test_unsigned_webhooks_are_refused(twilio_post):
+    response = client.post("/api/voice/handle-call", data={"CallSid": "test_call_123"})
+    assert response.status_code == 403
@@ -0,0 +1,84 @@
+import io
+import os
+import tempfile
+import time
+import numpy as np
+import soundfile as sf
+from app.services.audio_processing import (
+    WHISPER_SAMPLE_RATE, StreamResampler, decode_audio, load_audio, resample
+)
+from tests.conftest import wav_bytes
+
+
+def _tone(frequency: float, seconds: float, sample_rate: int) -> np.ndarray:
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    return 0.5 * np.sin(2 * np.pi * frequency * t)
+
+
+def test_stereo_is_mixed_down_to_mono_float32():
+    left = _tone(440, 0.5, 8000)
+    audio, sample_rate = decode_audio(wav_bytes(np.stack([left, left], axis=1), 8000))
+    assert sample_rate == 8000
+    assert audio.dtype == np.float32 and audio.ndim == 1
+    assert np.allclose(audio, left, atol=1e-3)
+
+
+def test_resampling_keeps_the_tone_and_duration():
+    audio = load_audio(wav_bytes(_tone(440, 1.0, 44100), 44100))
+    assert audio.dtype == np.float32
+    assert len(audio) == WHISPER_SAMPLE_RATE
+    spectrum = np.abs(np.fft.rfft(audio))
+    assert np.argmax(spectrum) * WHISPER_SAMPLE_RATE / len(audio) == 440
+
+
+def test_downsampling_removes_content_above_nyquist():
+    # 12 kHz is above the 8 kHz Nyquist limit of 16 kHz audio and must not alias down
+    audio = resample(_tone(12000, 1.0, 48000), 48000)
+    assert np.abs(audio).max() < 1e-3
+
+
+def test_stream_resampler_output_does_not_depend_on_chunking():
+    rng = np.random.default_rng(0)
+    for sample_rate in (48000, 44100, 8000):
+        tone = _tone(1000, 1.0, sample_rate).astype(np.float32)
+        whole = StreamResampler(sample_rate).process(tone)
+        resampler = StreamResampler(sample_rate)
+        chunks, i = [], 0
+        while i < len(tone):
+            step = int(rng.integers(1, 1500))
+            chunks.append(resampler.process(tone[i:i + step]))
+            i += step
+        chunked = np.concatenate(chunks)
+        assert len(chunked) == WHISPER_SAMPLE_RATE
+        np.testing.assert_allclose(chunked, whole, atol=1e-6)
+        # Past the filter's start-up, a clean tone at the original level
+        spectrum = np.abs(np.fft.rfft(chunked[1000:] * np.hanning(len(chunked) - 1000)))
+        assert abs(np.argmax(spectrum) * WHISPER_SAMPLE_RATE / (len(chunked) - 1000) - 1000) < 2
+        assert abs(np.abs(chunked[1000:]).max() - 0.5) < 0.01
+
+    assert np.abs(StreamResampler(48000).process(_tone(12000, 1.0, 48000))[500:]).max() < 1e-3
+
+
+def test_in_memory_path_latency_per_second_of_audio():
+    seconds = 30
+    data = wav_bytes(np.stack([_tone(300, seconds, 44100)] * 2, axis=1), 44100)
+
+    started = time.perf_counter()
+    load_audio(data)
+    in_memory = (time.perf_counter() - started) / seconds
+
+    # The old path's disk round trip alone; Whisper then decoded and
+    # resampled the file again in an ffmpeg subprocess on top of this
+    started = time.perf_counter()
+    samples, sample_rate = sf.read(io.BytesIO(data))
+    with tempfile.NamedTemporaryFile(suffix=".wav", delete=False) as temp_file:
+        temp_path = temp_file.name
+    sf.write(temp_path, samples, sample_rate)
+    with open(temp_path, "rb") as f:
+        sf.read(f)
+    os.unlink(temp_path)
+    via_file = (time.perf_counter() - started) / seconds
+
+    print(f"\nper second of audio: in-memory decode + resample {in_memory * 1000:.3f} ms, "
+          f"temp file round trip {via_file * 1000:.3f} ms")
+    assert in_memory < 0.01
@@ -0,0 +1,85 @@
+import json
+import numpy as np
+import soundfile as sf
+from app.models.models import CallSimulation, Message
+from app.services.audio_processing import WHISPER_SAMPLE_RATE
+from app.services.batch_transcription import BatchTranscriber, call_id_for, length_batches
+from tests.conftest import silence, speechlike
+
+RATE = WHISPER_SAMPLE_RATE
+
+PHRASES = {1.0: "thank you so much that is great", 2.0: "this is terrible and I am angry", 0.5: "okay"}
+
+
+def _recording(path, lengths, seed):
+    rng = np.random.default_rng(seed)
+    pieces = [silence(0.5, rng)]
+    for seconds in lengths:
+        pieces += [speechlike(seconds, rng), silence(1.0, rng)]
+    sf.write(path, np.concatenate(pieces), RATE)
+
+
+class FakeModel:
+    """Answers by utterance length, which the test recordings encode"""
+
+    def __init__(self):
+        self.batches = []
+
+    def transcribe_batch(self, clips):
+        self.batches.append([len(clip) for clip in clips])
+        return [min(PHRASES.items(), key=lambda p: abs(p[0] - len(clip) / RATE))[1] for clip in clips]
+
+
+def test_length_batches_group_similar_lengths():
+    assert length_batches([5, 100, 7, 90, 6, 95], 3) == [[1, 5, 3], [2, 4, 0]]
+
+
+def test_recordings_become_scored_calls_and_reruns_skip_them(session_factory, tmp_path):
+    recordings = tmp_path / "recordings"
+    recordings.mkdir()
+    _recording(recordings / "a.wav", [1.0, 2.0], seed=0)
+    _recording(recordings / "b.wav", [2.0, 0.5, 2.0], seed=1)
+    (recordings / "notes.txt").write_text("not audio")
+    model = FakeModel()
+    transcriber = BatchTranscriber(
+        session_factory, transcribe_batch=model.transcribe_batch, workers=2, batch_size=2,
+        manifest_path=tmp_path / "manifest.jsonl", progress=lambda p: None
+    )
+
+    summary = transcriber.run(recordings)
+
+    assert summary["recordings"] == 2 and summary["utterances"] == 5 and summary["failed"] == 0
+    # longest first, so each batch holds similar lengths
+    assert [len(batch) for batch in model.batches] == [2, 2, 1]
+    assert min(model.batches[0]) > max(model.batches[1])
+    db = session_factory()
+    call = db.query(CallSimulation).filter(CallSimulation.id == call_id_for(recordings / "b.wav")).one()
+    messages = db.query(Message).filter(Message.simulation_id == call.id).order_by(Message.timestamp).all()
+    assert [m.content for m in messages] == [PHRASES[2.0], PHRASES[0.5], PHRASES[2.0]]
+    assert all(m.sentiment_score < 0 for m in (messages[0], messages[2]))
+    assert call.status == "completed" and call.sentiment_score < 0 and "recording" in call.tags
+    db.close()
+    manifest = [json.loads(line) for line in (tmp_path / "manifest.jsonl").read_text().splitlines()]
+    assert sorted(entry["utterances"] for entry in manifest) == [2, 3]
+
+    _recording(recordings / "c.wav", [1.0], seed=2)
+    summary = transcriber.run(recordings)
+    assert summary["recordings"] == 1
+
+
+def test_a_rerun_replaces_a_call_missing_from_the_manifest(session_factory, tmp_path):
+    _recording(tmp_path / "a.wav", [1.0, 1.0], seed=3)
+    (tmp_path / "broken.wav").write_bytes(b"not a wav file")
+    manifest = tmp_path / "data" / "manifest.jsonl"
+    transcriber = BatchTranscriber(
+        session_factory, transcribe_batch=FakeModel().transcribe_batch, workers=1,
+        manifest_path=manifest, progress=lambda p: None
+    )
+    assert transcriber.run(tmp_path)["failed"] == 1
+    manifest.unlink()
+    assert transcriber.run(tmp_path)["recordings"] == 1
+
+    db = session_factory()
+    assert db.query(CallSimulation).count() == 1
+    assert db.query(Message).count() == 2
+    db.close()
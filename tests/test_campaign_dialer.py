@@ -0,0 +1,125 @@
+import asyncio
+import time
+from urllib.parse import parse_qsl, urlsplit
+import pytest
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+from app.database import Base
+from app.models.models import CampaignCall
+from app.services.campaign_dialer import CampaignDialer, TokenBucket
+from tests.twilio_standin import TwilioRESTStandIn
+
+
+@pytest.fixture
+def session_factory(tmp_path):
+    # Callbacks and the dialer's worker threads write at the same time, which
+    # the shared in-memory connection of the default fixture cannot take
+    engine = create_engine(f"sqlite:///{tmp_path / 'campaigns.db'}", connect_args={"check_same_thread": False})
+    Base.metadata.create_all(bind=engine)
+    yield sessionmaker(autocommit=False, autoflush=False, bind=engine)
+    engine.dispose()
+
+
+def _dialer(session_factory, **kwargs):
+    standin_options = {key: kwargs.pop(key) for key in ("call_seconds", "fail_first", "fail_status",
+                                                         "invalid_numbers", "late_statuses") if key in kwargs}
+    dialer = None
+
+    def status_callback(url, form):
+        # Routed the way app.main does
+        parts = urlsplit(url)
+        assert parts.path == "/api/voice/status"
+        dialer.record_status(form["CallSid"], form["CallStatus"], form.get("CallDuration"),
+                             dict(parse_qsl(parts.query)).get("campaign_call"))
+
+    standin = TwilioRESTStandIn(status_callback, **standin_options)
+    options = dict(calls_per_second=50, max_live_calls=5, backoff_base=0.01, poll_interval=0.01)
+    options.update(kwargs)
+    dialer = CampaignDialer("AC123", "token", "+15550100", public_base_url="https://calls.example.com/",
+                            session_factory=session_factory, api_base="https://twilio.test",
+                            transport=standin, **options)
+    return dialer, standin
+
+
+def _numbers(count):
+    return [f"+1555020{i:04d}" for i in range(count)]
+
+
+def test_every_number_is_called_and_its_outcome_stored(session_factory):
+    dialer, standin = _dialer(session_factory)
+    campaign_id = dialer.create_campaign(_numbers(20))
+
+    summary = asyncio.run(dialer.run(campaign_id))
+
+    assert summary["numbers"] == 20
+    assert summary["statuses"] == {"completed": 20}
+    assert summary["attempts"] == 20
+    assert sorted(form["To"] for _, form in standin.created) == _numbers(20)
+    form = standin.created[0][1]
+    assert form["From"] == "+15550100"
+    assert form["Url"] == "https://calls.example.com/api/voice/handle-call"
+    assert form["StatusCallback"].startswith("https://calls.example.com/api/voice/status?campaign_call=")
+    assert "completed" in form["StatusCallbackEvent"]
+
+    db = session_factory()
+    rows = db.query(CampaignCall).filter(CampaignCall.campaign_id == campaign_id).all()
+    db.close()
+    assert all(row.call_sid and row.duration is not None for row in rows)
+
+
+def test_rate_and_live_calls_stay_within_limits(session_factory):
+    dialer, standin = _dialer(session_factory, calls_per_second=20, max_live_calls=3, call_seconds=0.1)
+    campaign_id = dialer.create_campaign(_numbers(12))
+
+    summary = asyncio.run(dialer.run(campaign_id))
+
+    assert summary["statuses"] == {"completed": 12}
+    assert standin.max_live <= 3
+    times = [created for created, _ in standin.created]
+    # 12 calls at 20 per second with no bursts take at least 11 intervals
+    assert times[-1] - times[0] >= 11 / 20 * 0.9
+
+
+def test_transient_failures_are_retried_and_bad_numbers_fail(session_factory):
+    dialer, standin = _dialer(session_factory, fail_first=3, fail_status=429, invalid_numbers={"+15550200001"})
+    campaign_id = dialer.create_campaign(_numbers(4))
+
+    summary = asyncio.run(dialer.run(campaign_id))
+
+    assert summary["statuses"] == {"completed": 3, "error": 1}
+    # Three rate-limited requests, three calls and one rejected number, not retried
+    assert standin.requests == 7
+    assert summary["attempts"] == 7
+    db = session_factory()
+    failed = db.query(CampaignCall).filter(CampaignCall.status == "error").one()
+    db.close()
+    assert failed.to_number == "+15550200001"
+    assert "21211" in failed.last_error
+
+
+def test_late_callbacks_do_not_undo_a_final_status(session_factory):
+    dialer, standin = _dialer(session_factory, late_statuses=("ringing", "in-progress"), max_call_seconds=2)
+    campaign_id = dialer.create_campaign(_numbers(5))
+
+    summary = asyncio.run(dialer.run(campaign_id))
+
+    assert summary["statuses"] == {"completed": 5}
+    db = session_factory()
+    row = db.query(CampaignCall).filter(CampaignCall.campaign_id == campaign_id).first()
+    db.close()
+    assert row.duration is not None
+    # a late callback is still for a known call
+    assert dialer.record_status(row.call_sid, "ringing", campaign_call=str(row.id))
+    assert not dialer.record_status("CA-unknown", "ringing")
+
+
+def test_token_bucket_spaces_events():
+    async def acquire_all(bucket, count):
+        for _ in range(count):
+            await bucket.acquire()
+
+    bucket = TokenBucket(rate=50)
+    started = time.monotonic()
+    asyncio.run(acquire_all(bucket, 6))
+    # The first token is there from the start; five more at 20 ms each
+    assert time.monotonic() - started >= 5 / 50 * 0.9
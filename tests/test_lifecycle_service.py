@@ -0,0 +1,130 @@
+import pytest
+from datetime import datetime, timedelta
+from app.services.lifecycle_service import CallLifecycleScheduler
+from app.services.simulation_service import SimulationService
+from app.models.models import CallSimulation
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_700_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock():
+    return FakeClock()
+
+
+@pytest.fixture
+def expired():
+    return []
+
+
+@pytest.fixture
+def scheduler(clock, expired):
+    return CallLifecycleScheduler(
+        lambda sim_id, last_activity, engaged: expired.append((sim_id, last_activity, engaged)),
+        idle_timeout=60,
+        clock=clock
+    )
+
+
+def test_idle_call_expires_after_timeout(scheduler, clock, expired):
+    scheduler.touch("a")
+    clock.now += 59
+    assert scheduler.run_pending() == []
+    clock.now += 1
+    assert scheduler.run_pending() == ["a"]
+    assert expired[0][0] == "a"
+    assert expired[0][2] is False
+    assert not scheduler.is_tracked("a")
+
+
+def test_touch_postpones_deadline(scheduler, clock, expired):
+    scheduler.touch("a")
+    clock.now += 50
+    scheduler.touch("a", engaged=True)
+    clock.now += 50
+    assert scheduler.run_pending() == []
+    # the stale entry is re-armed rather than duplicated
+    assert len(scheduler._heap) == 1
+    clock.now += 10
+    assert scheduler.run_pending() == ["a"]
+    assert expired[0][1] == datetime.utcfromtimestamp(clock.now - 60)
+    assert expired[0][2] is True
+
+
+def test_forgotten_call_never_expires(scheduler, clock, expired):
+    scheduler.touch("a")
+    scheduler.forget("a")
+    clock.now += 120
+    assert scheduler.run_pending() == []
+    assert expired == []
+
+
+def test_tick_only_visits_due_entries(scheduler, clock):
+    for i in range(1000):
+        scheduler.touch(f"call-{i}", timestamp=clock.now + i)
+    clock.now += 60 + 9
+    assert len(scheduler.run_pending()) == 10
+    assert scheduler.active_count == 990
+
+
+def test_expire_simulation_sets_status_and_resolution_time(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    engaged_id = service.start_simulation()
+    idle_id = service.start_simulation()
+    assert service.process_message(engaged_id, "Hello there") == fake_llm.reply
+
+    db = session_factory()
+    start = db.query(CallSimulation).filter(CallSimulation.id == engaged_id).first().start_time
+    db.close()
+
+    assert service.expire_simulation(engaged_id, start + timedelta(seconds=42), True)
+    assert service.expire_simulation(idle_id, start, False)
+    assert not service.expire_simulation(idle_id, start, False)
+
+    db = session_factory()
+    engaged = db.query(CallSimulation).filter(CallSimulation.id == engaged_id).first()
+    idle = db.query(CallSimulation).filter(CallSimulation.id == idle_id).first()
+    assert engaged.status == "completed"
+    assert engaged.resolution_time == 42
+    assert "idle-timeout" in engaged.tags
+    assert idle.status == "abandoned"
+    db.close()
+
+
+def test_ended_call_stops_being_tracked(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    simulation_id = service.start_simulation()
+    assert service.lifecycle.is_tracked(simulation_id)
+    assert service.end_simulation(simulation_id)
+    assert not service.lifecycle.is_tracked(simulation_id)
+
+
+def test_end_listeners_hear_about_ended_and_expired_calls(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    ended = []
+    service.add_end_listener(ended.append)
+    first = service.start_simulation()
+    second = service.start_simulation()
+    assert service.end_simulation(first)
+    assert service.expire_simulation(second, datetime.utcnow(), False)
+    assert not service.end_simulation(second)
+    assert ended == [first, second]
+
+
+def test_resume_lifecycle_tracks_open_calls(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    open_id = service.start_simulation()
+    closed_id = service.start_simulation()
+    service.process_message(open_id, "Is anyone there?")
+    service.end_simulation(closed_id)
+
+    restarted = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    assert restarted.resume_lifecycle() == 1
+    assert restarted.lifecycle.is_tracked(open_id)
+    assert restarted.lifecycle._read_activity(open_id)[1] is True
@@ -0,0 +1,148 @@
+from datetime import datetime
+import numpy as np
+import pytest
+from app.models.models import CallSimulation, NetworkChunk, NetworkSeries
+from app.services.analytics_service import AnalyticsService
+from app.services.network_simulator import (
+    PROFILES, NetworkSimulator, get_profile, pack_series, pack_sketch, sketch_add, sketch_percentile, summarize,
+    unpack_series, unpack_sketch
+)
+from app.services.simulation_service import SimulationService
+
+
+def _run(profile_name, turns, seed=0):
+    simulator = NetworkSimulator(get_profile(profile_name), seed=seed)
+    return np.array([simulator.next_turn() for _ in range(turns)])
+
+
+@pytest.mark.parametrize("name", ["fiber", "wifi-congested", "3g", "satellite"])
+def test_long_run_quality_matches_the_profile(name):
+    profile = PROFILES[name]
+    samples = _run(name, 2000)
+    latency, jitter, loss = samples.T
+
+    assert abs(latency.mean() - profile.latency_ms) < max(2.0, 0.1 * profile.latency_ms) + \
+        profile.spike_probability * profile.spike_ms
+    assert abs(loss.mean() - profile.expected_loss) < max(0.002, 0.3 * profile.expected_loss)
+    assert jitter.mean() >= 0.8 * profile.expected_jitter_ms
+
+
+def test_loss_comes_in_bursts():
+    profile = PROFILES["3g"]
+    loss = _run("3g", 2000, seed=1)[:, 2]
+    # Independent losses would spread like a binomial over each turn's packets;
+    # bursts make some turns much worse and most of the rest clean
+    independent = profile.expected_loss * (1 - profile.expected_loss) / 50
+    assert loss.var() > 3 * independent
+    assert np.median(loss) < profile.expected_loss
+
+
+def test_series_pack_into_four_bytes_a_sample():
+    values = [12.5, 40.25, 600.0]
+    blob = pack_series(values)
+    assert len(blob) == 12
+    assert unpack_series(blob).tolist() == values
+    assert len(unpack_series(None)) == 0
+    assert summarize(unpack_series(b""), unpack_series(b""), unpack_series(b""))["samples"] == 0
+    with pytest.raises(ValueError):
+        get_profile("dial-up")
+
+
+def test_each_turn_adds_a_network_sample(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    with pytest.raises(ValueError):
+        service.start_simulation(network_profile="dial-up")
+    simulation_id = service.start_simulation(network_profile="4g")
+    # the history view formats these before the first turn too
+    metrics = service.get_simulation_details(simulation_id)["quality_metrics"]
+    assert (metrics["network_latency"], metrics["packet_loss"], metrics["jitter"]) == (0.0, 0.0, 0.0)
+    for i in range(5):
+        assert service.process_message(simulation_id, f"Question {i}") == fake_llm.reply
+
+    series = service.get_network_series(simulation_id)
+    assert series["profile"] == "4g"
+    assert len(series["latency_ms"]) == len(series["packet_loss"]) == 5
+    assert series["summary"]["samples"] == 5
+    details = service.get_simulation_details(simulation_id)
+    assert details["quality_metrics"]["network_samples"] == 5
+    assert details["quality_metrics"]["network_profile"] == "4g"
+
+    # A restarted process carries on from the stored series
+    restarted = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    restarted.process_message(simulation_id, "Still there?")
+    db = session_factory()
+    stored = db.get(NetworkSeries, simulation_id)
+    assert stored.samples == 6 and len(db.get(NetworkChunk, (simulation_id, 0)).latency_ms) == 24
+    db.close()
+
+    # A turn that lands after the call ended is recorded without caching a simulator
+    restarted.end_simulation(simulation_id)
+    db = session_factory()
+    restarted._record_network({"simulation_id": simulation_id}, db)
+    db.commit()
+    db.close()
+    assert simulation_id not in restarted._networks
+    assert restarted.get_network_series(simulation_id)["summary"]["samples"] == 7
+
+
+def test_long_calls_keep_a_running_summary(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    simulation_id = service.start_simulation(network_profile="wifi-congested")
+    for _ in range(150):
+        db = session_factory()
+        service._record_network({"simulation_id": simulation_id}, db)
+        db.commit()
+        db.close()
+
+    series = service.get_network_series(simulation_id)
+    latency = np.array(series["latency_ms"])
+    assert len(latency) == len(series["packet_loss"]) == 150
+    assert series["summary"]["avg_latency_ms"] == pytest.approx(latency.mean(), abs=0.01)
+    assert series["summary"]["avg_packet_loss"] == pytest.approx(np.mean(series["packet_loss"]), abs=1e-4)
+    assert series["summary"]["p95_latency_ms"] == pytest.approx(np.percentile(latency, 95), rel=0.04)
+    db = session_factory()
+    assert db.query(NetworkChunk).filter(NetworkChunk.simulation_id == simulation_id).count() == 3
+    db.close()
+
+
+def test_sketch_estimates_percentiles_within_a_bin():
+    values = np.random.default_rng(3).lognormal(4, 1, 5000)
+    counts = unpack_sketch(None)
+    for value in values:
+        sketch_add(counts, value)
+    counts = unpack_sketch(pack_sketch(counts))
+    for q in (50, 95, 99):
+        assert sketch_percentile(counts, q) == pytest.approx(np.percentile(values, q), rel=0.04)
+    assert sketch_percentile(unpack_sketch(None), 95) == 0
+
+
+def _series(simulation_id, profile, latency, jitter, loss):
+    counts = unpack_sketch(None)
+    for value in latency:
+        sketch_add(counts, value)
+    return NetworkSeries(simulation_id=simulation_id, profile=profile, samples=len(latency),
+                         avg_latency_ms=np.mean(latency), avg_jitter_ms=np.mean(jitter),
+                         avg_packet_loss=np.mean(loss), p95_latency_ms=sketch_percentile(counts, 95),
+                         latency_sketch=pack_sketch(counts))
+
+
+def test_quality_trends_weigh_every_sample(session_factory):
+    db = session_factory()
+    now = datetime.utcnow()
+    db.add_all([
+        CallSimulation(id="short", status="completed", start_time=now, quality_metrics={}),
+        CallSimulation(id="long", status="completed", start_time=now, quality_metrics={}),
+        CallSimulation(id="legacy", status="completed", start_time=now,
+                       quality_metrics={"network_latency": 50, "packet_loss": 0.01, "jitter": 5}),
+        _series("short", "fiber", [10], [1], [0]),
+        _series("long", "3g", [100, 100, 100], [9, 9, 9], [0.05, 0.05, 0.05]),
+    ])
+    db.commit()
+
+    (day,) = AnalyticsService(db).get_quality_trends(days=1)
+    assert day["avg_latency"] == pytest.approx((10 + 300 + 50) / 5)
+    assert day["avg_jitter"] == pytest.approx((1 + 27 + 5) / 5)
+    assert day["avg_packet_loss"] == pytest.approx((0.15 + 0.01) / 5)
+    assert day["p95_latency"] == pytest.approx(100, rel=0.04)
+    assert AnalyticsService(db).get_call_metrics("long")["network"]["avg_latency_ms"] == 100
+    db.close()
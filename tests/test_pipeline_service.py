@@ -0,0 +1,173 @@
+import threading
+import time
+from datetime import datetime, timedelta
+from app.models.models import CallSimulation, Message, PipelineTask
+from app.services.pipeline_service import PostTurnPipeline
+from app.services.simulation_service import SimulationService
+
+
+def test_stages_run_in_order_inline(session_factory):
+    pipeline = PostTurnPipeline(session_factory)
+    seen = []
+    pipeline.register_stage("first", lambda turn, db: seen.append(("first", turn["n"])))
+    pipeline.register_stage("second", lambda turn, db: seen.append(("second", turn["n"])))
+    pipeline.submit({"n": 1})
+    assert seen == [("first", 1), ("second", 1)]
+    metrics = pipeline.metrics()
+    assert metrics["ran_inline"] == 1
+    assert metrics["stages"]["first"]["count"] == 1
+
+
+def test_workers_process_off_the_caller_thread(session_factory):
+    pipeline = PostTurnPipeline(session_factory, workers=2)
+    threads = []
+    pipeline.register_stage("record", lambda turn, db: threads.append(threading.current_thread().name))
+    pipeline.start()
+    try:
+        for n in range(10):
+            pipeline.submit({"n": n})
+        pipeline.join()
+    finally:
+        pipeline.stop()
+    assert len(threads) == 10
+    assert all(name.startswith("post-turn-") for name in threads)
+    assert pipeline.metrics()["ran_inline"] == 0
+
+
+def test_full_queue_applies_backpressure(session_factory):
+    pipeline = PostTurnPipeline(session_factory, workers=1, max_queue=1, submit_timeout=0.01)
+    release = threading.Event()
+    pipeline.register_stage("slow", lambda turn, db: release.wait(5) if turn["block"] else None)
+    pipeline.start()
+    try:
+        pipeline.submit({"block": True})   # taken by the worker
+        pipeline.submit({"block": True})   # fills the queue
+        pipeline.submit({"block": False})  # no room left: runs in the caller
+        assert pipeline.metrics()["ran_inline"] == 1
+    finally:
+        release.set()
+        pipeline.stop()
+
+
+def test_turns_with_the_same_key_run_in_order(session_factory):
+    pipeline = PostTurnPipeline(session_factory, workers=4, key_field="simulation_id")
+    seen = {}
+    lock = threading.Lock()
+
+    def record(turn, db):
+        with lock:
+            active = seen.setdefault(turn["simulation_id"], {"running": 0, "order": []})
+            active["running"] += 1
+            overlapped = active["running"] > 1
+        time.sleep(0.002 * (turn["n"] % 3))
+        with lock:
+            active["order"].append((turn["n"], overlapped))
+            active["running"] -= 1
+
+    pipeline.register_stage("record", record)
+    pipeline.start()
+    try:
+        for n in range(20):
+            for call in ("a", "b", "c"):
+                pipeline.submit({"simulation_id": call, "n": n})
+        pipeline.join()
+    finally:
+        pipeline.stop()
+    for call in ("a", "b", "c"):
+        assert seen[call]["order"] == [(n, False) for n in range(20)]
+
+
+def test_failed_stage_is_retried_durably(session_factory):
+    pipeline = PostTurnPipeline(session_factory, retry_delay=10, max_attempts=3)
+    attempts = []
+
+    def flaky(turn, db):
+        attempts.append(turn["n"])
+        if len(attempts) < 3:
+            raise RuntimeError("enrichment backend down")
+
+    pipeline.register_stage("ok", lambda turn, db: None)
+    pipeline.register_stage("flaky", flaky)
+    pipeline.submit({"n": 7})
+
+    db = session_factory()
+    task = db.query(PipelineTask).one()
+    assert (task.stage, task.status, task.attempts) == ("flaky", "pending", 1)
+    assert "enrichment backend down" in task.last_error
+    db.close()
+
+    # not due yet
+    assert pipeline.retry_due() == 0
+    assert pipeline.retry_due(now=datetime.utcnow() + timedelta(seconds=11)) == 1
+    assert pipeline.retry_due(now=datetime.utcnow() + timedelta(seconds=60)) == 1
+    assert attempts == [7, 7, 7]
+    assert pipeline.metrics()["stages"]["ok"]["count"] == 1
+
+    db = session_factory()
+    assert db.query(PipelineTask).one().status == "done"
+    db.close()
+
+
+def test_stages_that_opt_out_of_retry_are_only_recorded(session_factory):
+    pipeline = PostTurnPipeline(session_factory, retry_delay=0)
+    pipeline.register_stage("ordered", lambda turn, db: 1 / 0, retry=False)
+    pipeline.submit({"n": 1})
+    assert pipeline.retry_due(now=datetime.utcnow() + timedelta(seconds=60)) == 0
+    db = session_factory()
+    task = db.query(PipelineTask).one()
+    assert (task.status, task.attempts) == ("failed", 1)
+    db.close()
+
+
+def test_keyed_turns_are_deferred_when_their_queue_stays_full(session_factory):
+    pipeline = PostTurnPipeline(session_factory, workers=1, max_queue=1, submit_timeout=0.01,
+                                retry_poll_interval=60, key_field="simulation_id")
+    release = threading.Event()
+    seen = []
+
+    def record(turn, db):
+        if turn["n"] == 0:
+            release.wait(5)
+        seen.append(turn["n"])
+
+    pipeline.register_stage("record", record)
+    pipeline.start()
+    try:
+        for n in range(3):
+            pipeline.submit({"simulation_id": "a", "n": n})
+        # a stuck worker does not hold the caller: the third turn waits in the database
+        assert pipeline.metrics()["deferred"] == 1 and pipeline.metrics()["ran_inline"] == 0
+        release.set()
+        pipeline.join()
+        assert pipeline.retry_due() == 1
+        pipeline.join()
+    finally:
+        release.set()
+        pipeline.stop()
+    assert seen == [0, 1, 2]
+    db = session_factory()
+    assert db.query(PipelineTask).one().status == "done"
+    db.close()
+
+
+def test_process_message_returns_before_enrichment(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    simulation_id = service.start_simulation()
+    release = threading.Event()
+    service.pipeline.register_stage("slow", lambda turn, db: release.wait(5))
+    service.pipeline.start()
+    try:
+        assert service.process_message(simulation_id, "This is terrible") == fake_llm.reply
+        # the reply is back while the slow stage is still holding the worker
+        assert not release.is_set()
+    finally:
+        release.set()
+        service.pipeline.stop()
+
+    details = service.get_simulation_details(simulation_id)
+    assert [m["sender"] for m in details["messages"]] == ["user", "agent"]
+    assert details["sentiment_score"] < 0
+    db = session_factory()
+    assert db.query(Message).count() == 2
+    assert db.query(CallSimulation).one().sentiment_score < 0
+    db.close()
@@ -0,0 +1,132 @@
+import json
+import time
+import pytest
+from app.core.state import InProcessStateBackend, create_state_backend
+from app.core.state_server import StateServer
+from app.services.acd_service import CallDistributor
+from app.services.presence_service import PresenceIndex
+
+
+def _wait_for(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_first_available_is_the_longest_free_agent_with_the_skill():
+    presence = PresenceIndex(InProcessStateBackend())
+    presence.update("ann", skills=["billing", "claims"])
+    presence.update("bob", skills=["billing"], capacity=2)
+    presence.update("cat", skills=["claims"])
+
+    assert presence.first_available("billing").agent_id == "ann"
+    assert presence.first_available("claims").agent_id == "ann"
+    presence.update("ann", state="wrap-up")
+    assert presence.first_available("billing").agent_id == "bob"
+    assert presence.is_staffed("billing")
+
+    # A load change that leaves bob free keeps his place; a full agent leaves the line
+    presence.update("ann", state="available")
+    presence.adjust_load("bob", 1)
+    assert [a.agent_id for a in presence.available("billing")] == ["bob", "ann"]
+    presence.adjust_load("bob", 1)
+    assert [a.agent_id for a in presence.available("billing")] == ["ann"]
+
+    presence.update("cat", state="offline")
+    presence.update("ann", state="offline")
+    assert presence.first_available("claims") is None
+    assert not presence.is_staffed("claims")
+    assert presence.is_staffed("billing")
+    with pytest.raises(ValueError):
+        presence.update("ann", state="lunch")
+
+
+def test_stale_and_duplicate_events_are_ignored():
+    backend = InProcessStateBackend()
+    presence = PresenceIndex(backend)
+    changes = []
+    presence.add_listener(lambda agent_id, agent: changes.append((agent_id, agent and agent.state)))
+    presence.update("ann", skills=["billing"])
+    presence.update("ann", state="busy")
+    stale = {"agent_id": "ann", "fields": {"state": ["available", 1], "capacity": [3, 1]}}
+
+    presence._on_message(json.dumps(stale))
+    assert presence.get("ann").state == "busy"
+    presence.remove("ann")
+    presence._on_message(json.dumps({"agent_id": "ann", "fields": {"state": ["available", 2]}}))
+
+    assert presence.get("ann") is None
+    assert changes == [("ann", "available"), ("ann", "busy"), ("ann", None)]
+
+
+def test_workers_changing_different_fields_do_not_undo_each_other():
+    backend = InProcessStateBackend()
+    events = []
+    backend.subscribe("presence", events.append)
+    first, second = PresenceIndex(backend), PresenceIndex(backend)
+    first.update("ag1", skills=["billing"], capacity=2)
+    second.reload()
+
+    # Neither has seen the other's change when making its own
+    first.update("ag1", state="offline")
+    second.adjust_load("ag1", 1)
+    assert second.get("ag1").state == "available"
+
+    for index in (first, second):
+        for event in reversed(events):
+            index._on_message(event)
+        assert (index.get("ag1").state, index.get("ag1").load) == ("offline", 1)
+    late = PresenceIndex(backend)
+    late.reload()
+    assert (late.get("ag1").state, late.get("ag1").load) == ("offline", 1)
+    assert late.first_available("billing") is None
+
+
+def test_changes_replicate_to_other_workers():
+    server = StateServer(("127.0.0.1", 0))
+    server.start_background()
+    backends = [create_state_backend(f"redis://127.0.0.1:{server.port}/0") for _ in range(3)]
+    try:
+        first, second = PresenceIndex(backends[0]), PresenceIndex(backends[1])
+        first.start()
+        second.start()
+        first.update("ann", skills={"billing": 3})
+        assert _wait_for(lambda: second.first_available("billing") is not None)
+        second.update("ann", state="busy")
+        assert _wait_for(lambda: first.get("ann").state == "busy")
+
+        # A worker that starts later loads the snapshot, then follows events
+        late = PresenceIndex(backends[2])
+        late.start()
+        assert _wait_for(lambda: late.get("ann") is not None)
+        assert late.get("ann").state == "busy"
+        first.update("bob", skills=["billing"])
+        assert _wait_for(lambda: late.first_available("billing") is not None)
+        assert late.first_available("billing").agent_id == "bob"
+        for index in (first, second, late):
+            index.stop()
+    finally:
+        for backend in backends:
+            backend.close()
+        server.shutdown()
+        server.server_close()
+
+
+def test_distributor_follows_presence():
+    presence = PresenceIndex(InProcessStateBackend())
+    acd = CallDistributor(presence=presence)
+    presence.update("ann", skills=["billing"], state="busy")
+    assert acd.enqueue("call-1", "billing") is None
+
+    presence.update("ann", state="available")
+    assert acd.assigned_agent("call-1") == "ann"
+    assert presence.get("ann").load == 1
+
+    # Another worker gave ann a call: she is full here too
+    presence.update("ann", capacity=2)
+    presence.adjust_load("ann", 1)
+    assert acd.enqueue("call-2", "billing") is None
+    acd.complete("call-1")
+    assert acd.assigned_agent("call-2") == "ann"
+    assert presence.get("ann").load == 2
@@ -0,0 +1,64 @@
+import json
+from datetime import datetime
+from sqlalchemy import create_engine, inspect, text
+from app.database import add_missing_columns
+from app.models.models import CallSimulation, Message
+from app.services.sentiment_backfill import SentimentBackfill
+from app.services.sentiment_service import SentimentService
+
+
+def _seed(session_factory, calls=3, turns=4):
+    db = session_factory()
+    for c in range(calls):
+        db.add(CallSimulation(id=f"call-{c}", start_time=datetime.utcnow(), quality_metrics={}))
+        for t in range(turns):
+            db.add(Message(simulation_id=f"call-{c}", sender="user",
+                           content="This is terrible" if c == 0 else f"Thanks, that was great help {t}"))
+            db.add(Message(simulation_id=f"call-{c}", sender="agent", content="I am sorry to hear that"))
+    db.commit()
+    db.close()
+
+
+def test_backfill_scores_messages_and_calls(session_factory, tmp_path):
+    _seed(session_factory)
+    progress = []
+    backfill = SentimentBackfill(session_factory, workers=2, chunk_size=5,
+                                 checkpoint_path=tmp_path / "checkpoint.json", progress=progress.append)
+    summary = backfill.run()
+    assert summary["messages"] == 24
+    assert summary["calls"] == 3
+    assert progress[-1]["scored"] == 24 and progress[-1]["total"] == 24
+    assert not (tmp_path / "checkpoint.json").exists()
+
+    service = SentimentService()
+    db = session_factory()
+    for message in db.query(Message).all():
+        assert message.sentiment_score == service.analyze_text(message.content)["compound"]
+    angry = db.query(CallSimulation).filter(CallSimulation.id == "call-0").first()
+    assert angry.sentiment_score == service.analyze_text("This is terrible")["compound"]
+    db.close()
+
+
+def test_backfill_resumes_after_checkpoint(session_factory, tmp_path):
+    _seed(session_factory)
+    checkpoint = tmp_path / "checkpoint.json"
+    checkpoint.write_text(json.dumps({"last_message_id": 10, "scored": 10}))
+    summary = SentimentBackfill(session_factory, workers=1, chunk_size=4,
+                                checkpoint_path=checkpoint, progress=lambda p: None).run()
+    assert summary["messages"] == 14
+    db = session_factory()
+    assert all(m.sentiment_score is None for m in db.query(Message).filter(Message.id <= 10))
+    assert all(m.sentiment_score is not None for m in db.query(Message).filter(Message.id > 10))
+    db.close()
+
+
+def test_add_missing_columns_upgrades_old_tables():
+    engine = create_engine("sqlite://")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE messages (id INTEGER PRIMARY KEY, simulation_id VARCHAR(36), "
+            "content VARCHAR(1000), sender VARCHAR(20), timestamp DATETIME)"
+        ))
+    add_missing_columns(engine)
+    columns = {column["name"] for column in inspect(engine).get_columns("messages")}
+    assert "sentiment_score" in columns
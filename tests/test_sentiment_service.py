@@ -1,4 +1,9 @@
+import pickle
+import random
+import time
+import nltk
 import pytest
+from app.services.sentiment_lexicon import compile_lexicon, load_lexicon
 from app.services.sentiment_service import SentimentService
 
 @pytest.fixture
@@ -47,4 +52,66 @@ def test_analyze_empty_conversation(sentiment_service):
     assert result["overall_sentiment"] == "neutral"
     assert result["sentiment_scores"]["neu"] == 1
     assert result["sentiment_scores"]["pos"] == 0
-    assert result["sentiment_scores"]["neg"] == 0 
\ No newline at end of file
+    assert result["sentiment_scores"]["neg"] == 0 
+
+def test_construction_never_touches_network(monkeypatch):
+    def no_download(*args, **kwargs):
+        raise AssertionError("SentimentService must not download resources")
+
+    monkeypatch.setattr(nltk, "download", no_download)
+    service = SentimentService()
+    assert service.analyzer is not None
+    assert service.analyze_text("Great job!")["compound"] > 0
+
+def test_analyzer_is_shared_between_instances():
+    assert SentimentService().analyzer is SentimentService().analyzer
+
+def test_compiled_lexicon_round_trip(tmp_path):
+    source = tmp_path / "lexicon.txt"
+    source.write_text("good\t1.9\t0.9\t[2, 2]\r\nbad\t-2.5\t0.5\t[-3, -2]\r\n", encoding="utf-8")
+    destination = tmp_path / "lexicon.pkl"
+    assert compile_lexicon(source, destination) == 2
+    with open(destination, "rb") as f:
+        assert pickle.load(f) == {"good": 1.9, "bad": -2.5}
+    assert load_lexicon()["good"] == 1.9
+
+BATCH_TEXTS = [
+    "I'm really happy with the excellent service!",
+    "This is terrible, I'm very disappointed.",
+    "The call is being transferred.",
+    "It was kind of good but the wait was NOT okay!!",
+    "Never so happy, honestly :)",
+    "I don't think this is the least bit helpful???",
+    "GREAT, another outage. Thanks a lot...",
+    "",
+    "ok",
+]
+
+def test_analyze_many_matches_analyze_text(sentiment_service):
+    expected = [sentiment_service.analyze_text(text) for text in BATCH_TEXTS]
+    assert sentiment_service.analyze_many(BATCH_TEXTS) == expected
+
+def test_analyze_many_empty_batch(sentiment_service):
+    assert sentiment_service.analyze_many([]) == []
+
+def test_analyze_many_throughput(sentiment_service):
+    rnd = random.Random(7)
+    fragments = [
+        "my internet has been down since Monday", "thanks so much for the quick help",
+        "I was charged twice on my last bill", "your service is terrible and I'm very frustrated",
+        "I'm not happy with how this was handled but thanks for trying", "everything works great now",
+    ]
+    endings = ["", "!", "?", "!!", "..."]
+    texts = [f"{rnd.choice(fragments)} {rnd.choice(endings)}" for _ in range(5000)]
+
+    started = time.perf_counter()
+    expected = [sentiment_service.analyze_text(text) for text in texts]
+    single_rate = len(texts) / (time.perf_counter() - started)
+
+    started = time.perf_counter()
+    result = sentiment_service.analyze_many(texts)
+    batch_rate = len(texts) / (time.perf_counter() - started)
+
+    assert result == expected
+    # the vectorized pass is several times faster than scoring one text at a time
+    assert batch_rate / single_rate > 3
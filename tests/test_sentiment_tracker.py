@@ -0,0 +1,104 @@
+import random
+import numpy as np
+import pytest
+from app.models.models import CallSimulation
+from app.services.sentiment_tracker import CallSentimentState, SentimentTracker
+from app.services.simulation_service import ESCALATION_TAG, SimulationService
+
+
+def test_running_statistics_match_a_full_recomputation():
+    rng = random.Random(7)
+    state = CallSentimentState(window=5, alpha=0.3)
+    scores = []
+    ema = None
+    for _ in range(40):
+        score = rng.uniform(-1, 1)
+        scores.append(score)
+        state.update(score)
+        ema = score if ema is None else 0.3 * score + 0.7 * ema
+        window = scores[-5:]
+        assert abs(state.ema - ema) < 1e-9
+        assert state.window_min == min(window)
+        if len(window) > 1:
+            x = np.arange(len(scores) - len(window), len(scores))
+            assert abs(state.slope - np.polyfit(x, window, 1)[0]) < 1e-6
+
+
+def test_state_round_trips_through_its_compact_form():
+    state = CallSentimentState(window=3)
+    for score in [0.5, -0.2, 0.1, -0.4]:
+        state.update(score)
+    stored = state.to_dict()
+    assert stored["n"] == 4 and len(stored["w"]) == 3
+    restored = CallSentimentState.from_dict(stored, window=3)
+    assert restored.turns == 4
+    assert restored.window_min == -0.4
+    assert abs(restored.slope - state.slope) < 1e-9
+    restored.update(0.0)
+    state.update(0.0)
+    assert abs(restored.ema - state.ema) < 1e-4
+
+
+def test_escalation_fires_once_and_rearms_after_recovery():
+    tracker = SentimentTracker(window=3, ema_threshold=-0.3, min_threshold=-0.9,
+                               slope_threshold=-10, min_turns=2)
+    events = []
+    stored = None
+    for score in [0.2, -0.8, -0.8, -0.8, 0.9, 0.9, -0.95]:
+        state, event = tracker.update("call", score, stored)
+        stored = state.to_dict()
+        if event:
+            events.append(event)
+    assert len(events) == 2
+    assert events[0]["reasons"] == ["ema"]
+    assert events[0]["turn"] == 2
+
+
+def test_a_rolled_back_turn_is_not_counted(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    simulation_id = service.start_simulation()
+    turn = {"simulation_id": simulation_id, "user_message": "This is awful, I am furious"}
+    db = session_factory()
+    service._update_sentiment(turn, db)
+    db.rollback()  # the stage's commit failed
+    db.close()
+
+    service.process_message(simulation_id, "Hi, I have a question about my bill")
+    db = session_factory()
+    sentiment = db.get(CallSimulation, simulation_id).quality_metrics["sentiment"]
+    assert sentiment["n"] == 1 and sentiment["w"][0] >= 0
+    db.close()
+
+
+def test_negative_caller_is_tagged_and_transfer_suggested(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    simulation_id = service.start_simulation()
+    said = ["Hi, I have a question about my bill", "This is terrible, I am angry and frustrated",
+            "Awful service, I hate this, worst company ever"]
+    for message in said:
+        service.process_message(simulation_id, message)
+
+    db = session_factory()
+    simulation = db.query(CallSimulation).filter(CallSimulation.id == simulation_id).first()
+    assert ESCALATION_TAG in simulation.tags
+    assert "supervisor" in simulation.notes[-1]["content"]
+    assert simulation.quality_metrics["sentiment"]["n"] == 3
+    # the same average over caller messages that the backfill stores
+    scores = [service.sentiment_service.analyze_text(message)["compound"] for message in said]
+    assert simulation.sentiment_score == pytest.approx(np.mean(scores)) and simulation.sentiment_score < 0
+    listed = {sim["id"]: sim for sim in service.get_all_simulations()}
+    assert listed[simulation_id]["sentiment_score"] == pytest.approx(simulation.sentiment_score)
+    assert SimulationService._priority_class(simulation) == "escalated"
+    db.close()
+
+
+def test_notes_and_tags_accumulate(session_factory, fake_llm):
+    service = SimulationService(fake_llm, session_factory=session_factory, idle_timeout=60)
+    simulation_id = service.start_simulation()
+    service.add_note(simulation_id, "first")
+    service.add_note(simulation_id, "second")
+    service.add_tag(simulation_id, "billing")
+    service.add_tag(simulation_id, "vip")
+    details = service.get_simulation_details(simulation_id)
+    assert [note["content"] for note in details["notes"]] == ["first", "second"]
+    assert details["tags"] == ["billing", "vip"]
@@ -0,0 +1,50 @@
+import numpy as np
+import pytest
+import soundfile as sf
+from app.services.audio_processing import WHISPER_SAMPLE_RATE
+from app.services.speech_benchmark import compare, load_clips, parse_config, run_benchmark, word_error_rate
+from tests.conftest import speechlike
+
+RATE = WHISPER_SAMPLE_RATE
+
+
+def test_word_error_rate():
+    assert word_error_rate("I'd like to pay my bill.", "i'd like to pay my bill") == 0.0
+    # one substitution, one deletion
+    assert word_error_rate("cancel my order today", "cancel the order") == pytest.approx(0.5)
+    # insertions can push the rate past 1
+    assert word_error_rate("yes", "yes yes yes") == 2.0
+    assert word_error_rate("", "") == 0.0
+
+
+def test_parse_config():
+    assert parse_config("base") == {"model_name": "base", "quantize": None, "threads": None}
+    assert parse_config("small:int8:t4") == {"model_name": "small", "quantize": "int8", "threads": 4}
+    with pytest.raises(ValueError):
+        parse_config("base:fp8")
+
+
+def test_benchmark_reports_rtf_and_wer(tmp_path):
+    for name, reference in [("a", "my card was declined"), ("b", "where is my refund")]:
+        sf.write(tmp_path / f"{name}.wav", speechlike(1.0, np.random.default_rng(0)), RATE)
+        (tmp_path / f"{name}.txt").write_text(reference)
+    sf.write(tmp_path / "no-reference.wav", np.zeros(RATE, dtype=np.float32), RATE)
+    clips = load_clips(tmp_path)
+    assert [name for name, _, _ in clips] == ["a.wav", "b.wav"]
+
+    answers = iter(["my card was declined"] + ["my card was declined", "where is my money"])
+    calls = []
+
+    def transcribe_batch(batch):
+        calls.append(len(batch))
+        return [next(answers)]
+
+    result = run_benchmark(transcribe_batch, clips)
+    # one warm-up call before timing
+    assert calls == [1, 1, 1]
+    assert result["audio_seconds"] == 2.0
+    assert result["wer"] == pytest.approx(1 / 8)
+    assert [clip["wer"] for clip in result["per_clip"]] == [0.0, 0.25]
+
+    table = compare([("base", result), ("base:int8", dict(result, rtf=result["rtf"] / 2, wer=0.25))])
+    assert "2.00x" in table and "+12.5%" in table
@@ -0,0 +1,108 @@
+import threading
+import numpy as np
+import pytest
+from app.services.speech_server import SpeechClient, SpeechModelServer, create_transcriber, parse_address
+from app.services.speech_service import SpeechService
+
+
+def _fake_batch(clips):
+    return [f"{len(clip)} samples" if isinstance(clip, np.ndarray) else "encoded" for clip in clips]
+
+
+def _server(**kwargs):
+    server = SpeechModelServer(("127.0.0.1", 0), transcribe_batch=_fake_batch, authkey=b"test", **kwargs)
+    server.start_background()
+    return server
+
+
+def test_constructing_speech_service_does_not_load_a_model():
+    service = SpeechService()
+    assert service.client is None
+    assert service.transcriber._model is None
+
+
+def test_requests_are_answered_through_the_server():
+    server = _server()
+    try:
+        client = SpeechClient(server.address, authkey=b"test")
+        assert client.transcribe(np.zeros(1600, dtype=np.float32)) == "1600 samples"
+        assert client.transcribe(b"RIFF....") == "encoded"
+    finally:
+        server.close()
+
+
+def test_concurrent_requests_are_batched():
+    server = _server(max_batch=8, batch_window=0.2)
+    client = SpeechClient(server.address, authkey=b"test")
+    results = {}
+
+    def request(n):
+        results[n] = client.transcribe(np.zeros(n, dtype=np.float32))
+
+    try:
+        threads = [threading.Thread(target=request, args=(n,)) for n in range(100, 106)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        server.close()
+    assert results == {n: f"{n} samples" for n in range(100, 106)}
+    assert max(server.batches) > 1
+    assert sum(server.batches) == 6
+
+
+def test_speech_service_uses_the_server_when_configured(monkeypatch):
+    monkeypatch.setenv("SPEECH_SERVER_AUTHKEY", "test")
+    server = _server()
+    try:
+        host, port = server.address
+        service = SpeechService(server_address=f"{host}:{port}")
+        assert service.transcriber is None
+        assert service.speech_to_text(b"not a wav file") == "encoded"
+    finally:
+        server.close()
+
+
+def test_an_authkey_is_required(monkeypatch):
+    monkeypatch.delenv("SPEECH_SERVER_AUTHKEY", raising=False)
+    with pytest.raises(ValueError):
+        SpeechModelServer(("127.0.0.1", 0), transcribe_batch=_fake_batch)
+    with pytest.raises(ValueError):
+        SpeechClient("127.0.0.1:6390")
+
+
+def test_parse_address():
+    assert parse_address("127.0.0.1:6390") == ("127.0.0.1", 6390)
+    assert parse_address("/tmp/speech.sock") == "/tmp/speech.sock"
+
+
+def test_each_worker_gets_its_own_model_instance():
+    created = []
+
+    class FakeTranscriber:
+        def __init__(self, workers):
+            self.workers = workers
+            created.append(self)
+
+        def transcribe_batch(self, clips):
+            return [f"worker {created.index(self)}" for _ in clips]
+
+    server = SpeechModelServer(("127.0.0.1", 0), authkey=b"test", workers=2, transcriber_factory=FakeTranscriber)
+    server.start_background()
+    try:
+        client = SpeechClient(server.address, authkey=b"test")
+        assert client.transcribe(np.zeros(160, dtype=np.float32)) in {"worker 0", "worker 1"}
+    finally:
+        server.close()
+    assert len(created) == 2 and all(t.workers == 2 for t in created)
+
+
+def test_transcriber_threads_are_shared_between_workers(monkeypatch):
+    monkeypatch.delenv("WHISPER_THREADS", raising=False)
+    monkeypatch.setenv("WHISPER_QUANTIZE", "int8")
+    monkeypatch.setattr("os.cpu_count", lambda: 8)
+    transcriber = create_transcriber(workers=4)
+    assert transcriber.threads == 2
+    assert transcriber.quantize == "int8"
+    assert transcriber._model is None
@@ -0,0 +1,155 @@
+import multiprocessing
+import os
+import time
+import pytest
+from app.core.rate_limit import RateLimiter
+from app.core.state import InProcessStateBackend, RedisStateBackend, create_state_backend
+from app.core.state_server import StateServer
+from app.services.lifecycle_service import CallLifecycleScheduler
+
+
+@pytest.fixture
+def state_server():
+    server = StateServer(("127.0.0.1", 0))
+    server.start_background()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture(params=["memory", "redis"])
+def backend(request):
+    if request.param == "memory":
+        yield InProcessStateBackend()
+        return
+    server = request.getfixturevalue("state_server")
+    backend = create_state_backend(f"redis://127.0.0.1:{server.port}/0")
+    yield backend
+    backend.close()
+
+
+def test_string_operations(backend):
+    assert backend.get("missing") is None
+    assert backend.set("key", "value")
+    assert backend.get("key") == "value"
+    assert not backend.set("key", "other", nx=True)
+    assert backend.get("key") == "value"
+    assert backend.delete("key") == 1
+    assert backend.delete("key") == 0
+
+
+def test_ttl_expires_keys(backend):
+    backend.set("short", "lived", ttl=0.05)
+    assert 0 < backend.ttl("short") <= 0.05
+    time.sleep(0.08)
+    assert backend.get("short") is None
+    assert backend.ttl("short") is None
+
+
+def test_counters(backend):
+    assert backend.incr("hits", ttl=10) == 1
+    assert backend.incr("hits", 4, ttl=10) == 5
+    assert backend.ttl("hits") is not None
+
+
+def test_hash_operations(backend):
+    backend.hset("h", "a", "1")
+    backend.hset("h", "b", "2")
+    assert backend.hget("h", "a") == "1"
+    assert backend.hgetall("h") == {"a": "1", "b": "2"}
+    assert backend.hdel("h", "a") == 1
+    assert backend.hdel("h", "a") == 0
+    assert backend.hgetall("h") == {"b": "2"}
+
+
+def test_publish_reaches_subscribers(backend):
+    received, connected = [], []
+    subscription = backend.subscribe("news", received.append, on_connect=lambda: connected.append(True))
+    deadline = time.monotonic() + 2
+    while not connected and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+    assert backend.publish("news", "first") == 1
+    assert backend.publish("other", "ignored") == 0
+    while len(received) < 1 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    subscription.close()
+    time.sleep(0.05)
+    backend.publish("news", "after close")
+    time.sleep(0.05)
+    assert received == ["first"]
+
+
+def test_rate_limiter_rejects_over_limit(backend):
+    now = [1000.0]
+    limiter = RateLimiter(backend, limit=3, window=60, clock=lambda: now[0])
+    assert [limiter.hit("call")[0] for _ in range(4)] == [True, True, True, False]
+    assert limiter.hit("call") == (False, 20)
+    assert limiter.hit("other")[0]
+    now[0] += 20
+    assert limiter.hit("call")[0]
+
+
+def test_only_one_worker_reaps_shared_call(backend):
+    clock = lambda: 1000.0
+    reaped = []
+    workers = [
+        CallLifecycleScheduler(lambda sim_id, *_: reaped.append(sim_id), idle_timeout=60,
+                               clock=clock, state_backend=backend)
+        for _ in range(3)
+    ]
+    for worker in workers:
+        worker.touch("shared")
+    # another worker saw later activity, so the first deadline is stale
+    workers[2].touch("shared", engaged=True, timestamp=1030.0)
+    assert workers[0].run_pending(now=1065.0) == []
+    for worker in workers:
+        worker.run_pending(now=1095.0)
+    assert reaped == ["shared"]
+
+
+def _worker(port, requests, results):
+    backend = RedisStateBackend("127.0.0.1", port)
+    limiter = RateLimiter(backend, limit=50, window=3600, prefix="test")
+    allowed = 0
+    for i in range(requests):
+        if limiter.hit("global")[0]:
+            allowed += 1
+        if backend.get(f"cache:{i}") is None:
+            backend.set(f"cache:{i}", "reply", ttl=60)
+        # CPU work between the backend round trips, which unlike a sleep
+        # only overlaps across processes when there are cores to run them
+        sum(n * n for n in range(30000))
+    backend.close()
+    results.put(allowed)
+
+
+def _run_workers(port, workers, requests):
+    ctx = multiprocessing.get_context("fork")
+    results = ctx.Queue()
+    processes = [ctx.Process(target=_worker, args=(port, requests, results)) for _ in range(workers)]
+    started = time.perf_counter()
+    for process in processes:
+        process.start()
+    allowed = [results.get(timeout=30) for _ in processes]
+    for process in processes:
+        process.join()
+    return sum(allowed), time.perf_counter() - started
+
+
+def test_multi_worker_consistency_and_scaling(state_server):
+    single_allowed, single_elapsed = _run_workers(state_server.port, 1, 25)
+    assert single_allowed == 25
+
+    backend = RedisStateBackend("127.0.0.1", state_server.port)
+    backend.execute("FLUSHALL")
+    backend.close()
+
+    allowed, elapsed = _run_workers(state_server.port, 4, 25)
+    # the limit is enforced across processes, not per process
+    assert allowed == 50
+    # and the shared backend does not serialize the workers: throughput
+    # grows with the cores available to them
+    cores = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count() or 1
+    scaling = (100 / elapsed) / (25 / single_elapsed)
+    assert scaling > 0.7 * min(4, cores)
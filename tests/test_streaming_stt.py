@@ -0,0 +1,110 @@
+import numpy as np
+from app.services.audio_processing import WHISPER_SAMPLE_RATE
+from app.services.speech_service import SpeechService
+from app.services.streaming_stt import RingBuffer, StreamingTranscriber
+from tests.conftest import RecordingTranscriber, silence, speechlike
+
+RATE = WHISPER_SAMPLE_RATE
+
+
+def test_ring_buffer_wraps_and_reads_by_absolute_index():
+    buffer = RingBuffer(10)
+    buffer.write(np.arange(7, dtype=np.float32))
+    buffer.write(np.arange(7, 13, dtype=np.float32))
+    assert buffer.written == 13 and buffer.oldest == 3
+    assert buffer.read(5, 12).tolist() == [5, 6, 7, 8, 9, 10, 11]
+    assert buffer.read(0, 5).tolist() == [3, 4]
+    buffer.write(np.arange(100, 125, dtype=np.float32))
+    assert buffer.read(0, buffer.written).tolist() == list(range(115, 125))
+
+
+class CountingTranscriber:
+    def __init__(self):
+        self.calls = []
+
+    def __call__(self, samples):
+        self.calls.append(len(samples))
+        return f"{round(len(samples) / RATE, 1)}s"
+
+
+def _stream(transcriber, audio, chunk_ms=20):
+    step = int(RATE * chunk_ms / 1000)
+    events = []
+    for i in range(0, len(audio), step):
+        events += transcriber.feed(audio[i:i + step])
+    return events + transcriber.flush()
+
+
+def test_partials_while_speaking_and_final_at_end_of_speech():
+    rng = np.random.default_rng(0)
+    audio = np.concatenate([silence(1.0, rng), speechlike(2.5, rng), silence(1.0, rng),
+                            speechlike(1.0, rng), silence(1.0, rng)])
+    model = CountingTranscriber()
+    events = _stream(StreamingTranscriber(model, partial_interval=1.0, end_silence_ms=600), audio)
+    kinds = [event["type"] for event in events]
+    assert kinds.count("final") == 2
+    assert kinds.index("partial") < kinds.index("final")
+    first_final = events[kinds.index("final")]
+    assert abs(first_final["start"] - 1.0) < 0.15
+    assert abs(first_final["end"] - 3.5) < 0.15
+    # every model call sees one utterance, never the whole stream
+    assert max(model.calls) < 3.0 * RATE
+
+
+def test_final_reuses_partial_when_nothing_new_was_said():
+    rng = np.random.default_rng(1)
+    model = CountingTranscriber()
+    transcriber = StreamingTranscriber(model, partial_interval=0.5, end_silence_ms=600)
+    events = transcriber.feed(np.concatenate([silence(0.5, rng), speechlike(1.0, rng)]))
+    assert [event["type"] for event in events] == ["partial"]
+    calls = len(model.calls)
+    events = transcriber.feed(silence(1.0, rng))
+    assert [event["type"] for event in events] == ["final"]
+    assert len(model.calls) == calls
+
+
+def test_long_speech_is_cut_at_max_utterance():
+    rng = np.random.default_rng(2)
+    events = _stream(StreamingTranscriber(CountingTranscriber(), max_utterance_seconds=2),
+                     speechlike(5.0, rng))
+    assert [event["type"] for event in events if event["type"] == "final"] == ["final"] * 3
+
+
+def test_loud_background_noise_from_the_start_is_learned():
+    rng = np.random.default_rng(6)
+    # A noise bed around -34 dBFS, well above the -50 dBFS starting threshold
+    bed = lambda seconds: (0.02 * rng.standard_normal(int(seconds * RATE))).astype(np.float32)
+    audio = np.concatenate([bed(3.0), speechlike(2.0, rng) + bed(2.0), bed(2.0),
+                            speechlike(1.0, rng) + bed(1.0), bed(2.0)])
+    transcriber = StreamingTranscriber(CountingTranscriber())
+    events = _stream(transcriber, audio)
+    finals = [event for event in events if event["type"] == "final"]
+
+    assert transcriber.noise_floor > -36
+    # Until the floor is learned the noise may briefly be heard as speech;
+    # after that each utterance ends at its end of speech
+    speech = [event for event in finals if event["end"] > 1.5]
+    assert len(speech) == 2
+    assert 2.5 < speech[0]["start"] < 3.1 and 4.9 < speech[0]["end"] < 5.3
+    assert 6.5 < speech[1]["start"] < 7.1 and 7.9 < speech[1]["end"] < 8.3
+
+
+def test_streamed_utterances_count_towards_the_calls_vad_stats():
+    rng = np.random.default_rng(5)
+    audio = np.concatenate([silence(1.0, rng), speechlike(2.0, rng), silence(1.0, rng),
+                            speechlike(1.0, rng), silence(1.0, rng)])
+    service = SpeechService()
+    service.transcriber = RecordingTranscriber()
+    call = {"id": None}
+    transcriber = service.streaming_transcriber(lambda: call["id"])
+    # The call id is only known once the stream has started
+    call["id"] = "call-1"
+    _stream(transcriber, audio)
+
+    stats = service.get_vad_stats("call-1")
+    assert stats["utterances"] == 2
+    assert 2.9 < stats["voiced_seconds"] < 4.0
+    assert stats["voiced_seconds"] < stats["input_seconds"] <= 6.0
+    service.forget_call("call-1")
+    assert service.get_vad_stats("call-1") is None
+    assert service.get_vad_stats()["utterances"] == 2
@@ -0,0 +1,86 @@
+import time
+from app.services.streaming_tts import SentenceChunker, StreamingSynthesizer, split_sentences
+
+REPLY = ("Thanks for calling about your bill. I can see a late fee from March. "
+         "I have removed it as a one-time courtesy. Is there anything else I can help with today?")
+
+
+def test_split_sentences_keeps_abbreviations_and_merges_short_ones():
+    assert split_sentences("Dr. Smith will call you back tomorrow. OK. Thanks for waiting!") == [
+        "Dr. Smith will call you back tomorrow.",
+        "OK. Thanks for waiting!"
+    ]
+    assert split_sentences(REPLY)[0] == "Thanks for calling about your bill."
+    assert split_sentences("I'm afraid the answer is no. Please hold for a moment.") == [
+        "I'm afraid the answer is no.", "Please hold for a moment."
+    ]
+    assert len(split_sentences("Please quote ticket No. 5512 when you call back.")) == 1
+    assert len(split_sentences(REPLY)) == 4
+
+
+def test_chunker_emits_sentences_as_tokens_arrive():
+    chunker = SentenceChunker()
+    emitted = []
+    for token in REPLY.replace(" ", "  ").split(" "):
+        emitted += chunker.feed(token + " ")
+    emitted += chunker.flush()
+    assert [" ".join(s.split()) for s in emitted] == split_sentences(REPLY)
+
+
+class SlowTTS:
+    """Synthesis time grows with text length, like a real TTS backend"""
+
+    def __init__(self):
+        self.started = []
+
+    def text_to_speech(self, text, lang="en", voice="com", slow=False):
+        self.started.append(text)
+        time.sleep(0.002 * len(text))
+        return text.encode(), "audio/mpeg"
+
+
+def test_audio_is_yielded_in_order_and_first_chunk_arrives_early():
+    tts = SlowTTS()
+    streamer = StreamingSynthesizer(tts, workers=3)
+    started = time.perf_counter()
+    chunks = streamer.stream(REPLY)
+    first = next(chunks)
+    time_to_first = time.perf_counter() - started
+    rest = list(chunks)
+    total = time.perf_counter() - started
+    streamer.shutdown()
+
+    assert [first] + rest == [s.encode() for s in split_sentences(REPLY)]
+    whole_reply = 0.002 * len(REPLY)
+    print(f"\ntime to first audio {time_to_first * 1000:.0f} ms, total {total * 1000:.0f} ms, "
+          f"whole-reply synthesis {whole_reply * 1000:.0f} ms")
+    assert time_to_first < whole_reply / 2
+    # sentences overlap on the pool instead of running back to back
+    assert total < whole_reply
+
+
+def test_audio_does_not_wait_for_the_next_sentence():
+    def slow_source():
+        yield "Thanks for calling about your bill."
+        time.sleep(0.5)
+        yield "I can see a late fee from March."
+
+    streamer = StreamingSynthesizer(SlowTTS(), workers=2)
+    started = time.perf_counter()
+    chunks = streamer.stream_sentences(slow_source())
+    assert next(chunks) == b"Thanks for calling about your bill."
+    time_to_first = time.perf_counter() - started
+    assert list(chunks) == [b"I can see a late fee from March."]
+    streamer.shutdown()
+    assert time_to_first < 0.3
+
+
+def test_abandoned_stream_stops_synthesizing():
+    tts = SlowTTS()
+    streamer = StreamingSynthesizer(tts, workers=1, lookahead=1)
+    chunks = streamer.stream(" ".join([REPLY] * 5))
+    next(chunks)
+    chunks.close()
+    time.sleep(0.3)
+    streamer.shutdown()
+    assert len(tts.started) <= 3
@@ -0,0 +1,88 @@
+import threading
+import time
+import pytest
+from app.services.speech_service import SpeechService, validate_tts_request
+from app.services.tts_cache import TTSCache, prewarm, tts_cache_key
+
+
+def test_key_covers_every_synthesis_setting():
+    base = tts_cache_key("Hello", "en", "com", False)
+    assert base == tts_cache_key(" Hello ", "en", "com", False)
+    assert len({base, tts_cache_key("Hello", "fr", "com", False),
+                tts_cache_key("Hello", "en", "co.uk", False),
+                tts_cache_key("Hello", "en", "com", True)}) == 4
+
+
+def test_memory_tier_evicts_least_recently_used(tmp_path):
+    cache = TTSCache(tmp_path, memory_max_bytes=20)
+    cache.put("a" * 64, b"x" * 8)
+    cache.put("b" * 64, b"y" * 8)
+    cache.get("a" * 64)
+    cache.put("c" * 64, b"z" * 8)
+    assert list(cache._memory) == ["a" * 64, "c" * 64]
+    # evicted from memory, still on disk
+    assert cache.get("b" * 64) == b"y" * 8
+    assert cache.stats["disk_hits"] == 1
+
+
+def test_disk_tier_survives_restart_and_respects_cap(tmp_path):
+    cache = TTSCache(tmp_path, disk_max_bytes=100)
+    for i in range(5):
+        cache.put(f"{i:064d}", bytes(30))
+        time.sleep(0.01)
+    assert cache._disk_bytes <= 100
+    fresh = TTSCache(tmp_path, disk_max_bytes=100)
+    assert fresh.get(f"{4:064d}") == bytes(30)
+    assert fresh.get(f"{0:064d}") is None
+
+
+def test_concurrent_misses_synthesize_once(tmp_path):
+    cache = TTSCache(tmp_path)
+    calls = []
+
+    def synthesize():
+        calls.append(1)
+        time.sleep(0.05)
+        return b"audio"
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get_or_create("k" * 64, synthesize)))
+               for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert results == [b"audio"] * 5
+    assert len(calls) == 1
+
+
+def test_repeated_phrases_are_served_from_cache(tmp_path, monkeypatch):
+    synthesized = []
+
+    def fake_synthesize(text, lang, voice, slow):
+        synthesized.append(text)
+        time.sleep(0.05)
+        return f"mp3:{text}".encode()
+
+    monkeypatch.setattr(SpeechService, "_synthesize", staticmethod(fake_synthesize))
+    service = SpeechService(tts_cache=TTSCache(tmp_path))
+    assert prewarm(service, ["Please speak after the tone."]) == 1
+
+    started = time.perf_counter()
+    audio, content_type = service.text_to_speech("Please speak after the tone.")
+    assert time.perf_counter() - started < 0.01
+    assert audio == b"mp3:Please speak after the tone." and content_type == "audio/mpeg"
+    service.text_to_speech("Please speak after the tone.", slow=True)
+    assert synthesized == ["Please speak after the tone."] * 2
+
+
+def test_only_known_voices_and_languages_are_synthesized(tmp_path, monkeypatch):
+    monkeypatch.setattr(SpeechService, "_synthesize", staticmethod(lambda text, lang, voice, slow: b"mp3"))
+    service = SpeechService(tts_cache=TTSCache(tmp_path))
+    assert service.text_to_speech("Hello", "en", "co.uk")[0] == b"mp3"
+    # voice is the Google host gTTS calls, so anything else must never reach it
+    assert service.text_to_speech("Hello", "en", "attacker.example")[0] == b""
+    for text, lang, voice in [("", "en", "com"), ("x" * 5000, "en", "com"), ("Hello", "xx", "com"),
+                              ("Hello", "en", "com/../evil")]:
+        with pytest.raises(ValueError):
+            validate_tts_request(text, lang, voice)
@@ -0,0 +1,80 @@
+import json
+import time
+import warnings
+import numpy as np
+import pytest
+from app.services.audio_processing import (
+    MULAW_TABLE, TELEPHONY_SAMPLE_RATE, Upsampler2x, mulaw_decode, mulaw_encode
+)
+from app.services.streaming_stt import StreamingTranscriber
+from app.services.twilio_media import MediaStreamSession
+from tests.conftest import speechlike
+from tests.twilio_standin import TwilioStandIn, load_stream, media_stream, save_stream
+
+
+def test_mulaw_table_matches_the_reference_codec():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        audioop = pytest.importorskip("audioop")
+    reference = np.frombuffer(audioop.ulaw2lin(bytes(range(256)), 2), dtype="<i2") / 32768
+    np.testing.assert_array_equal(MULAW_TABLE, reference.astype(np.float32))
+    # and the encoder round-trips within mu-law's step size
+    samples = np.linspace(-0.9, 0.9, 1001, dtype=np.float32)
+    assert np.max(np.abs(mulaw_decode(mulaw_encode(samples)) - samples) / np.maximum(np.abs(samples), 0.01)) < 0.07
+
+
+def test_upsampling_frame_by_frame_has_no_seams_and_keeps_the_tone():
+    t = np.arange(TELEPHONY_SAMPLE_RATE) / TELEPHONY_SAMPLE_RATE
+    tone = np.sin(2 * np.pi * 440 * t).astype(np.float32)
+    upsampler = Upsampler2x()
+    framed = np.concatenate([upsampler.process(tone[i:i + 160]) for i in range(0, len(tone), 160)])
+    whole = Upsampler2x().process(tone)
+    np.testing.assert_allclose(framed, whole, atol=1e-6)
+
+    lag = upsampler.taps  # output samples
+    expected = np.sin(2 * np.pi * 440 * np.arange(len(framed) - lag) / (2 * TELEPHONY_SAMPLE_RATE))
+    assert np.sqrt(np.mean((framed[lag + 100:] - expected[100:]) ** 2)) < 1e-3
+
+
+def test_decoding_a_minute_of_frames_is_fast():
+    payloads = [bytes(np.random.default_rng(0).integers(0, 256, 160, dtype=np.uint8)) for _ in range(3000)]
+    upsampler = Upsampler2x()
+    started = time.perf_counter()
+    for payload in payloads:
+        upsampler.process(mulaw_decode(payload))
+    elapsed = time.perf_counter() - started
+    print(f"\n60 s of 20 ms frames decoded and upsampled in {elapsed * 1000:.0f} ms")
+    assert elapsed < 1.0
+
+
+def test_replayed_stream_is_transcribed(tmp_path):
+    rng = np.random.default_rng(2)
+    audio = np.concatenate([
+        speechlike(0.02, rng, TELEPHONY_SAMPLE_RATE) * 0.005, np.zeros(4000, dtype=np.float32),
+        speechlike(1.2, rng, TELEPHONY_SAMPLE_RATE), np.zeros(8000, dtype=np.float32),
+        speechlike(0.8, rng, TELEPHONY_SAMPLE_RATE)
+    ])
+    recorded = media_stream(audio, parameters={"simulation_id": "sim-1"})
+    # Outbound audio (our own speech) is interleaved but must be ignored
+    recorded[5:5] = media_stream(speechlike(0.5, rng, TELEPHONY_SAMPLE_RATE), track="outbound")[2:-1]
+    save_stream(recorded, tmp_path / "call.jsonl")
+
+    heard = []
+
+    def transcribe(samples):
+        heard.append(len(samples))
+        return f"{len(samples) / 16000:.1f} seconds"
+
+    session = MediaStreamSession(StreamingTranscriber(transcribe, partial_interval=10))
+    events = []
+    TwilioStandIn(lambda text: events.extend(session.handle(json.loads(text)))).replay(
+        load_stream(tmp_path / "call.jsonl")
+    )
+
+    assert session.call_sid == "CA0001" and session.parameters == {"simulation_id": "sim-1"}
+    assert session.stopped and session.frames == len(audio) // 160
+    finals = [event for event in events if event["type"] == "final"]
+    assert len(finals) == 2
+    # utterances come out at 16 kHz, about as long as what was said
+    assert abs(finals[0]["end"] - finals[0]["start"] - 1.2) < 0.3
+    assert abs(finals[1]["end"] - finals[1]["start"] - 0.8) < 0.3
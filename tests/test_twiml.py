@@ -0,0 +1,89 @@
+import timeit
+import xml.etree.ElementTree as ET
+from urllib.parse import parse_qs, urlparse
+from twilio.twiml.voice_response import Connect, Gather, VoiceResponse
+from app.services import twiml
+from app.services.tts_cache import verify_tts_signature
+from app.services.twilio_service import GATHER_PROMPT, RETRY_PROMPT, TwilioService
+
+MESSAGES = [
+    "How can I help you today?",
+    'Your balance is $42 & "overdue" <see email>; it\'s due 5/3.',
+    "Line one\nline two\ttabbed",
+    "Ünïcödé – “smart quotes” ✓",
+]
+
+
+def _builder_response(message):
+    response = VoiceResponse()
+    if message:
+        response.say(message)
+    gather = Gather(input="speech", action="/api/voice/process-speech", method="POST",
+                    language="en-US", speechTimeout="auto")
+    gather.say(GATHER_PROMPT)
+    response.append(gather)
+    response.say(RETRY_PROMPT)
+    response.redirect("/api/voice/handle-call")
+    return str(response)
+
+
+def test_output_matches_the_builder():
+    service = TwilioService(None, None, "+15550100", tts_playback=False)
+    for message in MESSAGES + [None]:
+        assert service.create_twiml_response(message) == _builder_response(message)
+
+    for message in MESSAGES:
+        hold = VoiceResponse()
+        hold.say(message)
+        hold.redirect("/api/voice/reply?turn=2&attempt=1", method="POST")
+        assert service.create_hold_twiml("/api/voice/reply?turn=2&attempt=1", message) == str(hold)
+
+    hangup = VoiceResponse()
+    hangup.say("Goodbye.")
+    hangup.hangup()
+    assert service.create_hangup_twiml("Goodbye.") == str(hangup)
+
+    transfer = VoiceResponse()
+    transfer.say("Transferring you now.")
+    transfer.dial("+15550123", caller_id="+15550100", timeout=20)
+    assert service.create_dial_twiml("+15550123", "Transferring you now.", timeout=20) == str(transfer)
+
+    streamed = VoiceResponse()
+    connect = Connect()
+    stream = connect.stream(url="wss://example.com/ws/twilio/media")
+    stream.parameter(name="simulation_id", value='a&"b"')
+    streamed.append(connect)
+    assert service.create_stream_twiml(
+        "wss://example.com/ws/twilio/media", {"simulation_id": 'a&"b"'}
+    ) == str(streamed)
+
+
+def test_injected_text_cannot_break_the_document():
+    hostile = '</Say><Dial>+19005550000</Dial><Say a="\x00\x1b'
+    document = ET.fromstring(TwilioService(None, None, None, tts_playback=False).create_twiml_response(hostile))
+    assert [verb.tag for verb in document] == ["Say", "Gather", "Say", "Redirect"]
+    assert document[0].text == '</Say><Dial>+19005550000</Dial><Say a="'
+    assert twiml.TwiMLTemplate('<Play loop="{n}">{url}</Play>').render(n='1" x="2', url="a&b") == \
+        '<Play loop="1&quot; x=&quot;2">a&amp;b</Play>'
+
+
+def test_cached_tts_playback():
+    service = TwilioService(None, None, None, tts_playback=True)
+    document = ET.fromstring(service.create_twiml_response("Your refund is on its way & should arrive soon."))
+    assert [verb.tag for verb in document] == ["Play", "Gather", "Play", "Redirect"]
+    url = urlparse(document[0].text)
+    assert url.path == "/api/speech/tts"
+    query = parse_qs(url.query)
+    assert query["text"] == ["Your refund is on its way & should arrive soon."]
+    assert verify_tts_signature(query["sig"][0], query["text"][0], query["lang"][0], query["voice"][0])
+    assert not verify_tts_signature(query["sig"][0], "Something else", query["lang"][0], query["voice"][0])
+    assert document[1][0].tag == "Play"
+
+
+def test_templates_are_faster_than_the_builder():
+    service = TwilioService(None, None, None, tts_playback=False)
+    message = MESSAGES[1]
+    builder = min(timeit.repeat(lambda: _builder_response(message), number=2000, repeat=3))
+    templates = min(timeit.repeat(lambda: service.create_twiml_response(message), number=2000, repeat=3))
+    print(f"\nbuilder {builder / 2000 * 1e6:.1f} us, templates {templates / 2000 * 1e6:.1f} us per response")
+    assert templates * 3 < builder
@@ -0,0 +1,66 @@
+import time
+import numpy as np
+from app.services.audio_processing import WHISPER_SAMPLE_RATE, VoiceActivityDetector
+from app.services.speech_service import SpeechService
+from tests.conftest import RecordingTranscriber, silence, speechlike, wav_bytes
+
+RATE = WHISPER_SAMPLE_RATE
+
+
+def _clip(rng):
+    # 1 s lead-in, 1 s speech, 0.1 s breath, 0.5 s speech, 2 s pause, 1 s speech, 1.5 s tail
+    return np.concatenate([
+        silence(1.0, rng), speechlike(1.0, rng), silence(0.1, rng), speechlike(0.5, rng),
+        silence(2.0, rng), speechlike(1.0, rng), silence(1.5, rng)
+    ])
+
+
+def test_segments_cover_speech_and_drop_silence():
+    rng = np.random.default_rng(0)
+    segments = VoiceActivityDetector().segments(_clip(rng))
+    assert len(segments) == 2  # the short breath is bridged, the long pause splits
+    (s1, e1), (s2, e2) = segments
+    assert abs(s1 / RATE - 1.0) < 0.15 and abs(e1 / RATE - 2.6) < 0.15
+    assert abs(s2 / RATE - 4.6) < 0.15 and abs(e2 / RATE - 5.6) < 0.15
+
+
+def test_pure_silence_has_no_segments_and_short_blips_are_dropped():
+    rng = np.random.default_rng(1)
+    assert VoiceActivityDetector().segments(silence(2.0, rng)) == []
+    blip = np.concatenate([silence(1.0, rng), speechlike(0.03, rng), silence(1.0, rng)])
+    assert VoiceActivityDetector(padding_ms=0).segments(blip) == []
+
+
+def test_all_speech_is_kept():
+    rng = np.random.default_rng(2)
+    speech = speechlike(3.0, rng)
+    assert VoiceActivityDetector().segments(speech) == [(0, len(speech))]
+
+
+def test_speech_service_only_transcribes_voiced_audio():
+    rng = np.random.default_rng(3)
+    clip = _clip(rng)
+    service = SpeechService()
+    service.transcriber = RecordingTranscriber()
+    assert service.speech_to_text(wav_bytes(clip, RATE), call_id="call-1") == "hello"
+    sent = service.transcriber.clips[0]
+    # model input, and so its CPU time, shrinks with the silence removed
+    assert len(sent) / RATE < 3.5
+
+    assert service.speech_to_text(wav_bytes(silence(1.0, rng), RATE), call_id="call-1") == ""
+    assert len(service.transcriber.clips) == 1
+    stats = service.get_vad_stats("call-1")
+    assert stats["utterances"] == 2
+    assert abs(stats["input_seconds"] - 8.1) < 0.01
+    assert stats["trimmed_seconds"] > 5.0
+
+
+def test_vad_cost_per_second_of_audio():
+    rng = np.random.default_rng(4)
+    clip = np.concatenate([_clip(rng)] * 10)
+    vad = VoiceActivityDetector()
+    started = time.perf_counter()
+    vad.trim(clip)
+    per_second = (time.perf_counter() - started) / (len(clip) / RATE)
+    print(f"\nVAD per second of audio: {per_second * 1000:.3f} ms")
+    assert per_second < 0.005
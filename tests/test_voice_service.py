@@ -0,0 +1,224 @@
+import base64
+import json
+import time
+import httpx
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+from twilio.request_validator import RequestValidator
+from app.core.admission import AdmissionController
+from app.core.state import InProcessStateBackend
+from app.models.models import CallSimulation
+from app.services.audio_processing import TELEPHONY_SAMPLE_RATE
+from app.services.simulation_service import SimulationService
+from app.services.streaming_stt import StreamingTranscriber
+from app.services.twilio_service import GATHER_PROMPT, TwilioService
+from app.services.voice_service import BUSY_PROMPT, GREETING, VoiceCallService
+from app.services.voice_turn_service import APOLOGY_PROMPT, HOLD_PROMPT
+from tests.conftest import silence, speechlike, wav_bytes
+from tests.twilio_standin import TwilioVoiceStandIn, media_stream
+
+AUTH_TOKEN = "test-auth-token"
+BASE_URL = "https://calls.example.com"
+
+
+class SlowLLM:
+    def __init__(self, delay=0.0, reply="Your balance is forty dollars."):
+        self.delay = delay
+        self.reply = reply
+
+    def get_response(self, message):
+        time.sleep(self.delay)
+        return self.reply
+
+
+class SpeechStandIn:
+    """Hears every utterance as the same words and speaks each reply as half a second of tone"""
+
+    def __init__(self, words):
+        self.words = words
+        self.spoken = []
+
+    def streaming_transcriber(self, call_id, **kwargs):
+        return StreamingTranscriber(lambda samples: self.words, partial_interval=10)
+
+    def text_to_speech(self, text, **kwargs):
+        self.spoken.append(text)
+        t = np.arange(8000) / 16000
+        return wav_bytes((0.3 * np.sin(2 * np.pi * 440 * t)).astype(np.float32), 16000), "audio/wav"
+
+
+def _voice(session_factory, llm, **kwargs):
+    service = SimulationService(llm, session_factory=session_factory, idle_timeout=60)
+    twilio = TwilioService(None, AUTH_TOKEN, None, public_base_url=BASE_URL)
+    options = dict(fast_reply_seconds=0.2, poll_seconds=0.2, max_polls=3, poll_interval=0.02)
+    options.update(kwargs)
+    return service, VoiceCallService(service, twilio, InProcessStateBackend(), **options)
+
+
+@pytest.fixture
+def serve(app_main, monkeypatch):
+    """serve(voice) is a TestClient for app.main with its webhooks answered by that VoiceCallService"""
+    def serve(voice):
+        monkeypatch.setattr(app_main, "voice_calls", voice)
+        monkeypatch.setattr(app_main, "twilio_service", voice.twilio_service)
+        return TestClient(app_main.app)
+
+    return serve
+
+
+def _call(client, call_sid, auth_token=AUTH_TOKEN, base_url=BASE_URL):
+    return TwilioVoiceStandIn(client.post, auth_token, base_url, call_sid=call_sid)
+
+
+def test_fast_reply_is_spoken_in_the_same_response(session_factory, serve):
+    service, voice = _voice(session_factory, SlowLLM())
+    call = _call(serve(voice), "CA100")
+    call.dial()
+    assert call.heard == [GREETING, GATHER_PROMPT]
+
+    assert call.say("What is my balance?") == ["Your balance is forty dollars.", GATHER_PROMPT]
+    assert len(call.response_times) == 2
+
+    db = session_factory()
+    simulation = db.query(CallSimulation).filter(CallSimulation.call_sid == "CA100").one()
+    assert simulation.status == "in-progress"
+    # the same CallSid stays on the same simulation
+    assert voice.simulation_for_call("CA100") == simulation.id
+    call.dial()
+    assert db.query(CallSimulation).count() == 1
+    db.close()
+
+
+def test_slow_reply_holds_then_polls_within_the_webhook_timeout(session_factory, serve):
+    service, voice = _voice(session_factory, SlowLLM(delay=0.5))
+    call = _call(serve(voice), "CA200")
+    call.dial()
+
+    heard = call.say("What is my balance?")
+
+    assert heard == [HOLD_PROMPT, "Your balance is forty dollars.", GATHER_PROMPT]
+    # every webhook answered well inside Twilio's 15 s, though the LLM took longer than one
+    assert max(call.response_times) < 0.4
+    assert len(call.response_times) >= 3
+
+
+def test_reply_that_never_comes_gets_an_apology(session_factory, serve):
+    service, voice = _voice(session_factory, SlowLLM(delay=1.5), max_polls=2)
+    call = _call(serve(voice), "CA300")
+    call.dial()
+    assert call.say("Hello?") == [HOLD_PROMPT, APOLOGY_PROMPT, GATHER_PROMPT]
+    voice.executor.shutdown(wait=True)
+
+
+def test_busy_llm_and_ended_calls(session_factory, serve):
+    service, voice = _voice(session_factory, SlowLLM())
+    service.admission = AdmissionController(max_concurrency=1, max_queue_depth=0)
+    call = _call(serve(voice), "CA400")
+    call.dial()
+    with service.admission.slot("standard"):
+        assert call.say("Hello?") == [BUSY_PROMPT, GATHER_PROMPT]
+
+    assert service.end_simulation(voice.simulation_for_call("CA400"))
+    call.say("Are you still there?")
+    assert call.hung_up
+    assert voice.start_reply("CA-unknown", "hi") is None
+
+
+def test_webhooks_must_be_signed_by_twilio(session_factory, serve):
+    service, voice = _voice(session_factory, SlowLLM())
+    client = serve(voice)
+    assert client.post("/api/voice/handle-call", data={"CallSid": "CA600"}).status_code == 403
+    with pytest.raises(httpx.HTTPStatusError, match="403"):
+        _call(client, "CA600", auth_token="not-the-auth-token").dial()
+    # signed for another host
+    with pytest.raises(httpx.HTTPStatusError, match="403"):
+        _call(client, "CA600", base_url="https://attacker.example.com").dial()
+    assert voice.simulation_for_call("CA600") is None
+    # the query string is part of what Twilio signs
+    form = {"CallSid": "CA600", "CallStatus": "completed"}
+    status_url = "/api/voice/status?campaign_call=999999"
+    signature = RequestValidator(AUTH_TOKEN).compute_signature(BASE_URL + status_url, form)
+    headers = {"X-Twilio-Signature": signature}
+    assert client.post(status_url, data=form, headers=headers).status_code == 404
+    assert client.post("/api/voice/status?campaign_call=1", data=form, headers=headers).status_code == 403
+
+    # and with no auth token configured nothing is accepted
+    voice.twilio_service.auth_token = None
+    with pytest.raises(httpx.HTTPStatusError, match="403"):
+        _call(client, "CA600").dial()
+
+
+def test_calls_can_be_answered_with_a_media_stream(session_factory):
+    service = SimulationService(SlowLLM(), session_factory=session_factory, idle_timeout=60)
+    assert not TwilioService(None, None, None, media_streams=True, public_base_url="").media_streams
+    twilio = TwilioService(None, None, None, media_streams=True, public_base_url="https://calls.example.com/")
+    voice = VoiceCallService(service, twilio, InProcessStateBackend())
+
+    response = voice.handle_call("CA500")
+    assert '<Stream url="wss://calls.example.com/ws/twilio/media">' in response
+    assert f'<Parameter name="simulation_id" value="{voice.simulation_for_call("CA500")}"' in response
+    assert GREETING in response
+
+
+def _stream_headers(auth_token=AUTH_TOKEN):
+    url = BASE_URL.replace("https://", "wss://") + "/ws/twilio/media"
+    return {"X-Twilio-Signature": RequestValidator(auth_token).compute_signature(url, {})}
+
+
+def _utterance(seed):
+    rng = np.random.default_rng(seed)
+    return np.concatenate([silence(0.5, rng, TELEPHONY_SAMPLE_RATE), speechlike(1.0, rng, TELEPHONY_SAMPLE_RATE),
+                           silence(1.0, rng, TELEPHONY_SAMPLE_RATE)])
+
+
+def test_media_stream_replies_are_spoken_back_to_the_caller(session_factory, serve, app_main, monkeypatch):
+    service, voice = _voice(session_factory, SlowLLM())
+    speech = SpeechStandIn("What is my balance?")
+    monkeypatch.setattr(app_main, "speech_service", speech)
+    monkeypatch.setattr(app_main, "simulation_service", service)
+    client = serve(voice)
+    simulation_id = voice.simulation_for_call("CA700", create=True)
+    messages = media_stream(_utterance(0), call_sid="CA700", parameters={"simulation_id": simulation_id})
+
+    with client.websocket_connect("/ws/twilio/media", headers=_stream_headers()) as ws:
+        for message in messages[:-1]:
+            ws.send_text(json.dumps(message))
+        sent = []
+        while not sent or sent[-1]["event"] != "mark":
+            sent.append(json.loads(ws.receive_text()))
+        ws.send_text(json.dumps(messages[-1]))
+
+    assert speech.spoken == ["Your balance is forty dollars."]
+    assert {message["streamSid"] for message in sent} == {"MZ0001"}
+    assert {message["event"] for message in sent[:-1]} == {"media"}
+    # half a second of speech, as 8 kHz mu-law in 20 ms frames
+    payloads = [base64.b64decode(message["media"]["payload"]) for message in sent[:-1]]
+    assert len(payloads) == 25 and sum(map(len, payloads)) == 4000
+    details = service.get_simulation_details(simulation_id)
+    assert [message["content"] for message in details["messages"]] == [
+        "What is my balance?", "Your balance is forty dollars."
+    ]
+
+
+def test_media_streams_must_come_from_twilio_for_their_own_call(session_factory, serve, app_main, monkeypatch):
+    service, voice = _voice(session_factory, SlowLLM())
+    monkeypatch.setattr(app_main, "speech_service", SpeechStandIn("Transfer all my money"))
+    monkeypatch.setattr(app_main, "simulation_service", service)
+    client = serve(voice)
+    victim = voice.simulation_for_call("CA800", create=True)
+
+    for headers in ({}, _stream_headers("not-the-auth-token")):
+        with pytest.raises(WebSocketDisconnect):
+            with client.websocket_connect("/ws/twilio/media", headers=headers):
+                pass
+
+    # A genuine stream for one call cannot write into another call's simulation
+    messages = media_stream(_utterance(1), call_sid="CA801", parameters={"simulation_id": victim})
+    with client.websocket_connect("/ws/twilio/media", headers=_stream_headers()) as ws:
+        with pytest.raises(WebSocketDisconnect):
+            for message in messages:
+                ws.send_text(json.dumps(message))
+            ws.receive_text()
+    assert service.get_simulation_details(victim)["messages"] == []
@@ -0,0 +1,117 @@
+import time
+from app.models.models import VoiceTurnMetric
+from app.services.simulation_service import SimulationService
+from app.services.streaming_tts import StreamingSynthesizer
+from app.services.voice_turn_service import APOLOGY_PROMPT, HOLD_PROMPT, REPEAT_PROMPT, VoiceTurnOrchestrator
+
+REPLY = ("Thanks for calling about your bill. I can see a late fee from March. "
+         "I have removed it as a one-time courtesy. Is there anything else I can help with today?")
+
+
+class StreamingLLM:
+    """Generates the reply a word at a time, after a think delay"""
+
+    def __init__(self, reply=REPLY, think=0.0, per_token=0.01):
+        self.reply = reply
+        self.think = think
+        self.per_token = per_token
+        self.finished_at = None
+
+    def get_response(self, message):
+        return self.reply
+
+    def stream_response(self, message):
+        time.sleep(self.think)
+        for word in self.reply.split(" "):
+            time.sleep(self.per_token)
+            yield word + " "
+        self.finished_at = time.perf_counter()
+
+
+class FakeSpeech:
+    def __init__(self, transcript="I was charged a late fee", stt_delay=0.0, per_char=0.001):
+        self.transcript = transcript
+        self.stt_delay = stt_delay
+        self.per_char = per_char
+
+    def speech_to_text(self, audio_data, call_id=None):
+        time.sleep(self.stt_delay)
+        return self.transcript
+
+    def text_to_speech(self, text, lang="en", voice="com", slow=False):
+        time.sleep(self.per_char * len(text))
+        return text.encode(), "audio/mpeg"
+
+
+def _orchestrator(session_factory, llm, speech, **deadlines):
+    service = SimulationService(llm, session_factory=session_factory, idle_timeout=60)
+    synthesizer = StreamingSynthesizer(speech, workers=2)
+    return service, VoiceTurnOrchestrator(service, speech, synthesizer, **deadlines)
+
+
+def test_first_audio_is_spoken_before_the_reply_is_finished(session_factory):
+    llm = StreamingLLM()
+    service, orchestrator = _orchestrator(session_factory, llm, FakeSpeech())
+    simulation_id = service.start_simulation()
+
+    turn = orchestrator.start_turn(simulation_id, b"audio")
+    chunks = turn.audio()
+    first = next(chunks)
+    first_at = time.perf_counter()
+    rest = list(chunks)
+
+    assert turn.transcript == "I was charged a late fee"
+    assert first == b"Thanks for calling about your bill."
+    assert b" ".join([first] + rest).decode() == REPLY
+    assert first_at < llm.finished_at
+
+    metrics = orchestrator.get_turn_metrics(simulation_id)
+    assert len(metrics["turns"]) == 1
+    recorded = metrics["turns"][0]
+    assert recorded["within_budget"] and recorded["missed_deadlines"] == []
+    assert recorded["stt_ms"] <= recorded["first_token_ms"] <= recorded["first_audio_ms"] <= recorded["total_ms"]
+    assert metrics["summary"]["first_audio_ms"]["p50"] == round(recorded["first_audio_ms"], 1)
+
+
+def test_slow_first_token_gets_a_hold_prompt(session_factory):
+    llm = StreamingLLM(reply="Let me check that for you right away.", think=0.3)
+    service, orchestrator = _orchestrator(session_factory, llm, FakeSpeech(), first_token_deadline_ms=100)
+    simulation_id = service.start_simulation()
+
+    chunks = list(orchestrator.start_turn(simulation_id, b"audio").audio())
+
+    assert chunks == [HOLD_PROMPT.encode(), b"Let me check that for you right away."]
+    db = session_factory()
+    metric = db.query(VoiceTurnMetric).one()
+    assert metric.missed_deadlines == ["first_token"]
+    assert not metric.within_budget
+    db.close()
+
+
+def test_budget_miss_falls_back_to_an_apology(session_factory):
+    llm = StreamingLLM(think=0.5)
+    service, orchestrator = _orchestrator(
+        session_factory, llm, FakeSpeech(), budget_ms=150, first_token_deadline_ms=1000
+    )
+    simulation_id = service.start_simulation()
+
+    started = time.perf_counter()
+    chunks = list(orchestrator.start_turn(simulation_id, b"audio").audio())
+
+    assert chunks == [APOLOGY_PROMPT.encode()]
+    assert time.perf_counter() - started < 0.5
+    assert orchestrator.get_turn_metrics(simulation_id)["turns"][0]["missed_deadlines"] == ["budget"]
+
+
+def test_slow_transcription_asks_the_caller_to_repeat(session_factory):
+    llm = StreamingLLM()
+    service, orchestrator = _orchestrator(
+        session_factory, llm, FakeSpeech(stt_delay=0.3), stt_deadline_ms=50
+    )
+    simulation_id = service.start_simulation()
+
+    turn = orchestrator.start_turn(simulation_id, b"audio")
+    assert turn.transcript == ""
+    assert list(turn.audio()) == [REPEAT_PROMPT.encode()]
+    assert llm.finished_at is None
+    assert orchestrator.start_turn("missing", transcript="hello") is None
@@ -0,0 +1,201 @@
+"""
+Local stand-ins for Twilio.
+
+For Media Streams: builds the JSON messages Twilio sends for a call's
+audio, saves and loads them as recorded frame streams (one message per
+line), and replays them into a WebSocket or any callable that takes a
+message string.
+
+For voice webhooks: plays Twilio's side of a <Gather> call, posting signed
+requests to the webhooks and following the TwiML they return.
+
+For the REST API: an httpx transport that creates calls, fails some
+requests on purpose and ends each call after a while with a status
+callback.
+"""
+import asyncio
+import base64
+import json
+import re
+import time
+import xml.etree.ElementTree as ET
+from pathlib import Path
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import parse_qs
+import httpx
+import numpy as np
+from twilio.request_validator import RequestValidator
+from app.services.audio_processing import mulaw_encode
+from app.services.twilio_media import FRAME_BYTES
+
+
+def media_stream(samples: np.ndarray, stream_sid: str = "MZ0001", call_sid: str = "CA0001",
+                 parameters: Optional[Dict[str, str]] = None, track: str = "inbound") -> List[Dict]:
+    """The messages Twilio would send for 8 kHz audio, from connected to stop"""
+    payload = mulaw_encode(samples)
+    messages = [
+        {"event": "connected", "protocol": "Call", "version": "1.0.0"},
+        {"event": "start", "sequenceNumber": "1", "streamSid": stream_sid, "start": {
+            "streamSid": stream_sid, "callSid": call_sid, "tracks": [track],
+            "customParameters": parameters or {},
+            "mediaFormat": {"encoding": "audio/x-mulaw", "sampleRate": 8000, "channels": 1}
+        }}
+    ]
+    for chunk, offset in enumerate(range(0, len(payload), FRAME_BYTES), start=1):
+        messages.append({"event": "media", "sequenceNumber": str(chunk + 1), "streamSid": stream_sid, "media": {
+            "track": track, "chunk": str(chunk), "timestamp": str(offset // 8),
+            "payload": base64.b64encode(payload[offset:offset + FRAME_BYTES]).decode()
+        }})
+    messages.append({"event": "stop", "sequenceNumber": str(len(messages)), "streamSid": stream_sid,
+                     "stop": {"callSid": call_sid}})
+    return messages
+
+
+def save_stream(messages: List[Dict], path: Path) -> None:
+    Path(path).write_text("".join(json.dumps(message) + "\n" for message in messages))
+
+
+def load_stream(path: Path) -> List[Dict]:
+    return [json.loads(line) for line in Path(path).read_text().splitlines() if line.strip()]
+
+
+class TwilioStandIn:
+    """Replays a recorded frame stream, optionally at the real 20 ms frame pace"""
+
+    def __init__(self, send: Callable[[str], None], realtime: bool = False):
+        self.send = send
+        self.realtime = realtime
+
+    def replay(self, messages: List[Dict]) -> None:
+        started = time.monotonic()
+        for message in messages:
+            if self.realtime and message["event"] == "media":
+                due = started + int(message["media"]["timestamp"]) / 1000
+                time.sleep(max(0.0, due - time.monotonic()))
+            self.send(json.dumps(message))
+
+
+class TwilioVoiceStandIn:
+    """
+    Follows TwiML like Twilio does for one call.
+
+    post(url, data=form, headers=headers) sends a webhook request, e.g.
+    TestClient(app).post; requests are signed with auth_token for
+    base_url + url, as Twilio signs them. Spoken <Say> text is collected in
+    heard, each webhook's response time in response_times; the call ends
+    at a <Hangup> or when the caller speaks to a <Gather>.
+    """
+
+    def __init__(self, post: Callable[..., httpx.Response], auth_token: str, base_url: str,
+                 call_sid: str = "CA0001", max_redirects: int = 20):
+        self.post = post
+        self.validator = RequestValidator(auth_token)
+        self.base_url = base_url
+        self.call_sid = call_sid
+        self.max_redirects = max_redirects
+        self.heard: List[str] = []
+        self.response_times: List[float] = []
+        self.gather_action: Optional[str] = None
+        self.hung_up = False
+
+    def _request(self, url: str, **form: str) -> None:
+        for _ in range(self.max_redirects):
+            form = {"CallSid": self.call_sid, **form}
+            signature = self.validator.compute_signature(self.base_url + url, form)
+            started = time.perf_counter()
+            response = self.post(url, data=form, headers={"X-Twilio-Signature": signature})
+            self.response_times.append(time.perf_counter() - started)
+            response.raise_for_status()
+            url = self._follow(ET.fromstring(response.text))
+            if url is None:
+                return
+            form = {}
+        raise AssertionError(f"More than {self.max_redirects} redirects")
+
+    def _follow(self, response: ET.Element) -> Optional[str]:
+        """Run the verbs; returns the URL of a <Redirect>, if one is reached"""
+        self.gather_action = None
+        for verb in response:
+            if verb.tag == "Say":
+                self.heard.append(verb.text)
+            elif verb.tag == "Gather":
+                self.heard += [say.text for say in verb if say.tag == "Say"]
+                self.gather_action = verb.get("action")
+                return None
+            elif verb.tag == "Redirect":
+                return verb.text
+            elif verb.tag == "Hangup":
+                self.hung_up = True
+                return None
+        return None
+
+    def dial(self) -> None:
+        self._request("/api/voice/handle-call", From="+15550100", To="+15550199")
+
+    def say(self, speech: str) -> List[str]:
+        """Speak to the current <Gather>; returns what the caller hears back"""
+        assert self.gather_action, "The call is not waiting for speech"
+        heard = len(self.heard)
+        self._request(self.gather_action, SpeechResult=speech)
+        return self.heard[heard:]
+
+
+class TwilioRESTStandIn(httpx.AsyncBaseTransport):
+    """
+    Twilio's Calls API for an httpx.AsyncClient(transport=...).
+
+    The first fail_first requests get fail_status, numbers in
+    invalid_numbers get a 400, and every created call ends call_seconds
+    later with a "completed" status callback, sent as
+    status_callback(url, form) to the call's StatusCallback URL, followed
+    by any late_statuses (Twilio does not guarantee callback order). Accepted
+    requests are kept in created (monotonic time, form); live and max_live
+    count calls in progress.
+    """
+
+    CALLS_PATH = re.compile(r"^/2010-04-01/Accounts/[^/]+/Calls\.json$")
+
+    def __init__(self, status_callback: Callable[[str, Dict[str, str]], None], call_seconds: float = 0.05,
+                 fail_first: int = 0, fail_status: int = 503, invalid_numbers: Iterable[str] = (),
+                 late_statuses: Iterable[str] = ()):
+        self.status_callback = status_callback
+        self.call_seconds = call_seconds
+        self.fail_first = fail_first
+        self.fail_status = fail_status
+        self.invalid_numbers = set(invalid_numbers)
+        self.late_statuses = list(late_statuses)
+        self.requests = 0
+        self.created: List[tuple] = []
+        self.live = 0
+        self.max_live = 0
+        self._calls = set()
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        if request.method != "POST" or not self.CALLS_PATH.match(request.url.path):
+            return httpx.Response(404, json={"code": 20404, "message": "Not found"})
+        self.requests += 1
+        if self.requests <= self.fail_first:
+            return httpx.Response(self.fail_status, json={"code": 20429, "message": "Too many requests"})
+        form = {key: values[0] if len(values) == 1 else values
+                for key, values in parse_qs((await request.aread()).decode()).items()}
+        if form["To"] in self.invalid_numbers:
+            return httpx.Response(400, json={"code": 21211, "message": f"Invalid 'To' Phone Number: {form['To']}"})
+
+        call_sid = f"CA{len(self.created) + 1:032x}"
+        self.created.append((time.monotonic(), form))
+        self.live += 1
+        self.max_live = max(self.max_live, self.live)
+        task = asyncio.create_task(self._end_call(call_sid, form))
+        self._calls.add(task)
+        task.add_done_callback(self._calls.discard)
+        return httpx.Response(201, json={"sid": call_sid, "status": "queued", "to": form["To"]})
+
+    async def _end_call(self, call_sid: str, form: Dict) -> None:
+        await asyncio.sleep(self.call_seconds)
+        self.live -= 1
+        self.status_callback(form["StatusCallback"], {
+            "CallSid": call_sid, "CallStatus": "completed", "To": form["To"],
+            "CallDuration": str(max(1, round(self.call_seconds)))
+        })
+        for status in self.late_statuses:
+            self.status_callback(form["StatusCallback"], {"CallSid": call_sid, "CallStatus": status, "To": form["To"]})